@@ -103,7 +103,8 @@ def db_make(ns):
 
     timer = common.Timer("db-make", output = _logger)
     timer.start()
-    log_db.process_files(conf, targets, True, lid_header = ns.lid_header)
+    log_db.process_files(conf, targets, True, lid_header = ns.lid_header,
+                         bulk = ns.bulk, pal = ns.pal)
     timer.stop()
 
 
@@ -116,7 +117,8 @@ def db_make_init(ns):
 
     timer = common.Timer("db-make-init", output = _logger)
     timer.start()
-    log_db.process_init_data(conf, targets, lid_header = ns.lid_header)
+    log_db.process_init_data(conf, targets, lid_header = ns.lid_header,
+                             bulk = ns.bulk, pal = ns.pal)
     timer.stop()
 
 
@@ -129,7 +131,62 @@ def db_add(ns):
 
     timer = common.Timer("db-add", output = _logger)
     timer.start()
-    log_db.process_files(conf, targets, False, lid_header = ns.lid_header)
+    log_db.process_files(conf, targets, False, lid_header = ns.lid_header,
+                         pal = ns.pal)
+    timer.stop()
+
+
+def db_resume(ns):
+    conf = config.open_config(ns.conf_path)
+    lv = logging.DEBUG if ns.debug else logging.INFO
+    config.set_common_logging(conf, logger = _logger, lv = lv)
+    from . import log_db
+
+    timer = common.Timer("db-resume", output = _logger)
+    timer.start()
+    log_db.resume_files(conf, pal = ns.pal)
+    timer.stop()
+
+
+def db_follow(ns):
+    conf = config.open_config(ns.conf_path)
+    lv = logging.DEBUG if ns.debug else logging.INFO
+    config.set_common_logging(conf, logger = _logger, lv = lv)
+    from . import log_db
+
+    log_db.follow_files(conf, ns.files, from_start = ns.from_start)
+
+
+def syslog_recv(ns):
+    conf = config.open_config(ns.conf_path)
+    lv = logging.DEBUG if ns.debug else logging.INFO
+    config.set_common_logging(conf, logger = _logger, lv = lv)
+    from . import syslog_recv
+
+    syslog_recv.receive_syslog(conf)
+
+
+def lt_daemon(ns):
+    conf = config.open_config(ns.conf_path)
+    lv = logging.DEBUG if ns.debug else logging.INFO
+    config.set_common_logging(conf, logger = _logger, lv = lv)
+    from . import lt_daemon
+
+    learn = True if ns.learn else None
+    lt_daemon.LTDaemon(conf, learn = learn,
+                       socket_path = ns.socket_path).run()
+
+
+def lt_classify(ns):
+    conf = config.open_config(ns.conf_path)
+    lv = logging.DEBUG if ns.debug else logging.INFO
+    config.set_common_logging(conf, logger = _logger, lv = lv)
+    targets = get_targets(ns, conf)
+    from . import log_db
+
+    timer = common.Timer("lt-classify", output = _logger)
+    timer.start()
+    log_db.classify_files(conf, targets, output = ns.output, pal = ns.pal)
     timer.stop()
 
 
@@ -159,6 +216,42 @@ def db_anonymize(ns):
     timer.stop()
 
 
+def db_convert(ns):
+    conf = config.open_config(ns.conf_path)
+    lv = logging.DEBUG if ns.debug else logging.INFO
+    config.set_common_logging(conf, logger = _logger, lv = lv)
+    from . import log_db
+
+    timer = common.Timer("db-convert", output = _logger)
+    timer.start()
+    log_db.convert_db(conf, words_format = ns.words_format,
+                      words_compress = ns.compress, dt_format = ns.dt_format,
+                      host_format = ns.host_format,
+                      words_store = ns.words_store)
+    timer.stop()
+
+
+def db_remake_count(ns):
+    conf = config.open_config(ns.conf_path)
+    lv = logging.DEBUG if ns.debug else logging.INFO
+    config.set_common_logging(conf, logger = _logger, lv = lv)
+    from . import log_db
+
+    timer = common.Timer("db-remake-count", output = _logger)
+    timer.start()
+    log_db.remake_count(conf, count_bucket = ns.count_bucket)
+    timer.stop()
+
+
+def db_meta_verify(ns):
+    conf = config.open_config(ns.conf_path)
+    lv = logging.DEBUG if ns.debug else logging.INFO
+    config.set_common_logging(conf, logger = _logger, lv = lv)
+    from . import log_db
+
+    log_db.verify_stats(conf, rebuild = ns.rebuild)
+
+
 def reload_area(ns):
     conf = config.open_config(ns.conf_path)
     lv = logging.DEBUG if ns.debug else logging.INFO
@@ -173,7 +266,12 @@ def show_db_info(ns):
     config.set_common_logging(conf, logger = _logger, lv = lv)
     from . import log_db
 
-    log_db.info(conf)
+    if ns.dt_range is None:
+        log_db.info(conf)
+    else:
+        top_dt, end_dt = [datetime.datetime.strptime(dtstr, "%Y-%m-%d")
+                          for dtstr in ns.dt_range]
+        log_db.info_term(conf, top_dt, end_dt)
 
 
 def show_lt(ns):
@@ -714,6 +812,16 @@ OPT_TERM = [["-t", "--term"],
 OPT_LID = [["-l", "--lid"],
              {"dest": "lid_header", "action": "store_true",
               "help": "parse lid from head part of log message"}]
+OPT_PARSE_PAL = [["-p", "--pal"],
+                 {"dest": "pal", "metavar": "PAL", "action": "store",
+                  "type": int, "default": 1,
+                  "help": ("number of processes to parse messages "
+                           "(template generation and DB writing "
+                           "are in 1 process)")}]
+OPT_BULK = [["-b", "--bulk"],
+            {"dest": "bulk", "action": "store_true", "default": None,
+             "help": ("use bulk load mode: build DB index at the end "
+                      "(defaultly follow database.bulk_load in config)")}]
 ARG_FILE = [["file"],
              {"metavar": "PATH", "action": "store",
               "help": "filepath to output"}]
@@ -789,18 +897,66 @@ DICT_ARGSET = {
                      data_from_data],
     "db-make": [("Initialize database and add log data. "
                  "This fuction works incrementaly."),
-                [OPT_CONFIG, OPT_DEBUG, OPT_RECUR, OPT_LID, ARG_FILES_OPT],
+                [OPT_CONFIG, OPT_DEBUG, OPT_RECUR, OPT_LID, OPT_BULK,
+                 OPT_PARSE_PAL, ARG_FILES_OPT],
                 db_make],
     "db-make-init": [("Initialize database and add log data "
                       "for given dataset. "
                       "This function does not consider "
                       "to add other data afterwards."),
-                     [OPT_CONFIG, OPT_DEBUG, OPT_RECUR, OPT_LID,
-                      ARG_FILES_OPT],
+                     [OPT_CONFIG, OPT_DEBUG, OPT_RECUR, OPT_LID, OPT_BULK,
+                      OPT_PARSE_PAL, ARG_FILES_OPT],
                      db_make_init],
     "db-add": ["Add log data to existing database.",
-               [OPT_CONFIG, OPT_DEBUG, OPT_RECUR, OPT_LID, ARG_FILES],
+               [OPT_CONFIG, OPT_DEBUG, OPT_RECUR, OPT_LID, OPT_PARSE_PAL,
+                ARG_FILES],
                db_add],
+    "db-resume": [("Continue db-make or db-add stopped after "
+                   "periodic commits (see database.commit_interval_lines) "
+                   "from the last checkpoint."),
+                  [OPT_CONFIG, OPT_DEBUG, OPT_PARSE_PAL],
+                  db_resume],
+    "db-follow": [("Add log messages appended to files continuously "
+                   "(like tail -F), until interrupted."),
+                  [OPT_CONFIG, OPT_DEBUG,
+                   [["-s", "--from-start"],
+                    {"dest": "from_start", "action": "store_true",
+                     "help": "add existing messages in the files first"}],
+                   ARG_FILES],
+                  db_follow],
+    "syslog-recv": [("Receive syslog messages (UDP and TCP) and add them "
+                     "to database continuously, until interrupted. "
+                     "See section syslog_recv in config."),
+                    [OPT_CONFIG, OPT_DEBUG],
+                    syslog_recv],
+    "lt-daemon": [("Classify log messages with templates in database, "
+                   "answering requests over a Unix domain socket "
+                   "(see amulog.lt_daemon), until interrupted."),
+                  [OPT_CONFIG, OPT_DEBUG,
+                   [["-s", "--socket"],
+                    {"dest": "socket_path", "metavar": "PATH",
+                     "action": "store", "default": None,
+                     "help": ("socket path "
+                              "(defaultly lt_daemon.socket_path in config)")}],
+                   [["--learn"],
+                    {"dest": "learn", "action": "store_true",
+                     "help": ("learning mode: generate and commit "
+                              "new templates (defaultly read-only)")}]],
+                  lt_daemon],
+    "lt-classify": [("Output ltid of each log message in files, "
+                     "matched to existing templates in database "
+                     "(\"-\" if not matched). Database is not changed."),
+                    [OPT_CONFIG, OPT_DEBUG, OPT_RECUR,
+                     [["-o", "--output"],
+                      {"dest": "output", "metavar": "FILENAME",
+                       "action": "store", "default": None,
+                       "help": "output filename (defaultly stdout)"}],
+                     [["-p", "--pal"],
+                      {"dest": "pal", "metavar": "PAL", "action": "store",
+                       "type": int, "default": 1,
+                       "help": "number of processes to classify messages"}],
+                     ARG_FILES],
+                    lt_classify],
     "db-update": [("Add newer log data (seeing timestamp range) "
                    "to existing database."),
                   [OPT_CONFIG, OPT_DEBUG, OPT_RECUR, OPT_LID, ARG_FILES],
@@ -809,6 +965,57 @@ DICT_ARGSET = {
                       "(Not anonymize hostnames; to be added)"),
                      [OPT_CONFIG, OPT_DEBUG],
                      db_anonymize],
+    "db-convert": [("Convert storage format of log messages "
+                    "in existing database."),
+                   [OPT_CONFIG, OPT_DEBUG,
+                    [["--words"],
+                     {"dest": "words_format", "metavar": "FORMAT",
+                      "action": "store", "default": None,
+                      "choices": ["text", "binary"],
+                      "help": "format of words (text or binary)"}],
+                    [["--store"],
+                     {"dest": "words_store", "metavar": "STORE",
+                      "action": "store", "default": None,
+                      "choices": ["full", "variable"],
+                      "help": "words to store (full or variable)"}],
+                    [["-z", "--compress"],
+                     {"dest": "compress", "action": "store_true",
+                      "default": None,
+                      "help": "compress words with zlib in binary format"}],
+                    [["--no-compress"],
+                     {"dest": "compress", "action": "store_false",
+                      "default": None,
+                      "help": "do not compress words"}],
+                    [["--dt"],
+                     {"dest": "dt_format", "metavar": "FORMAT",
+                      "action": "store", "default": None,
+                      "choices": ["text", "epoch", "epoch_us"],
+                      "help": "format of timestamps (text, epoch or epoch_us)"}],
+                    [["--host"],
+                     {"dest": "host_format", "metavar": "FORMAT",
+                      "action": "store", "default": None,
+                      "choices": ["text", "id"],
+                      "help": "format of hostnames (text or id)"}]],
+                   db_convert],
+    "db-remake-count": [("Rebuild the summary table of message counts "
+                         "for each template, host and time bucket."),
+                        [OPT_CONFIG, OPT_DEBUG,
+                         [["--bucket"],
+                          {"dest": "count_bucket", "metavar": "BUCKET",
+                           "action": "store", "default": None,
+                           "choices": ["minute", "hour", "day", "none"],
+                           "help": ("time bucket size (minute, hour or day), "
+                                    "or none to remove the table "
+                                    "(defaultly keep current setting)")}]],
+                        db_remake_count],
+    "db-meta-verify": [("Compare cached statistics of DB "
+                        "(number of messages, term and templates) "
+                        "with actual values."),
+                       [OPT_CONFIG, OPT_DEBUG,
+                        [["-r", "--rebuild"],
+                         {"dest": "rebuild", "action": "store_true",
+                          "help": "overwrite the cache with actual values"}]],
+                       db_meta_verify],
     "db-reload-area": ["Reload area definition file from config.",
                        [OPT_CONFIG, OPT_DEBUG],
                        reload_area],
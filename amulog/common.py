@@ -3,6 +3,7 @@
 
 import os
 import time
+import bisect
 import datetime
 import logging
 import subprocess  # for python3
@@ -68,6 +69,87 @@ class IDDict():
         return self._d_obj[keyid]
 
 
+class IDAllocator():
+    """Allocate smallest unused non-negative integer ids.
+
+    Ids are given with a monotonic counter, and removed or skipped ids
+    under the counter are kept as sorted ranges to be reused,
+    so that add of a distant id does not enumerate the skipped ids.
+    """
+
+    def __init__(self):
+        self._counter = 0 # all ids >= counter are unused
+        self._l_start = [] # sorted start of free ranges under counter
+        self._d_end = {} # key : start, val : end (exclusive) of free range
+
+    def _find(self, keyid):
+        # index of the free range including keyid, or None
+        i = bisect.bisect_right(self._l_start, keyid) - 1
+        if i >= 0 and keyid < self._d_end[self._l_start[i]]:
+            return i
+        else:
+            return None
+
+    def _add_range(self, start, end):
+        # mark ids in [start, end) as free, merging adjacent ranges
+        i = bisect.bisect_left(self._l_start, start)
+        if i < len(self._l_start) and self._l_start[i] == end:
+            end = self._d_end.pop(self._l_start.pop(i))
+        if i > 0 and self._d_end[self._l_start[i - 1]] == start:
+            self._d_end[self._l_start[i - 1]] = end
+        else:
+            self._l_start.insert(i, start)
+            self._d_end[start] = end
+
+    def __contains__(self, keyid):
+        return 0 <= keyid < self._counter and self._find(keyid) is None
+
+    def next(self):
+        """int: The smallest unused id. It is not reserved until add."""
+        if len(self._l_start) > 0:
+            return self._l_start[0]
+        else:
+            return self._counter
+
+    def add(self, keyid):
+        """Mark the id as used."""
+        if keyid >= self._counter:
+            if keyid > self._counter:
+                self._add_range(self._counter, keyid)
+            self._counter = keyid + 1
+        else:
+            i = self._find(keyid)
+            if i is None:
+                return
+            start = self._l_start.pop(i)
+            end = self._d_end.pop(start)
+            if keyid + 1 < end:
+                self._l_start.insert(i, keyid + 1)
+                self._d_end[keyid + 1] = end
+            if start < keyid:
+                self._l_start.insert(i, start)
+                self._d_end[start] = keyid
+
+    def remove(self, keyid):
+        """Mark the id as unused, to be reused."""
+        if keyid in self:
+            self._add_range(keyid, keyid + 1)
+
+    def load(self, obj):
+        self._counter, l_free = obj
+        self._l_start = []
+        self._d_end = {}
+        for r in sorted(l_free):
+            if isinstance(r, int):
+                # former dump with a list of free ids
+                r = (r, r + 1)
+            self._add_range(*r)
+
+    def dumpobj(self):
+        return (self._counter,
+                [(start, self._d_end[start]) for start in self._l_start])
+
+
 # file managing
 
 def is_empty(dirname):
@@ -17,6 +17,10 @@ class database(object):
     # l_repl : values with given keys are replaced in sql_query
     #          to generate sql with subquery
 
+    # generated sql strings are memoized with the query shape
+    # (table, keys, conditions, options), cleared if exceeding this size
+    SQL_CACHE_SIZE = 1024
+
     def __init__(self, dbpath):
         raise NotImplementedError
 
@@ -28,6 +32,13 @@ class database(object):
 
     def commit(self):
         raise NotImplementedError
+
+    def rollback(self):
+        raise NotImplementedError
+
+    def set_bulk_mode(self, flag):
+        # tune DB for loading large amount of data, if available
+        pass
         
     def strftime(self, dt):
         if isinstance(dt, datetime.datetime):
@@ -45,6 +56,15 @@ class database(object):
 
     def _ph(self, varname):
         raise NotImplementedError
+
+    def _get_sql(self, key):
+        return self._sql_cache.get(key)
+
+    def _set_sql(self, key, sql):
+        if len(self._sql_cache) >= self.SQL_CACHE_SIZE:
+            self._sql_cache.clear()
+        self._sql_cache[key] = sql
+        return sql
         
     def _set_state(self, l_setstate):
         if len(l_setstate) == 0:
@@ -65,7 +85,7 @@ class database(object):
         return " and ".join(l_buf)
 
     def _table_key_type(self, type_str):
-        # allowed typename : integer, text, datetime
+        # allowed typename : integer, bigint, text, datetime, blob
         raise NotImplementedError
 
     def _table_key_attr(self, attr):
@@ -101,6 +121,11 @@ class database(object):
 
     def select_sql(self, table_name, l_key, l_cond = [], opt = []):
         # now only "distinct" is allowed for opt
+        cache_key = ("select", table_name, tuple(l_key), tuple(l_cond),
+                     tuple(opt))
+        sql = self._get_sql(cache_key)
+        if sql is not None:
+            return sql
         sql_header = "select"
         if "distinct" in opt:
             sql_header += " distinct"
@@ -108,42 +133,97 @@ class database(object):
                 table_name)
         if len(l_cond) > 0:
             sql += " where {0}".format(self._cond_state(l_cond))
-        return sql 
+        return self._set_sql(cache_key, sql)
 
     def insert_sql(self, table_name, l_setstate):
+        cache_key = ("insert", table_name, tuple(l_setstate))
+        sql = self._get_sql(cache_key)
+        if sql is not None:
+            return sql
         l_key, l_val = zip(*[(ss.key, self._ph(ss.val)) for ss in l_setstate])
         sql = "insert into {0} ({1}) values ({2})".format(table_name,
                 ", ".join(l_key), ", ".join(l_val))
-        return sql
+        return self._set_sql(cache_key, sql)
 
     def update_sql(self, table_name, l_setstate, l_cond = []):
+        cache_key = ("update", table_name, tuple(l_setstate), tuple(l_cond))
+        sql = self._get_sql(cache_key)
+        if sql is not None:
+            return sql
         sql = "update {0} set {1}".format(table_name,
                 self._set_state(l_setstate))
         if len(l_cond) > 0:
             sql += " where {0}".format(self._cond_state(l_cond))
-        return sql 
+        return self._set_sql(cache_key, sql)
+
+    def increment_sql(self, table_name, key, varname, l_cond = []):
+        # add a given value to the current value of key
+        cache_key = ("increment", table_name, key, varname, tuple(l_cond))
+        sql = self._get_sql(cache_key)
+        if sql is not None:
+            return sql
+        sql = "update {0} set {1} = {1} + {2}".format(table_name, key,
+                self._ph(varname))
+        if len(l_cond) > 0:
+            sql += " where {0}".format(self._cond_state(l_cond))
+        return self._set_sql(cache_key, sql)
 
     def delete_sql(self, table_name, l_cond = []):
+        cache_key = ("delete", table_name, tuple(l_cond))
+        sql = self._get_sql(cache_key)
+        if sql is not None:
+            return sql
         sql = "delete from {0}".format(table_name)
         if len(l_cond) > 0:
             sql += " where {0}".format(self._cond_state(l_cond))
-        return sql
+        return self._set_sql(cache_key, sql)
 
     def drop_sql(self, table_name):
         return "drop table {0}".format(table_name)
 
+    def drop_index_sql(self, table_name, index_name):
+        return "drop index {0}".format(index_name)
+
+    def rename_table_sql(self, table_name, new_name):
+        return "alter table {0} rename to {1}".format(table_name, new_name)
+
+    def vacuum(self):
+        # release unused space after large deletion, if available
+        pass
+
     def execute(self, sql, args):
         raise NotImplementedError
 
+    def executemany(self, sql, l_args):
+        raise NotImplementedError
+
     def get_table_names(self):
         raise NotImplementedError
 
 
 class sqlite3(database):
 
+    # same as the default values of sqlite
+    PRAGMA_NORMAL = (("journal_mode", "delete"),
+                     ("synchronous", "full"),
+                     ("cache_size", "-2000"),
+                     ("mmap_size", "0"),
+                     ("temp_store", "default"))
+    PRAGMA_BULK = (("journal_mode", "memory"),
+                   ("synchronous", "off"),
+                   ("cache_size", "-262144"),
+                   ("mmap_size", "268435456"),
+                   ("temp_store", "memory"))
+
+    # size of prepared statement cache per connection (default 128)
+    CACHED_STATEMENTS = 512
+
     def __init__(self, dbpath):
         self.dbpath = dbpath
         self.connect = None
+        self._cursor = None
+        self._bulk = False
+        self._sql_cache = {}
 
     def __del__(self):
         if self.connect is not None:
@@ -152,8 +232,19 @@ class sqlite3(database):
     
     def _open(self):
         import sqlite3 as sqlite3_mod
-        self.connect = sqlite3_mod.connect(self.dbpath)
+        self.connect = sqlite3_mod.connect(
+            self.dbpath, cached_statements = self.CACHED_STATEMENTS)
         self.connect.text_factory = str
+        # reused for executemany (results of execute are iterated
+        # by callers, so they use new cursors)
+        self._cursor = self.connect.cursor()
+        if self._bulk:
+            self._set_pragma(self.PRAGMA_BULK)
+
+    def _set_pragma(self, l_pragma):
+        cursor = self.connect.cursor()
+        for key, val in l_pragma:
+            cursor.execute("pragma {0} = {1}".format(key, val))
     
     def db_exists(self):
         if os.path.exists(self.dbpath):
@@ -169,6 +260,25 @@ class sqlite3(database):
         if self.connect is not None:
             self.connect.commit()
 
+    def rollback(self):
+        if self.connect is not None:
+            self.connect.rollback()
+
+    def set_bulk_mode(self, flag):
+        self._bulk = flag
+        if self.connect is not None:
+            # journal_mode can not be changed in a transaction
+            self.connect.commit()
+            if flag:
+                self._set_pragma(self.PRAGMA_BULK)
+            else:
+                self._set_pragma(self.PRAGMA_NORMAL)
+
+    def vacuum(self):
+        # vacuum can not be executed in a transaction
+        self.commit()
+        self.execute("vacuum")
+
     def datetime(self, ret):
         return self.strptime(ret)
 
@@ -178,6 +288,9 @@ class sqlite3(database):
     def _table_key_type(self, type_str):
         if type_str == "datetime":
             return "text"
+        elif type_str == "bigint":
+            # integer of sqlite is 64bit
+            return "integer"
         else:
             return type_str
 
@@ -206,6 +319,12 @@ class sqlite3(database):
             cursor.execute(sql, args)
         return cursor
 
+    def executemany(self, sql, l_args):
+        if self.connect is None:
+            self._open()
+        self._cursor.executemany(sql, l_args)
+        return self._cursor
+
     def get_table_names(self):
         sql = "select name from sqlite_master"
         cursor = self.execute(sql)
@@ -222,6 +341,8 @@ class mysql(database):
         self.user = user
         self.passwd = passwd
         self.connect = None
+        self._cursor = None
+        self._sql_cache = {}
 
     def __del__(self):
         if self.connect is not None:
@@ -233,6 +354,7 @@ class mysql(database):
             self._init_database()
         self.connect = MySQLdb.connect(host = self.host, db = self.dbname,
                                        user = self.user, passwd = self.passwd)
+        self._cursor = self.connect.cursor()
 
     def _init_database(self):
         connect = self._connect_root()
@@ -260,6 +382,10 @@ class mysql(database):
         if self.connect is not None:
             self.connect.commit()
 
+    def rollback(self):
+        if self.connect is not None:
+            self.connect.rollback()
+
     def datetime(self, ret):
         return ret
 
@@ -283,6 +409,9 @@ class mysql(database):
         else:
             raise NotImplementedError
     
+    def drop_index_sql(self, table_name, index_name):
+        return "drop index {0} on {1}".format(index_name, table_name)
+
     def _index_key(self, tablekey):
         if tablekey.type == "text":
             return "{0}({1})".format(tablekey.key, tablekey.attr[0])
@@ -301,6 +430,14 @@ class mysql(database):
             cursor.execute(sql, args)
         return cursor
 
+    def executemany(self, sql, l_args):
+        # MySQLdb has no server-side prepared statements,
+        # but executemany of insert is rewritten into 1 multi-row query
+        if self.connect is None:
+            self._open()
+        self._cursor.executemany(sql, l_args)
+        return self._cursor
+
     def get_table_names(self):
         sql = "show tables"
         cursor = self.execute(sql)
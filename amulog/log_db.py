@@ -8,6 +8,10 @@ and grouping definitions.
 
 import sys
 import os
+import time
+import json
+import pickle
+import tempfile
 import datetime
 import sqlite3
 import logging
@@ -24,6 +28,10 @@ from . import lt_common
 from . import host_alias
 
 _logger = logging.getLogger(__package__)
+EPOCH = datetime.datetime(1970, 1, 1)
+COUNT_BUCKETS = {"minute" : 60, "hour" : 3600, "day" : 86400}
+# statistics of DB cached in metadata table (with prefix "stat_")
+STAT_KEYS = ("max_lid", "top_dt", "end_dt", "count_lt", "count_ltg")
 
 
 class LogMessage():
@@ -246,9 +254,40 @@ class LogData():
             ret.add((host, self.ltgid_from_ltid(ltid))) 
         return list(set(ret))
 
-    def whole_host(self, top_dt = None, end_dt = None):
+    def whole_host(self, top_dt = None, end_dt = None, area = None):
         """List[str]: Sequence of all source hostname in DB."""
-        return self.db.whole_host(top_dt = top_dt, end_dt = end_dt)
+        return self.db.whole_host(top_dt = top_dt, end_dt = end_dt,
+                                  area = area)
+
+    def count_host_lt(self, top_dt = None, end_dt = None, area = None):
+        """Dict[Tuple[str, int], int]: Number of messages for each
+        combination of hostname and ltid.
+        The count table is used if available for the term."""
+        return self.db.count_host_lt(top_dt = top_dt, end_dt = end_dt,
+                                     area = area)
+
+    def event_matrix(self, top_dt, end_dt, bin_size, area = None,
+                     gid_name = "ltid", sparse = False):
+        """Count messages of each event in time bins.
+        An event is a combination of hostname and ltid (or ltgid).
+
+        Args:
+            top_dt (datetime.datetime): Start of the term.
+            end_dt (datetime.datetime): End of the term (not included).
+            bin_size (datetime.timedelta): Size of time bins
+                (in seconds, from top_dt).
+            area (Optional[str]): Area name, or "host_" + hostname.
+            gid_name (Optional[str]): ltid or ltgid.
+            sparse (Optional[bool]): If True, returns a scipy.sparse
+                CSR matrix (requires scipy).
+
+        Returns:
+            matrix, List[Tuple[str, int]]: Count matrix
+                (rows: events, columns: time bins), and events of rows.
+        """
+        bin_sec = int(bin_size.total_seconds())
+        return self.db.count_matrix(top_dt, end_dt, bin_sec, area = area,
+                                    gid_name = gid_name, sparse = sparse)
 
     def count_lt(self):
         """int: Number of all log templates."""
@@ -416,6 +455,8 @@ class LogData():
     def commit_db(self):
         """Commit requested changes in LogDB.
         """
+        if self.ltm is not None:
+            self.ltm.flush_count()
         self.db.commit()
         if self.ltm is not None:
             self.ltm.dump()
@@ -434,6 +475,53 @@ class LogDB():
         self._line_cnt = 0
         self.areafn = conf.get("database", "area_filename")
         self._splitter = conf.get("database", "split_symbol")
+        self._batch_size = conf.getint("database", "insert_batch_size")
+        self._buf_lines = [] # rows waiting for add_line batch insertion
+        # storage format of log table, overwritten with metadata in DB
+        self._words_format = conf.get("database", "words_format")
+        self._words_compress = conf.getboolean("database", "words_compress")
+        self._dt_format = conf.get("database", "dt_format")
+        self._host_format = conf.get("database", "host_format")
+        self._words_store = conf.get("database", "words_store")
+        self._count_bucket = conf.get("database", "count_bucket")
+        self._buf_count = defaultdict(int) # (ltid, host, bucket) -> count
+        # in bulk load, counts are kept on memory until commit
+        self._bulk_load = False
+        # cached statistics of DB, kept in metadata table (see STAT_KEYS)
+        # keys not in the dict are unknown (calculated on request)
+        self._stats = {}
+        self._stats_changed = False
+        self._stats_dirty = False # stat_dirty flag is set in DB
+        # max_lid, top_dt and end_dt of added lines not in _stats yet
+        self._buf_stats = None
+        self._d_hid = {} # host -> hid
+        self._d_hostname = {} # hid -> host
+        # template snapshots for words_store = variable
+        self._sym = conf.get("log_template", "variable_symbol")
+        self._sym_header = conf.get("log_template",
+                                    "labeled_variable_symbol_header")
+        self._sym_footer = conf.get("log_template",
+                                    "labeled_variable_symbol_footer")
+        self._d_rev = {} # rid -> (ltw, variable locations, description)
+        self._d_rev_key = {} # joined ltw -> rid
+        self._d_ltrid = {} # ltid -> rid of current template
+        if not self._words_format in ("text", "binary"):
+            raise ValueError("invalid words_format ({0})".format(
+                    self._words_format))
+        if not self._dt_format in ("text", "epoch", "epoch_us"):
+            raise ValueError("invalid dt_format ({0})".format(
+                    self._dt_format))
+        if not self._host_format in ("text", "id"):
+            raise ValueError("invalid host_format ({0})".format(
+                    self._host_format))
+        if not self._words_store in ("full", "variable"):
+            raise ValueError("invalid words_store ({0})".format(
+                    self._words_store))
+        if self._count_bucket == "":
+            self._count_bucket = None
+        elif not self._count_bucket in COUNT_BUCKETS:
+            raise ValueError("invalid count_bucket ({0})".format(
+                    self._count_bucket))
 
         db_type = conf.get("database", "database")
         if db_type == "sqlite3":
@@ -459,6 +547,8 @@ class LogDB():
                     self._init_tables()
                     self._init_area()
                 else:
+                    self._load_metadata()
+                    self._load_stats()
                     self._line_cnt = self.count_lines()
                     self._init_lttable()
             else:
@@ -469,20 +559,63 @@ class LogDB():
                 self._init_area()
         else: 
             if self.db.db_exists():
+                self._load_metadata()
+                self._load_stats()
                 self._line_cnt = self.count_lines()
                 self._init_lttable()
             else:
                 raise IOError("database not found")
 
-    def _init_tables(self):
-        table_name = "log"
-        l_key = [db_common.tablekey("lid", "integer",
+    def _log_table_keys(self):
+        if self._words_format == "binary":
+            words_type = "blob"
+        else:
+            words_type = "text"
+        return [db_common.tablekey("lid", "integer",
                     #("primary_key", "auto_increment", "not_null")),
                     ("primary_key", "not_null")),
-                 db_common.tablekey("ltid", "integer"),
-                 db_common.tablekey("dt", "datetime"),
-                 db_common.tablekey("host", "text"),
-                 db_common.tablekey("words", "text")]
+                db_common.tablekey("ltid", "integer"),
+                db_common.tablekey("dt", self._dt_type()),
+                self._host_tablekey(),
+                db_common.tablekey("words", words_type)] + \
+               self._log_table_rid_keys()
+
+    def _log_table_rid_keys(self):
+        if self._words_store == "variable":
+            return [db_common.tablekey("rid", "integer")]
+        else:
+            return []
+
+    def _log_keys(self):
+        # columns of log table, in the order of rows given by select
+        l_key = ["lid", "ltid", "dt", self._host_key(), "words"]
+        if self._words_store == "variable":
+            l_key.append("rid")
+        return l_key
+
+    def _host_tablekey(self, index = False):
+        if self._host_format == "id":
+            return db_common.tablekey("hid", "integer")
+        elif index:
+            return db_common.tablekey("host", "text", (100, ))
+        else:
+            return db_common.tablekey("host", "text")
+
+    def _host_key(self):
+        if self._host_format == "id":
+            return "hid"
+        else:
+            return "host"
+
+    def _dt_type(self):
+        if self._dt_format == "text":
+            return "datetime"
+        else:
+            return "bigint"
+
+    def _init_tables(self):
+        table_name = "log"
+        l_key = self._log_table_keys()
         sql = self.db.create_table_sql(table_name, l_key)
         self.db.execute(sql)
 
@@ -508,6 +641,15 @@ class LogDB():
         sql = self.db.create_table_sql(table_name, l_key)
         self.db.execute(sql)
 
+        self._init_metadata()
+        self._dump_metadata()
+        self._stats = {"max_lid" : 0, "top_dt" : None, "end_dt" : None,
+                       "count_lt" : 0, "count_ltg" : 0}
+        self._stats_changed = True
+        self._init_host_table()
+        self._init_ltrev_table()
+        self._init_count_table()
+
         self._init_index()
 
     def _init_index(self):
@@ -517,8 +659,8 @@ class LogDB():
         index_name = "log_index"
         l_key = [db_common.tablekey("lid", "integer"),
                  db_common.tablekey("ltid", "integer"),
-                 db_common.tablekey("dt", "datetime"),
-                 db_common.tablekey("host", "text", (100, ))]
+                 db_common.tablekey("dt", self._dt_type()),
+                 self._host_tablekey(index = True)]
         if not index_name in l_table_name:
             sql = self.db.create_index_sql(table_name, index_name, l_key)
             self.db.execute(sql)
@@ -537,30 +679,983 @@ class LogDB():
             sql = self.db.create_index_sql(table_name, index_name, l_key)
             self.db.execute(sql)
 
+        if self._count_bucket is not None:
+            table_name = "log_count"
+            index_name = "log_count_index"
+            l_key = [db_common.tablekey("bucket", "bigint"),
+                     self._host_tablekey(index = True),
+                     db_common.tablekey("ltid", "integer")]
+            if not index_name in l_table_name:
+                sql = self.db.create_index_sql(table_name, index_name, l_key)
+                self.db.execute(sql)
+            index_name = "log_count_host_index"
+            l_key = [self._host_tablekey(index = True),
+                     db_common.tablekey("bucket", "bigint")]
+            if not index_name in l_table_name:
+                sql = self.db.create_index_sql(table_name, index_name, l_key)
+                self.db.execute(sql)
+
+    def _init_metadata(self):
+        # key-value table of DB information (e.g., storage format)
+        table_name = "metadata"
+        l_key = [db_common.tablekey("name", "text"),
+                 db_common.tablekey("value", "text")]
+        sql = self.db.create_table_sql(table_name, l_key)
+        self.db.execute(sql)
+
+    def _load_metadata(self):
+        """Load storage format of existing DB.
+        DB without metadata table is in text format."""
+        if "metadata" in self.db.get_table_names():
+            self._words_format = self.get_metadata("words_format")
+            self._words_compress = self.get_metadata(
+                "words_compress") == "true"
+            self._dt_format = self.get_metadata("dt_format")
+            self._host_format = self.get_metadata("host_format")
+            self._words_store = self.get_metadata("words_store")
+            self._count_bucket = self.get_metadata("count_bucket")
+        else:
+            self._words_format = None
+            self._words_compress = False
+            self._dt_format = None
+            self._host_format = None
+            self._words_store = None
+            self._count_bucket = None
+        if self._count_bucket == "":
+            self._count_bucket = None
+        if self._words_format is None:
+            self._words_format = "text"
+        if self._dt_format is None:
+            self._dt_format = "text"
+        if self._host_format is None:
+            self._host_format = "text"
+        if self._words_store is None:
+            self._words_store = "full"
+        if self._host_format == "id":
+            self._load_host_table()
+        if self._words_store == "variable":
+            self._load_ltrev_table()
+
+    def _dump_metadata(self):
+        self.set_metadata("words_format", self._words_format)
+        self.set_metadata("words_compress",
+                          "true" if self._words_compress else "false")
+        self.set_metadata("dt_format", self._dt_format)
+        self.set_metadata("host_format", self._host_format)
+        self.set_metadata("words_store", self._words_store)
+        if self._count_bucket is None:
+            self.set_metadata("count_bucket", "")
+        else:
+            self.set_metadata("count_bucket", self._count_bucket)
+
+    def _load_stats(self):
+        self._stats = {}
+        self._stats_changed = False
+        self._stats_dirty = False
+        if not "metadata" in self.db.get_table_names():
+            return
+        if self.get_metadata("stat_dirty") is not None:
+            # DB changed without commit of the statistics
+            # (e.g., interrupted process), recalculate them
+            _logger.info("cached statistics of DB are not available")
+            self._stats_dirty = True
+            return
+        for key in STAT_KEYS:
+            val = self.get_metadata("stat_" + key)
+            if val is not None:
+                self._stats[key] = self._decode_stat(key, val)
+
+    def _dump_stats(self):
+        if not "metadata" in self.db.get_table_names():
+            self._init_metadata()
+        for key in STAT_KEYS:
+            # unknown values are calculated to keep all of them in cache
+            self.set_metadata("stat_" + key,
+                              self._encode_stat(key, self._get_stat(key)))
+        self._remove_metadata("stat_dirty")
+        self._stats_changed = False
+        self._stats_dirty = False
+
+    def _set_stats_dirty(self):
+        # flag written in the same transaction as the changes of DB,
+        # to invalidate the cache if not committed with _dump_stats
+        if not self._stats_dirty:
+            if not "metadata" in self.db.get_table_names():
+                self._init_metadata()
+            self.set_metadata("stat_dirty", "true")
+            self._stats_dirty = True
+
+    @staticmethod
+    def _encode_stat(key, val):
+        if key in ("top_dt", "end_dt"):
+            if val is None:
+                return ""
+            else:
+                return val.strftime("%Y-%m-%d %H:%M:%S.%f")
+        else:
+            return str(val)
+
+    @staticmethod
+    def _decode_stat(key, val):
+        if key in ("top_dt", "end_dt"):
+            if val == "":
+                return None
+            else:
+                return datetime.datetime.strptime(val,
+                                                  "%Y-%m-%d %H:%M:%S.%f")
+        else:
+            return int(val)
+
+    def _calc_stat(self, key):
+        # aggregate queries to get statistics without cache
+        self._flush_lines()
+        if key == "max_lid":
+            sql = self.db.select_sql("log", ["max(lid)"])
+            tmp = self.db.execute(sql).fetchone()[0]
+            return 0 if tmp is None else int(tmp)
+        elif key in ("top_dt", "end_dt"):
+            func = "min" if key == "top_dt" else "max"
+            sql = self.db.select_sql("log", ["{0}(dt)".format(func)])
+            tmp = self.db.execute(sql).fetchone()[0]
+            return None if tmp is None else self._decode_dt(tmp)
+        elif key == "count_lt":
+            sql = self.db.select_sql("lt", ["count(*)"])
+            return int(self.db.execute(sql).fetchone()[0])
+        elif key == "count_ltg":
+            sql = self.db.select_sql("ltg", ["max(ltgid)"])
+            tmp = self.db.execute(sql).fetchone()[0]
+            return 0 if tmp is None else int(tmp) + 1
+        else:
+            raise KeyError(key)
+
+    def _get_stat(self, key):
+        if not key in self._stats:
+            self._stats[key] = self._calc_stat(key)
+            self._stats_changed = True
+        return self._stats[key]
+
+    def _update_stat(self, key, func):
+        # update a known statistic value with func(old_value)
+        self._set_stats_dirty()
+        if key in self._stats:
+            self._stats[key] = func(self._stats[key])
+            self._stats_changed = True
+
+    def _flush_stats(self):
+        # update statistics with the messages given to add_line
+        if self._buf_stats is None:
+            return
+        max_lid, top_dt, end_dt = self._buf_stats
+        self._buf_stats = None
+        self._update_stat("max_lid", lambda v: max(v, max_lid))
+        self._update_stat("top_dt",
+                          lambda v: top_dt if v is None or top_dt < v else v)
+        self._update_stat("end_dt",
+                          lambda v: end_dt if v is None or end_dt > v else v)
+
+    def _invalidate_stat(self, key):
+        self._set_stats_dirty()
+        if key in self._stats:
+            self._stats.pop(key)
+            self._stats_changed = True
+
+    def verify_stats(self, rebuild = False):
+        """Compare cached statistics in metadata table
+        with the values calculated from DB.
+
+        Args:
+            rebuild (bool): If True, overwrite the cache
+                with calculated values.
+
+        Note:
+            Cached values are not available (None) if the DB has been
+            changed without committing them (e.g., interrupted db-add).
+
+        Returns:
+            List[Tuple[str, Any, Any]]: Sequence of name,
+                cached value (None if not cached), and calculated value.
+        """
+        ret = []
+        d_calc = {}
+        has_metadata = "metadata" in self.db.get_table_names() and \
+                self.get_metadata("stat_dirty") is None
+        for key in STAT_KEYS:
+            cached = None
+            if has_metadata:
+                val = self.get_metadata("stat_" + key)
+                if val is not None:
+                    cached = self._decode_stat(key, val)
+            d_calc[key] = self._calc_stat(key)
+            ret.append((key, cached, d_calc[key]))
+        if rebuild:
+            self._stats = d_calc
+            self._dump_stats()
+            self.db.commit()
+        return ret
+
+    def get_metadata(self, name):
+        table_name = "metadata"
+        l_key = ["value"]
+        l_cond = [db_common.cond("name", "=", "name")]
+        sql = self.db.select_sql(table_name, l_key, l_cond)
+        cursor = self.db.execute(sql, {"name" : name})
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        else:
+            return row[0]
+
+    def set_metadata(self, name, value):
+        table_name = "metadata"
+        args = {"name" : name, "value" : value}
+        l_cond = [db_common.cond("name", "=", "name")]
+        sql = self.db.delete_sql(table_name, l_cond)
+        self.db.execute(sql, args)
+        l_ss = [db_common.setstate("name", "name"),
+                db_common.setstate("value", "value")]
+        sql = self.db.insert_sql(table_name, l_ss)
+        self.db.execute(sql, args)
+
+    def _remove_metadata(self, name):
+        table_name = "metadata"
+        l_cond = [db_common.cond("name", "=", "name")]
+        sql = self.db.delete_sql(table_name, l_cond)
+        self.db.execute(sql, {"name" : name})
+
+    def _init_host_table(self):
+        # dimension table of hostnames for host_format = id
+        table_name = "host"
+        if table_name in self.db.get_table_names():
+            return
+        l_key = [db_common.tablekey("hid", "integer", ("primary_key",)),
+                 db_common.tablekey("host", "text")]
+        sql = self.db.create_table_sql(table_name, l_key)
+        self.db.execute(sql)
+
+    def _load_host_table(self):
+        table_name = "host"
+        sql = self.db.select_sql(table_name, ["hid", "host"])
+        for hid, host in self.db.execute(sql):
+            self._d_hid[host] = int(hid)
+            self._d_hostname[int(hid)] = host
+
+    def _add_host(self, host):
+        hid = len(self._d_hid) + 1
+        table_name = "host"
+        l_ss = [db_common.setstate("hid", "hid"),
+                db_common.setstate("host", "host")]
+        sql = self.db.insert_sql(table_name, l_ss)
+        self.db.execute(sql, {"hid" : hid, "host" : host})
+        self._d_hid[host] = hid
+        self._d_hostname[hid] = host
+        return hid
+
+    def _encode_host(self, host):
+        if self._host_format == "id":
+            hid = self._d_hid.get(host)
+            if hid is None:
+                hid = self._add_host(host)
+            return hid
+        else:
+            return host
+
+    def _decode_host(self, val, host_format = None):
+        if host_format is None:
+            host_format = self._host_format
+        if host_format == "id":
+            return self._d_hostname[val]
+        else:
+            return val
+
+    def _init_count_table(self):
+        # summary table of message counts for count_bucket
+        table_name = "log_count"
+        if self._count_bucket is None or \
+                table_name in self.db.get_table_names():
+            return
+        l_key = [db_common.tablekey("ltid", "integer"),
+                 self._host_tablekey(),
+                 db_common.tablekey("bucket", "bigint"),
+                 db_common.tablekey("count", "integer")]
+        sql = self.db.create_table_sql(table_name, l_key)
+        self.db.execute(sql)
+
+    def _epoch_sec(self, dt):
+        if isinstance(dt, str):
+            dt = self.db.strptime(dt)
+        delta = dt.replace(tzinfo = None) - EPOCH
+        return delta.days * 86400 + delta.seconds
+
+    def _bucket(self, dt):
+        """int: Epoch seconds of the count bucket including dt."""
+        sec = self._epoch_sec(dt)
+        return sec - sec % COUNT_BUCKETS[self._count_bucket]
+
+    def _count_available(self, top_dt = None, end_dt = None):
+        """bool: True if the count table can answer the query in the
+        given term (bucket boundaries)."""
+        if self._count_bucket is None:
+            return False
+        for dt in (top_dt, end_dt):
+            if dt is None:
+                continue
+            if isinstance(dt, datetime.datetime) and dt.microsecond != 0:
+                return False
+            if self._epoch_sec(dt) % COUNT_BUCKETS[self._count_bucket] != 0:
+                return False
+        return True
+
+    def _count_conditions(self, d_cond):
+        """Generate conditions and arguments to search log_count table."""
+        d_temp = {k : v for k, v in d_cond.items()
+                  if not k in ("top_dt", "end_dt")}
+        l_cond, args = self._log_conditions(d_temp)
+        if d_cond.get("top_dt") is not None:
+            l_cond.append(db_common.cond("bucket", ">=", "top_bucket"))
+            args["top_bucket"] = self._bucket(d_cond["top_dt"])
+        if d_cond.get("end_dt") is not None:
+            l_cond.append(db_common.cond("bucket", "<", "end_bucket"))
+            args["end_bucket"] = self._bucket(d_cond["end_dt"])
+        return l_cond, args
+
+    def _flush_count(self):
+        if len(self._buf_count) == 0:
+            return
+        table_name = "log_count"
+        hkey = self._host_key()
+        l_cond = [db_common.cond("ltid", "=", "ltid"),
+                  db_common.cond(hkey, "=", hkey),
+                  db_common.cond("bucket", "=", "bucket")]
+        update_sql = self.db.increment_sql(table_name, "count", "count",
+                                           l_cond)
+        l_insert = []
+        for (ltid, host, bucket), cnt in self._buf_count.items():
+            if cnt == 0:
+                continue
+            args = {"ltid" : ltid, hkey : host, "bucket" : bucket,
+                    "count" : cnt}
+            cursor = self.db.execute(update_sql, args)
+            if cursor.rowcount == 0:
+                l_insert.append(args)
+        if len(l_insert) > 0:
+            l_ss = [db_common.setstate(k, k)
+                    for k in ("ltid", hkey, "bucket", "count")]
+            sql = self.db.insert_sql(table_name, l_ss)
+            self.db.executemany(sql, l_insert)
+        # remove rows without messages (moved with update_log)
+        l_args = [{"ltid" : ltid, hkey : host, "bucket" : bucket, "zero" : 0}
+                  for (ltid, host, bucket), cnt in self._buf_count.items()
+                  if cnt < 0]
+        if len(l_args) > 0:
+            sql = self.db.delete_sql(table_name, l_cond + [
+                db_common.cond("count", "<=", "zero")])
+            self.db.executemany(sql, l_args)
+        self._buf_count = defaultdict(int)
+
+    def remake_count(self, count_bucket = None, batch_size = 10000):
+        """Rebuild the count table from log table.
+
+        Args:
+            count_bucket (Optional[str]): minute, hour or day.
+                If None, use current setting.
+                If empty string, the count table is removed.
+        """
+        if count_bucket is None:
+            count_bucket = self._count_bucket
+        elif count_bucket == "":
+            count_bucket = None
+        if count_bucket is not None and not count_bucket in COUNT_BUCKETS:
+            raise ValueError("invalid count_bucket ({0})".format(
+                    count_bucket))
+        self._flush_lines()
+        if "log_count" in self.db.get_table_names():
+            self.db.execute(self.db.drop_sql("log_count"))
+        self._count_bucket = count_bucket
+        if not "metadata" in self.db.get_table_names():
+            self._init_metadata()
+        self._dump_metadata()
+        if count_bucket is None:
+            self.commit()
+            _logger.info("count table removed")
+            return
+
+        self._init_count_table()
+        table_name = "log"
+        hkey = self._host_key()
+        sql = self.db.select_sql(table_name, ["ltid", hkey, "dt"])
+        cnt = 0
+        for ltid, host, dtval in self.db.execute(sql):
+            self._buf_count[(ltid, host,
+                             self._bucket(self._decode_dt(dtval)))] += 1
+            cnt += 1
+        self._flush_count()
+        self._init_index()
+        self.commit()
+        _logger.info("count table ({0}) made from {1} messages".format(
+            count_bucket, cnt))
+
+    def count_host_lt(self, top_dt = None, end_dt = None, area = None):
+        """Dict[Tuple[str, int], int]: Number of messages
+        for each combination of hostname and ltid."""
+        self._flush_lines()
+        d_cond = {}
+        if top_dt is not None:
+            d_cond["top_dt"] = top_dt
+        if end_dt is not None:
+            d_cond["end_dt"] = end_dt
+        self._area_condition(d_cond, area)
+        hkey = self._host_key()
+        ret = defaultdict(int)
+        if self._count_available(top_dt, end_dt):
+            l_cond, args = self._count_conditions(d_cond)
+            sql = self.db.select_sql("log_count", [hkey, "ltid", "count"],
+                                     l_cond)
+            for host, ltid, cnt in self.db.execute(sql, args):
+                ret[(host, ltid)] += cnt
+        else:
+            l_cond, args = self._log_conditions(d_cond)
+            sql = self.db.select_sql("log", [hkey, "ltid"], l_cond)
+            for host, ltid in self.db.execute(sql, args):
+                ret[(host, ltid)] += 1
+        return {(self._decode_host(host), ltid) : cnt
+                for (host, ltid), cnt in ret.items()}
+
+    def count_matrix(self, top_dt, end_dt, bin_sec, area = None,
+                     gid_name = "ltid", sparse = False):
+        """Count messages for each combination of hostname and
+        template (or group) in time bins, without making LogMessages.
+        The count table is used if available for the term and bin size.
+        See LogData.event_matrix."""
+        import numpy as np
+        if sparse:
+            try:
+                import scipy.sparse
+            except ImportError:
+                raise ImportError("sparse matrix needs python package scipy")
+
+        self._flush_lines()
+        if bin_sec < 1:
+            raise ValueError("bin size should be 1 second or more")
+        d_cond = {"top_dt" : top_dt, "end_dt" : end_dt}
+        self._area_condition(d_cond, area)
+        hkey = self._host_key()
+        top_sec = self._epoch_sec(top_dt)
+        n_bin = -(-(self._epoch_sec(end_dt) - top_sec) // bin_sec)
+
+        if self._count_available(top_dt, end_dt) and \
+                bin_sec % COUNT_BUCKETS[self._count_bucket] == 0:
+            l_cond, args = self._count_conditions(d_cond)
+            sql = self.db.select_sql("log_count",
+                                     [hkey, "ltid", "bucket", "count"], l_cond)
+            rows = self.db.execute(sql, args).fetchall()
+            if len(rows) > 0:
+                l_host, l_ltid, l_sec, l_cnt = zip(*rows)
+                a_sec = np.array(l_sec, dtype = np.int64)
+                a_weight = np.array(l_cnt, dtype = np.int64)
+        else:
+            l_cond, args = self._log_conditions(d_cond)
+            sql = self.db.select_sql("log", [hkey, "ltid", "dt"], l_cond)
+            rows = self.db.execute(sql, args).fetchall()
+            if len(rows) > 0:
+                l_host, l_ltid, l_dt = zip(*rows)
+                a_sec = self._dt_array(l_dt)
+                a_weight = None
+
+        if len(rows) == 0:
+            if sparse:
+                return scipy.sparse.csr_matrix((0, n_bin), dtype = np.int64), []
+            else:
+                return np.zeros((0, n_bin), dtype = np.int64), []
+
+        a_id = np.array(l_ltid, dtype = np.int64)
+        if gid_name == "ltgid":
+            a_map = np.full(max(self.lttable.ltdict) + 1, -1, dtype = np.int64)
+            for lt in self.lttable:
+                a_map[lt.ltid] = lt.ltgid
+            a_id = a_map[a_id]
+        elif gid_name != "ltid":
+            raise ValueError("invalid gid_name ({0})".format(gid_name))
+        u_host, inv_host = np.unique(np.array(l_host), return_inverse = True)
+        u_id, inv_id = np.unique(a_id, return_inverse = True)
+        u_code, inv_key = np.unique(inv_host * len(u_id) + inv_id,
+                                    return_inverse = True)
+        l_key = [(self._decode_host(u_host[code // len(u_id)].item()),
+                  u_id[code % len(u_id)].item()) for code in u_code]
+        a_bin = (a_sec - top_sec) // bin_sec
+
+        if sparse:
+            if a_weight is None:
+                a_weight = np.ones(len(a_bin), dtype = np.int64)
+            mat = scipy.sparse.coo_matrix((a_weight, (inv_key, a_bin)),
+                                          shape = (len(l_key), n_bin))
+            return mat.tocsr(), l_key
+        else:
+            mat = np.bincount(inv_key * n_bin + a_bin, weights = a_weight,
+                              minlength = len(l_key) * n_bin)
+            return mat.astype(np.int64).reshape((len(l_key), n_bin)), l_key
+
+    def _dt_array(self, l_dt):
+        """numpy.ndarray: Epoch seconds of timestamp values in DB."""
+        import numpy as np
+        if self._dt_format == "epoch":
+            return np.array(l_dt, dtype = np.int64)
+        elif self._dt_format == "epoch_us":
+            return np.array(l_dt, dtype = np.int64) // 1000000
+        else:
+            # strings in sqlite3, datetime in mysql
+            return np.array(l_dt, dtype = "datetime64[s]").astype(np.int64)
+
+    @staticmethod
+    def _area_condition(d_cond, area):
+        if area is None or area == "all":
+            pass
+        elif area[:5] == "host_":
+            d_cond["host"] = area[5:]
+        else:
+            d_cond["area"] = area
+
+    def _init_ltrev_table(self):
+        # snapshots of log templates for words_store = variable:
+        # messages keep variables and rid of the template used to extract
+        table_name = "ltrev"
+        if table_name in self.db.get_table_names():
+            return
+        l_key = [db_common.tablekey("rid", "integer", ("primary_key",)),
+                 db_common.tablekey("ltw", "text")]
+        sql = self.db.create_table_sql(table_name, l_key)
+        self.db.execute(sql)
+
+    def _load_ltrev_table(self):
+        table_name = "ltrev"
+        sql = self.db.select_sql(table_name, ["rid", "ltw"])
+        for rid, ltwstr in self.db.execute(sql):
+            ltw = strutil.split_igesc(ltwstr, self._splitter)
+            self._set_rev(int(rid), ltw)
+
+    def _is_variable(self, w):
+        return w == self._sym or (len(w) >= 2 and
+                                  w.startswith(self._sym_header) and
+                                  w.endswith(self._sym_footer))
+
+    def _set_rev(self, rid, ltw):
+        l_loc = []
+        l_desc = []
+        for i, w in enumerate(ltw):
+            if self._is_variable(w):
+                l_loc.append(i)
+            else:
+                l_desc.append((i, w))
+        self._d_rev[rid] = (tuple(ltw), l_loc, l_desc)
+        self._d_rev_key[self._splitter.join(ltw)] = rid
+
+    def _get_rid(self, ltid):
+        rid = self._d_ltrid.get(ltid)
+        if rid is not None:
+            return rid
+        if not ltid in self.lttable.ltdict:
+            return None
+        ltw = self.lttable[ltid].ltw
+        key = self._splitter.join(ltw)
+        rid = self._d_rev_key.get(key)
+        if rid is None:
+            rid = len(self._d_rev) + 1
+            table_name = "ltrev"
+            l_ss = [db_common.setstate("rid", "rid"),
+                    db_common.setstate("ltw", "ltw")]
+            sql = self.db.insert_sql(table_name, l_ss)
+            self.db.execute(sql, {"rid" : rid, "ltw" : key})
+            self._set_rev(rid, ltw)
+        self._d_ltrid[ltid] = rid
+        return rid
+
+    def _encode_log_words(self, ltid, l_w, d_val):
+        """Set words (and rid) of a message in row values."""
+        if self._words_store == "variable":
+            rid = self._get_rid(ltid)
+            if rid is not None:
+                ltw, l_loc, l_desc = self._d_rev[rid]
+                if len(l_w) == len(ltw) and \
+                        all(l_w[i] == w for i, w in l_desc):
+                    l_var = [l_w[i] for i in l_loc]
+                    # [""] is not distinguishable from [] in text format
+                    if not l_var == [""]:
+                        d_val["rid"] = rid
+                        d_val["words"] = self._encode_words(l_var)
+                        return d_val
+            # not matching the template: store all words
+            d_val["rid"] = None
+        d_val["words"] = self._encode_words(l_w)
+        return d_val
+
+    def _decode_log_words(self, row, words_store = None,
+                          words_format = None):
+        if words_store is None:
+            words_store = self._words_store
+        if words_store == "variable" and row[5] is not None:
+            ltw, l_loc, _ = self._d_rev[row[5]]
+            l_w = list(ltw)
+            for i, w in zip(l_loc, self._decode_words(row[4], words_format)):
+                l_w[i] = w
+            return l_w
+        else:
+            return self._decode_words(row[4], words_format)
+
+    def _area_hids(self, area):
+        table_name = "area"
+        l_key = ["host"]
+        l_cond = [db_common.cond("area", "=", "area")]
+        sql = self.db.select_sql(table_name, l_key, l_cond)
+        cursor = self.db.execute(sql, {"area" : area})
+        return sorted(self._d_hid[row[0]] for row in cursor
+                      if row[0] in self._d_hid)
+
+    def _log_conditions(self, d_cond):
+        """Generate conditions and arguments to search log table."""
+        args = d_cond.copy()
+        l_cond = []
+        for c in d_cond.keys():
+            if c == "ltgid":
+                sql = self.db.select_sql("ltg", ["ltid"],
+                        [db_common.cond(c, "=", c)])
+                l_cond.append(db_common.cond("ltid", "in", sql, False))
+            elif c == "area" and self._host_format == "id":
+                # hids are given as constants, no subquery
+                l_hid = self._area_hids(d_cond[c])
+                if len(l_hid) == 0:
+                    hidstr = "null"
+                else:
+                    hidstr = ", ".join(str(hid) for hid in l_hid)
+                l_cond.append(db_common.cond("hid", "in", hidstr, False))
+                args.pop(c)
+            elif c == "area":
+                sql = self.db.select_sql("area", ["host"],
+                        [db_common.cond(c, "=", c)])
+                l_cond.append(db_common.cond("host", "in", sql, False))
+            elif c == "host" and self._host_format == "id":
+                l_cond.append(db_common.cond("hid", "=", c))
+                args[c] = self._d_hid.get(d_cond[c])
+            elif c == "top_dt":
+                l_cond.append(db_common.cond("dt", ">=", c))
+                args[c] = self._encode_dt(d_cond[c])
+            elif c == "end_dt":
+                l_cond.append(db_common.cond("dt", "<", c))
+                args[c] = self._encode_dt(d_cond[c])
+            else:
+                l_cond.append(db_common.cond(c, "=", c))
+        return l_cond, args
+
+    def _encode_words(self, l_w):
+        if self._words_format == "binary":
+            return strutil.pack_words(l_w, self._words_compress)
+        else:
+            return self._splitter.join(l_w)
+
+    def _decode_words(self, data, words_format = None):
+        if words_format is None:
+            words_format = self._words_format
+        if words_format == "binary":
+            return strutil.unpack_words(data)
+        elif data == "":
+            return []
+        else:
+            return strutil.split_igesc(data, self._splitter)
+
+    def _encode_dt(self, dt):
+        if self._dt_format == "text":
+            return self.db.strftime(dt)
+        if isinstance(dt, str):
+            dt = self.db.strptime(dt)
+        # timezone is ignored as in text format
+        delta = dt.replace(tzinfo = None) - EPOCH
+        sec = delta.days * 86400 + delta.seconds
+        if self._dt_format == "epoch":
+            return sec
+        else:
+            return sec * 1000000 + delta.microseconds
+
+    def _decode_dt(self, val, dt_format = None):
+        if dt_format is None:
+            dt_format = self._dt_format
+        if dt_format == "text":
+            return self.db.datetime(val)
+        elif dt_format == "epoch":
+            return EPOCH + datetime.timedelta(seconds = val)
+        else:
+            return EPOCH + datetime.timedelta(microseconds = val)
+
+    def convert_format(self, words_format = None, words_compress = None,
+                       dt_format = None, host_format = None,
+                       words_store = None, batch_size = 10000):
+        """Rewrite log table in given storage format.
+        Arguments given None are kept as current format.
+
+        Args:
+            words_format (Optional[str]): text or binary.
+            words_compress (Optional[bool]): If True, words are
+                zlib-compressed in binary format.
+            dt_format (Optional[str]): text, epoch or epoch_us.
+            host_format (Optional[str]): text or id.
+            words_store (Optional[str]): full or variable.
+        """
+        if words_format is None:
+            words_format = self._words_format
+        if words_compress is None:
+            words_compress = self._words_compress
+        if dt_format is None:
+            dt_format = self._dt_format
+        if host_format is None:
+            host_format = self._host_format
+        if words_store is None:
+            words_store = self._words_store
+        if not words_format in ("text", "binary"):
+            raise ValueError("invalid words_format ({0})".format(
+                    words_format))
+        if not dt_format in ("text", "epoch", "epoch_us"):
+            raise ValueError("invalid dt_format ({0})".format(dt_format))
+        if not host_format in ("text", "id"):
+            raise ValueError("invalid host_format ({0})".format(
+                    host_format))
+        if not words_store in ("full", "variable"):
+            raise ValueError("invalid words_store ({0})".format(
+                    words_store))
+        self._flush_lines()
+        sql = self.db.select_sql("log", self._log_keys())
+        cursor = self.db.execute(sql)
+
+        old_words_format = self._words_format
+        old_dt_format = self._dt_format
+        old_host_format = self._host_format
+        old_words_store = self._words_store
+        self._words_format = words_format
+        self._words_compress = words_compress
+        self._dt_format = dt_format
+        self._host_format = host_format
+        self._words_store = words_store
+        if not "metadata" in self.db.get_table_names():
+            self._init_metadata()
+        if host_format == "id":
+            self._init_host_table()
+        if words_store == "variable":
+            self._init_ltrev_table()
+        sql = self.db.create_table_sql("log_temp", self._log_table_keys())
+        self.db.execute(sql)
+        l_key = self._log_keys()
+        l_ss = [db_common.setstate(k, k) for k in l_key]
+        insert_sql = self.db.insert_sql("log_temp", l_ss)
+
+        cnt = 0
+        buf = []
+        for row in cursor:
+            dt = self._decode_dt(row[2], old_dt_format)
+            host = self._decode_host(row[3], old_host_format)
+            l_w = self._decode_log_words(row, old_words_store,
+                                         old_words_format)
+            d_val = {"lid" : row[0], "ltid" : row[1],
+                     "dt" : self._encode_dt(dt),
+                     self._host_key() : self._encode_host(host)}
+            buf.append(self._encode_log_words(row[1], l_w, d_val))
+            if len(buf) >= batch_size:
+                self.db.executemany(insert_sql, buf)
+                cnt += len(buf)
+                buf = []
+                _logger.info("converted {0} messages".format(cnt))
+        if len(buf) > 0:
+            self.db.executemany(insert_sql, buf)
+            cnt += len(buf)
+
+        self.db.execute(self.db.drop_sql("log"))
+        self.db.execute(self.db.rename_table_sql("log_temp", "log"))
+        if old_words_store == "variable" and words_store == "full":
+            self.db.execute(self.db.drop_sql("ltrev"))
+            self._d_rev = {}
+            self._d_rev_key = {}
+            self._d_ltrid = {}
+        self._init_index()
+        self._dump_metadata()
+        if self._count_bucket is not None and old_host_format != host_format:
+            # host values in count table are changed
+            self.remake_count()
+        self.commit()
+        self.db.vacuum()
+        _logger.info(("converted {0} messages (words: {1} {2}, "
+                      "dt: {3}, host: {4})").format(
+                          cnt, words_store, words_format, dt_format,
+                          host_format))
+
     def commit(self):
+        self._flush_lines()
+        if self._stats_changed:
+            self._dump_stats()
         self.db.commit()
+
+    def rollback(self):
+        """Discard requested changes after the last commit."""
+        self._buf_lines = []
+        self._buf_count = defaultdict(int)
+        self._buf_stats = None
+        self.db.rollback()
+        self._load_stats()
+        if self._host_format == "id":
+            # hosts added after the last commit are removed
+            self._d_hid = {}
+            self._d_hostname = {}
+            if "host" in self.db.get_table_names():
+                self._load_host_table()
+        if self._words_store == "variable":
+            # template revisions added after the last commit are removed
+            self._d_rev = {}
+            self._d_rev_key = {}
+            self._d_ltrid = {}
+            if "ltrev" in self.db.get_table_names():
+                self._load_ltrev_table()
+
+    def _init_checkpoint_table(self):
+        # progress of adding messages from files (see process_files)
+        table_name = "checkpoint"
+        if table_name in self.db.get_table_names():
+            return
+        l_key = [db_common.tablekey("targets", "text"),
+                 db_common.tablekey("fid", "integer"),
+                 db_common.tablekey("offset", "bigint"),
+                 db_common.tablekey("lid", "bigint"),
+                 db_common.tablekey("options", "text"),
+                 db_common.tablekey("ltm", "blob")]
+        sql = self.db.create_table_sql(table_name, l_key)
+        self.db.execute(sql)
+
+    def set_checkpoint(self, targets, fid, offset, lid, options, ltm_data):
+        """Record the progress of adding messages from files.
+        The checkpoint is consistent with the DB only after commit.
+
+        Args:
+            targets (List[str]): Filepaths to process.
+            fid (int): Index of the file in targets in processing.
+            offset (int): Byte offset of the next message in the file.
+            lid (Optional[int]): Last added lid.
+            options (dict): Other arguments of the processing.
+            ltm_data (bytes): Internal data of LTManager (LTManager.dumps).
+        """
+        self._init_checkpoint_table()
+        table_name = "checkpoint"
+        sql = self.db.delete_sql(table_name)
+        self.db.execute(sql)
+        args = {"targets" : json.dumps(targets),
+                "fid" : fid,
+                "offset" : offset,
+                "lid" : lid,
+                "options" : json.dumps(options),
+                "ltm" : ltm_data}
+        l_ss = [db_common.setstate(k, k) for k in args]
+        sql = self.db.insert_sql(table_name, l_ss)
+        self.db.execute(sql, args)
+
+    def get_checkpoint(self):
+        """Optional[dict]: The recorded progress of adding messages.
+        None if there is no unfinished processing."""
+        table_name = "checkpoint"
+        if not table_name in self.db.get_table_names():
+            return None
+        l_key = ["targets", "fid", "offset", "lid", "options", "ltm"]
+        sql = self.db.select_sql(table_name, l_key)
+        row = self.db.execute(sql).fetchone()
+        if row is None:
+            return None
+        d = dict(zip(l_key, row))
+        d["targets"] = json.loads(d["targets"])
+        d["options"] = json.loads(d["options"])
+        return d
+
+    def clear_checkpoint(self):
+        table_name = "checkpoint"
+        if table_name in self.db.get_table_names():
+            sql = self.db.delete_sql(table_name)
+            self.db.execute(sql)
+
+    def start_bulk_load(self):
+        """Prepare a fresh DB for loading large amount of messages.
+        The index of log table is removed (rebuilt in end_bulk_load),
+        and the DB is tuned for bulk loading (sqlite pragmas).
+        The count table is not updated in batch insertion,
+        but only in commit (at the end or checkpoints)."""
+        _logger.info("bulk load mode: log_index removed until the end")
+        if "log_index" in self.db.get_table_names():
+            # already removed if resumed from a checkpoint
+            sql = self.db.drop_index_sql("log", "log_index")
+            self.db.execute(sql)
+        self.db.set_bulk_mode(True)
+        self._bulk_load = True
+
+    def end_bulk_load(self):
+        """Rebuild the index of log table and restore DB settings."""
+        self._flush_lines()
+        self._init_index()
+        self.db.set_bulk_mode(False)
+        self._bulk_load = False
+        self.commit()
+        _logger.info("bulk load mode: log_index rebuilt")
     
     def add_line(self, ltid, dt, host, l_w, lid = None):
-        table_name = "log"
         d_val = {
             "ltid" : ltid,
-            "dt" : self.db.strftime(dt),
-            "host" : host,
-            "words" : self._splitter.join(l_w),
+            "dt" : self._encode_dt(dt),
+            self._host_key() : self._encode_host(host),
         }
+        self._encode_log_words(ltid, l_w, d_val)
 
         self._line_cnt += 1
         if lid is None:
             d_val["lid"] = self._line_cnt
         else:
             d_val["lid"] = lid
-
-        l_ss = [db_common.setstate(k, k) for k in d_val.keys()]
-        sql = self.db.insert_sql(table_name, l_ss)
-        self.db.execute(sql, d_val)
+        # reflected to statistics in _flush_stats
+        buf_stats = self._buf_stats
+        if buf_stats is None:
+            self._buf_stats = [d_val["lid"], dt, dt]
+        else:
+            if d_val["lid"] > buf_stats[0]:
+                buf_stats[0] = d_val["lid"]
+            if dt < buf_stats[1]:
+                buf_stats[1] = dt
+            elif dt > buf_stats[2]:
+                buf_stats[2] = dt
+        if self._count_bucket is not None:
+            self._buf_count[(ltid, d_val[self._host_key()],
+                             self._bucket(dt))] += 1
+
+        if self._batch_size > 1:
+            # keep insertion order of given lids in DB:
+            # lids that go backward start a new batch
+            if len(self._buf_lines) > 0 and \
+                    d_val["lid"] <= self._buf_lines[-1]["lid"]:
+                self._flush_lines(count = not self._bulk_load)
+            self._buf_lines.append(d_val)
+            if len(self._buf_lines) >= self._batch_size:
+                self._flush_lines(count = not self._bulk_load)
+        else:
+            sql = self._add_line_sql()
+            self.db.execute(sql, d_val)
+            self._flush_stats()
 
         return d_val["lid"]
 
+    def _add_line_sql(self):
+        table_name = "log"
+        l_ss = [db_common.setstate(k, k) for k in self._log_keys()]
+        return self.db.insert_sql(table_name, l_ss)
+
+    def _flush_lines(self, count = True):
+        """Insert buffered messages of add_line into DB.
+        Call this before any query on the log table.
+        If count is False, buffered counts are kept for later flush."""
+        self._flush_stats()
+        if count:
+            self._flush_count()
+        if len(self._buf_lines) == 0:
+            return
+        sql = self._add_line_sql()
+        self.db.executemany(sql, self._buf_lines)
+        self._buf_lines = []
+
     def iter_lines(self, lid = None, ltid = None, ltgid = None, top_dt = None,
                    end_dt = None, host = None, area = None):
         d_cond = {}
@@ -583,12 +1678,9 @@ class LogDB():
         for row in self._select_log(d_cond):
             lid = int(row[0])
             ltid = int(row[1])
-            dt = self.db.datetime(row[2])
-            host = row[3]
-            if row[4] == "":
-                l_w = []
-            else:
-                l_w = strutil.split_igesc(row[4], self._splitter)
+            dt = self._decode_dt(row[2])
+            host = self._decode_host(row[3])
+            l_w = self._decode_log_words(row)
             yield LogMessage(lid, self.lttable[ltid], dt, host, l_w)
 
     def iter_words(self, lid = None, ltid = None, ltgid = None, top_dt = None,
@@ -604,42 +1696,23 @@ class LogDB():
         if len(d_cond) == 0:
             raise ValueError("More than 1 argument should NOT be None")
         for row in self._select_log(d_cond):
-            if row[4] == "":
-                yield []
-            else:
-                yield strutil.split_igesc(row[4], self._splitter)
+            yield self._decode_log_words(row)
 
     def _select_log(self, d_cond):
         if len(d_cond) == 0:
             raise ValueError("called select with empty condition")
-        args = d_cond.copy()
+        self._flush_lines()
 
         table_name = "log"
-        l_key = ["lid", "ltid", "dt", "host", "words"]
-        l_cond = []
-        for c in d_cond.keys():
-            if c == "ltgid":
-                sql = self.db.select_sql("ltg", ["ltid"],
-                        [db_common.cond(c, "=", c)])
-                l_cond.append(db_common.cond("ltid", "in", sql, False))
-            elif c == "area":
-                sql = self.db.select_sql("area", ["host"],
-                        [db_common.cond(c, "=", c)])
-                l_cond.append(db_common.cond("host", "in", sql, False))
-            elif c == "top_dt":
-                l_cond.append(db_common.cond("dt", ">=", c))
-                args[c] = self.db.strftime(d_cond[c])
-            elif c == "end_dt":
-                l_cond.append(db_common.cond("dt", "<", c))
-                args[c] = self.db.strftime(d_cond[c])
-            else:
-                l_cond.append(db_common.cond(c, "=", c))
+        l_key = self._log_keys()
+        l_cond, args = self._log_conditions(d_cond)
         sql = self.db.select_sql(table_name, l_key, l_cond)
         return self.db.execute(sql, args)
 
     def get_line(self, lid):
+        self._flush_lines()
         table_name = "log"
-        l_key = ["lid", "ltid", "dt", "host", "words"]
+        l_key = self._log_keys()
         l_cond = [db_common.cond("lid", "=", "lid")]
         sql = self.db.select_sql(table_name, l_key, l_cond)
         args = {"lid": lid}
@@ -648,12 +1721,9 @@ class LogDB():
         for row in self.db.execute(sql, args):
             lid = int(row[0])
             ltid = int(row[1])
-            dt = self.db.datetime(row[2])
-            host = row[3]
-            if row[4] == "":
-                l_w = []
-            else:
-                l_w = strutil.split_igesc(row[4], self._splitter)
+            dt = self._decode_dt(row[2])
+            host = self._decode_host(row[3])
+            l_w = self._decode_log_words(row)
             lm = LogMessage(lid, self.lttable[ltid], dt, host, l_w)
             ret.append(lm)
 
@@ -668,101 +1738,99 @@ class LogDB():
         if len(d_cond) == 0:
             _logger.warn("called update with empty condition")
             #raise ValueError("called update with empty condition")
-        args = d_cond.copy()
+        self._flush_lines()
+        l_cond, args = self._log_conditions(d_cond)
+        if self._count_bucket is not None and \
+                len(set(d_update) & {"ltid", "host", "dt"}) > 0:
+            self._update_count(l_cond, args, d_update)
+        if "dt" in d_update:
+            self._invalidate_stat("top_dt")
+            self._invalidate_stat("end_dt")
 
         table_name = "log"
         l_ss = []
         for k, v in d_update.items():
             #assert k in ("ltid", "top_dt", "end_dt", "host")
             keyname = "update_" + k
+            if k == "words":
+                v = self._encode_words(v)
+                if self._words_store == "variable":
+                    # not depend on template
+                    l_ss.append(db_common.setstate("rid", "update_rid"))
+                    args["update_rid"] = None
+            elif k == "host":
+                v = self._encode_host(v)
+                k = self._host_key()
             l_ss.append(db_common.setstate(k, keyname))
             args[keyname] = v
-        l_cond = []
-        for c in d_cond.keys():
-            if c == "ltgid":
-                sql= self.db.select_sql("ltg", ["ltid"],
-                        [db_common.cond(c, "=", c)])
-                l_cond.append(db_common.cond("ltid", "in", sql, False))
-            elif c == "area":
-                sql= self.db.select_sql("area", ["host"],
-                        [db_common.cond(c, "=", c)])
-                l_cond.append(db_common.cond("host", "in", sql, False))
-            elif c == "top_dt":
-                l_cond.append(db_common.cond("dt", ">=", c))
-                args[c] = self.db.strftime(d_cond[c])
-            elif c == "end_dt":
-                l_cond.append(db_common.cond("dt", "<", c))
-                args[c] = self.db.strftime(d_cond[c])
-            else:
-                l_cond.append(db_common.cond(c, "=", c))
         sql = self.db.update_sql(table_name, l_ss, l_cond)
         self.db.execute(sql, args)
 
+    def _update_count(self, l_cond, args, d_update):
+        # move counts of messages to be updated with update_log
+        hkey = self._host_key()
+        sql = self.db.select_sql("log", ["ltid", hkey, "dt"], l_cond)
+        for ltid, host, dtval in self.db.execute(sql, args):
+            dt = self._decode_dt(dtval)
+            self._buf_count[(ltid, host, self._bucket(dt))] -= 1
+            if "ltid" in d_update:
+                ltid = d_update["ltid"]
+            if "host" in d_update:
+                host = self._encode_host(d_update["host"])
+            if "dt" in d_update:
+                dt = d_update["dt"]
+            self._buf_count[(ltid, host, self._bucket(dt))] += 1
+
     def count_lines(self):
-        table_name = "log"
-        l_key = ["max(lid)"]
-        sql = self.db.select_sql(table_name, l_key)
-        cursor = self.db.execute(sql)
-        tmp = cursor.fetchone()[0]
-        if tmp is None:
-            return 0
-        else:
-            return int(tmp)
+        self._flush_stats()
+        return self._get_stat("max_lid")
 
     def dt_term(self):
-        table_name = "log"
-        l_key = ["min(dt)", "max(dt)"]
-        sql = self.db.select_sql(table_name, l_key)
-        cursor = self.db.execute(sql)
-        top_dtstr, end_dtstr = cursor.fetchone()
-        if None in (top_dtstr, end_dtstr):
+        self._flush_stats()
+        top_dt = self._get_stat("top_dt")
+        end_dt = self._get_stat("end_dt")
+        if None in (top_dt, end_dt):
             raise ValueError("No data found in DB")
-        return self.db.datetime(top_dtstr), self.db.datetime(end_dtstr)
+        return top_dt, end_dt
 
     def whole_host_lt(self, top_dt = None, end_dt = None, area = None):
-        table_name = "log"
-        l_key = ["host", "ltid"]
-        l_cond = []
-        args = {}
+        self._flush_lines()
+        l_key = [self._host_key(), "ltid"]
+        d_cond = {}
         if top_dt is not None:
-            l_cond.append(db_common.cond("dt", ">=", "top_dt"))
-            #args["top_dt"] = top_dt
-            args["top_dt"] = self.db.strftime(top_dt)
+            d_cond["top_dt"] = top_dt
         if end_dt is not None:
-            l_cond.append(db_common.cond("dt", "<", "end_dt"))
-            #args["end_dt"] = end_dt
-            args["end_dt"] = self.db.strftime(end_dt)
-        if area is None or area == "all":
-            pass
-        elif area[:5] == "host_":
-            l_cond.append(db_common.cond("host", "=", "host"))
-            args["host"] = area[5:]
+            d_cond["end_dt"] = end_dt
+        self._area_condition(d_cond, area)
+        if self._count_available(top_dt, end_dt):
+            table_name = "log_count"
+            l_cond, args = self._count_conditions(d_cond)
         else:
-            temp_sql = self.db.select_sql(
-                "area", ["host"], [db_common.cond("area", "=", "area")])
-            l_cond.append(db_common.cond("host", "in", temp_sql, False))
-            args["area"] = area
+            table_name = "log"
+            l_cond, args = self._log_conditions(d_cond)
 
         sql = self.db.select_sql(table_name, l_key, l_cond, opt = ["distinct"])
         cursor = self.db.execute(sql, args)
-        return [(row[0], row[1]) for row in cursor]
+        return [(self._decode_host(row[0]), row[1]) for row in cursor]
 
     def whole_host(self, top_dt = None, end_dt = None, area = None):
-        table_name = "log"
-        l_key = ["host"]
-        l_cond = []
-        args = {}
+        self._flush_lines()
+        l_key = [self._host_key()]
+        d_cond = {}
         if top_dt is not None:
-            l_cond.append(db_common.cond("dt", ">=", "top_dt"))
-            args["top_dt"] = self.db.strftime(top_dt)
-            #args["top_dt"] = top_dt
+            d_cond["top_dt"] = top_dt
         if end_dt is not None:
-            l_cond.append(db_common.cond("dt", "<", "end_dt"))
-            #args["end_dt"] = end_dt
-            args["end_dt"] = self.db.strftime(end_dt)
+            d_cond["end_dt"] = end_dt
+        self._area_condition(d_cond, area)
+        if self._count_available(top_dt, end_dt):
+            table_name = "log_count"
+            l_cond, args = self._count_conditions(d_cond)
+        else:
+            table_name = "log"
+            l_cond, args = self._log_conditions(d_cond)
         sql = self.db.select_sql(table_name, l_key, l_cond, opt = ["distinct"])
         cursor = self.db.execute(sql, args)
-        return [row[0] for row in cursor]
+        return [self._decode_host(row[0]) for row in cursor]
 
     def add_lt(self, ltline):
         table_name = "lt"
@@ -783,6 +1851,7 @@ class LogDB():
         }
         sql = self.db.insert_sql(table_name, l_ss)
         self.db.execute(sql, args)
+        self._update_stat("count_lt", lambda v: v + 1)
 
         self.add_ltg(ltline.ltid, ltline.ltgid)
 
@@ -794,8 +1863,12 @@ class LogDB():
         args = {"ltid" : ltid, "ltgid" : ltgid}
         sql = self.db.insert_sql(table_name, l_ss)
         self.db.execute(sql, args)
+        self._update_stat("count_ltg", lambda v: max(v, ltgid + 1))
 
     def update_lt(self, ltid, ltw, lts, count):
+        if ltw is not None:
+            # following messages use new snapshot of the template
+            self._d_ltrid.pop(ltid, None)
         table_name = "lt"
         l_ss = []
         args = {}
@@ -814,7 +1887,21 @@ class LogDB():
         sql = self.db.update_sql(table_name, l_ss, l_cond)
         self.db.execute(sql, args)
 
+    def update_lt_count(self, l_cnt):
+        """Update counts of multiple log templates at once.
+
+        Args:
+            l_cnt (List[Tuple[int, int]]): A sequence of ltid and its count.
+        """
+        table_name = "lt"
+        l_ss = [db_common.setstate("count", "count")]
+        l_cond = [db_common.cond("ltid", "=", "ltid")]
+        sql = self.db.update_sql(table_name, l_ss, l_cond)
+        l_args = [{"ltid" : ltid, "count" : cnt} for ltid, cnt in l_cnt]
+        self.db.executemany(sql, l_args)
+
     def remove_lt(self, ltid):
+        self._d_ltrid.pop(ltid, None)
         args = {"ltid" : ltid}
 
         # remove from lt
@@ -828,6 +1915,8 @@ class LogDB():
         l_cond = [db_common.cond("ltid", "=", "ltid")]
         sql = self.db.delete_sql(table_name, l_cond)
         self.db.execute(sql, args)
+        self._update_stat("count_lt", lambda v: v - 1)
+        self._invalidate_stat("count_ltg")
 
     def _init_lttable(self):
         table_name = self.db.join_sql("left outer",
@@ -848,18 +1937,10 @@ class LogDB():
             self.lttable.restore_lt(ltid, ltgid, ltw, lts, count)
 
     def count_lt(self):
-        table_name = "lt"
-        l_key = ["count(*)"]
-        sql = self.db.select_sql(table_name, l_key)
-        cursor = self.db.execute(sql)
-        return int(cursor.fetchone()[0])
+        return self._get_stat("count_lt")
 
     def count_ltg(self):
-        table_name = "ltg"
-        l_key = ["max(ltgid)"]
-        sql = self.db.select_sql(table_name, l_key)
-        cursor = self.db.execute(sql)
-        return int(cursor.fetchone()[0]) + 1
+        return self._get_stat("count_ltg")
 
     def iter_ltg_def(self):
         table_name = "ltg"
@@ -891,6 +1972,7 @@ class LogDB():
     def reset_ltg(self):
         sql = self.db.delete_sql("ltg")
         self.db.execute(sql)
+        self._update_stat("count_ltg", lambda v: 0)
 
     def _init_area(self):
         if self.areafn is None or self.areafn == "":
@@ -982,6 +2064,149 @@ class RestoreOriginalData(object):
                 f.write("\n".join(l_buf))
 
 
+class IngestStats(object):
+    """Per-stage timers and counters of adding log messages to DB.
+
+    Timers are set by replacing methods of the processing objects
+    with timing wrappers, so nothing is added to the processing
+    if this class is not used.
+
+    Stages:
+        read: reading lines from files
+        parse: log2seq parsing (including read in parallel parsing)
+        host: host alias resolution
+        ltgen: template generation (LTGen.process_line)
+        post: post-process of templates (LTPostProcess)
+        ltgroup: template grouping (LTGroup.add)
+        insert: adding messages to DB (LogDB.add_line)
+        commit: commit of DB and template data
+    """
+
+    l_stage = ("read", "parse", "host", "ltgen", "post", "ltgroup",
+               "insert", "commit")
+
+    def __init__(self, interval = 0, output = None):
+        """
+        Args:
+            interval (int): Report in log every given number of lines.
+                If 0, only report at the end.
+            output (Optional[str]): Filepath to dump JSON summary.
+        """
+        self._interval = interval
+        self._output = output
+        self._d_time = defaultdict(float)
+        self._d_call = defaultdict(int)
+        self._start = time.time()
+        self._ld = None
+        self._init_lt = 0
+        self._init_ltg = 0
+        self.lines = 0
+        self.added = 0
+
+    def wrap(self, obj, name, stage):
+        """Measure calls of a method of obj as a stage."""
+        func = getattr(obj, name)
+        d_time = self._d_time
+        d_call = self._d_call
+
+        def _wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                d_time[stage] += time.perf_counter() - start
+                d_call[stage] += 1
+
+        setattr(obj, name, _wrapper)
+
+    def iter_timed(self, iterable, stage):
+        """Measure generation of items of iterable as a stage."""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._d_time[stage] += time.perf_counter() - start
+            self._d_call[stage] += 1
+            yield item
+
+    def attach(self, ld):
+        """Measure stages in LogData (with initialized LTManager)."""
+        self._ld = ld
+        self._init_lt = len(ld.lttable)
+        self._init_ltg = self._count_ltg()
+        self.wrap(ld.ltm.ltgen, "process_line", "ltgen")
+        self.wrap(ld.ltm.ltspl, "replace_variable", "post")
+        self.wrap(ld.ltm.ltspl, "search", "post")
+        self.wrap(ld.ltm.ltgroup, "add", "ltgroup")
+        self.wrap(ld.db, "add_line", "insert")
+        self.wrap(ld, "commit_db", "commit")
+
+    def _count_ltg(self):
+        return len(set(lt.ltgid for lt in self._ld.lttable))
+
+    def count(self, added):
+        self.lines += 1
+        if added:
+            self.added += 1
+        if self._interval > 0 and self.lines % self._interval == 0:
+            self.report()
+
+    def summary(self):
+        """dict: Current values of counters and timers."""
+        elapsed = time.time() - self._start
+        d = {"lines" : self.lines,
+             "added" : self.added,
+             "elapsed" : elapsed,
+             "lines_per_sec" : self.lines / elapsed if elapsed > 0 else 0.,
+             "stages" : {}}
+        total = 0.
+        for stage in self.l_stage:
+            total += self._d_time[stage]
+            d["stages"][stage] = {
+                "time" : self._d_time[stage],
+                "calls" : self._d_call[stage],
+                "share" : self._d_time[stage] / elapsed if elapsed > 0 else 0.}
+        d["stages"]["other"] = {
+            "time" : elapsed - total, "calls" : 0,
+            "share" : (elapsed - total) / elapsed if elapsed > 0 else 0.}
+        if self._ld is not None:
+            d["new_templates"] = len(self._ld.lttable) - self._init_lt
+            d["new_groups"] = self._count_ltg() - self._init_ltg
+        return d
+
+    def report(self):
+        d = self.summary()
+        buf = ["{0} lines ({1} added), {2:.1f} lines/sec".format(
+            d["lines"], d["added"], d["lines_per_sec"])]
+        if "new_templates" in d:
+            buf.append("{0} new templates, {1} new groups".format(
+                d["new_templates"], d["new_groups"]))
+        buf.append(", ".join("{0} {1:.1%}".format(stage, val["share"])
+                             for stage, val in d["stages"].items()
+                             if val["time"] > 0))
+        _logger.info("ingest stats: " + "; ".join(buf))
+
+    def close(self):
+        """Report final values, and dump them in JSON if required."""
+        self.report()
+        if self._output:
+            with open(self._output, "w") as f:
+                json.dump(self.summary(), f, indent = 2)
+
+
+def _init_ingest_stats(conf):
+    interval = conf.getint("database", "stats_interval")
+    output = conf.get("database", "stats_output")
+    if interval > 0 or output:
+        return IngestStats(interval, output)
+    else:
+        return None
+
+
 def _load_log2seq(conf):
     fp = conf.get("database", "parser_script")
     if len(fp.strip()) == 0:
@@ -991,8 +2216,18 @@ def _load_log2seq(conf):
         return log2seq.init_parser(rules)
 
 
-def _iter_line_from_files(targets):
-    for fp in targets:
+def _iter_line_from_files(targets, start = None):
+    """Yield lines in given files and their positions.
+    A position is a tuple of the index of the file in targets
+    and the byte offset just after the line.
+
+    Args:
+        start (Optional[Tuple[int, int]]): Position to start reading.
+    """
+    start_fid, start_offset = (0, 0) if start is None else start
+    for fid, fp in enumerate(targets):
+        if fid < start_fid:
+            continue
         if os.path.isdir(fp):
             sys.stderr.write(
                     "{0} is a directory, fail to process\n".format(fp))
@@ -1001,31 +2236,31 @@ def _iter_line_from_files(targets):
         else:
             if not os.path.isfile(fp):
                 raise IOError("File {0} not found".format(fp))
-            with open(fp, 'r', encoding='utf-8') as f:
+            # read in binary to know byte offsets
+            with open(fp, 'rb') as f:
                 _logger.info("log_db processing file {0}".format(fp))
+                offset = 0
+                if fid == start_fid and start_offset > 0:
+                    f.seek(start_offset)
+                    offset = start_offset
                 for line in f:
-                    yield line
+                    offset += len(line)
+                    line = line.decode("utf-8")
+                    if line.endswith("\r\n"):
+                        line = line[:-2] + "\n"
+                    yield line, (fid, offset)
 
 
-def process_line(msg, ld, lp, ha, isnew_check = False, latest = None,
-            drop_undefhost = False, lid_header = False):
-    """Add a log message to DB.
-    
-    Args:
-        msg (str): A log message to process.
-            Line feed code will be ignored.
-        ld (LogData): An log database interface opened in edit mode.
-            Needs to initialize template classifier with ld.init_ltmanager.
-        lp (log2seq.LogParser): An open message parser.
-        latest (Optional[datetime.datetime]): If not None,
-            Ignore messages that have later timestamp than 'latest'.
+def _parse_line(msg, lp, ha, latest = None, drop_undefhost = False,
+                lid_header = False):
+    """Parse a log message into the values to add to DB.
 
     Returns:
-        LogMessage: An annotated log message instance.
-            Same as lines given with LogData.iterlines.
+        Optional[Tuple]: lid, dt, host, l_w and l_s.
+            None if the message is ignored.
+            host is None if the message is from undefined host
+            and to be dropped.
     """
-    line = None
-
     if lid_header:
         lidstr, _, msg = msg.partition(" ")
         lid = int(lidstr)
@@ -1043,7 +2278,7 @@ def process_line(msg, ld, lp, ha, isnew_check = False, latest = None,
         l_w = d["words"]
         l_s = d["symbols"]
     except KeyError:
-        _logger.debug("pass empty message {0}".format(str(l_w)))
+        _logger.debug("pass empty message {0}".format(msg))
         return None
     if len(l_w) == 0:
         _logger.debug("pass empty message {0}".format(str(l_w)))
@@ -1053,11 +2288,18 @@ def process_line(msg, ld, lp, ha, isnew_check = False, latest = None,
     #if host is None: host = org_host
     if host is None:
         #if conf.getboolean("database", "undefined_host"):
-        if drop_undefhost:
-            ld.ltm.failure_output(msg)
-            return None
-        else:
+        if not drop_undefhost:
             host = org_host
+    return lid, dt, host, l_w, l_s
+
+
+def _add_parsed_line(msg, parsed, ld):
+    if parsed is None:
+        return None
+    lid, dt, host, l_w, l_s = parsed
+    if host is None:
+        ld.ltm.failure_output(msg)
+        return None
 
     _logger.debug("Processing [{0}]".format(" ".join(l_w)))
     ltline = ld.ltm.process_line(l_w, l_s)
@@ -1067,12 +2309,198 @@ def process_line(msg, ld, lp, ha, isnew_check = False, latest = None,
         return None
     else:
         _logger.debug("Template [{0}]".format(ltline))
-        line = ld.add_line(ltline.ltid, dt, host, l_w, lid = lid)
-    return line
+        return ld.add_line(ltline.ltid, dt, host, l_w, lid = lid)
+
+
+def process_line(msg, ld, lp, ha, isnew_check = False, latest = None,
+            drop_undefhost = False, lid_header = False):
+    """Add a log message to DB.
+    
+    Args:
+        msg (str): A log message to process.
+            Line feed code will be ignored.
+        ld (LogData): An log database interface opened in edit mode.
+            Needs to initialize template classifier with ld.init_ltmanager.
+        lp (log2seq.LogParser): An open message parser.
+        latest (Optional[datetime.datetime]): If not None,
+            Ignore messages that have later timestamp than 'latest'.
+
+    Returns:
+        LogMessage: An annotated log message instance.
+            Same as lines given with LogData.iterlines.
+    """
+    parsed = _parse_line(msg, lp, ha, latest, drop_undefhost, lid_header)
+    return _add_parsed_line(msg, parsed, ld)
+
+
+# parser objects in worker processes of _iter_parsed_lines
+_worker_args = None
+
+
+def _init_parse_worker(conf, latest, drop_undefhost, lid_header):
+    global _worker_args
+    lp = _load_log2seq(conf)
+    ha = host_alias.HostAlias(conf)
+    _worker_args = (lp, ha, latest, drop_undefhost, lid_header)
+
+
+def _parse_chunk(l_msg):
+    return [_parse_line(msg, *_worker_args) for msg, _ in l_msg]
+
+
+def _iter_parsed_lines(conf, targets, latest = None, drop_undefhost = False,
+                       lid_header = False, pal = 1, chunk_size = 1000,
+                       stats = None, start = None):
+    """Yield messages in given files, their parsed values
+    (see _parse_line) and positions (see _iter_line_from_files),
+    in the same order as the files.
+    If pal > 1, messages are parsed in a pool of pal processes."""
+    if pal <= 1:
+        lp = _load_log2seq(conf)
+        ha = host_alias.HostAlias(conf)
+        iterable = _iter_line_from_files(targets, start)
+        if stats is not None:
+            stats.wrap(lp, "process_line", "parse")
+            stats.wrap(ha, "resolve_host", "host")
+            iterable = stats.iter_timed(iterable, "read")
+        for msg, pos in iterable:
+            yield msg, _parse_line(msg, lp, ha, latest, drop_undefhost,
+                                   lid_header), pos
+        return
+
+    if stats is not None:
+        # parsing in workers is measured as waiting time for the results
+        for msg, parsed, pos in stats.iter_timed(_iter_parsed_lines(
+                conf, targets, latest, drop_undefhost, lid_header,
+                pal, chunk_size, start = start), "parse"):
+            yield msg, parsed, pos
+        return
+
+    import multiprocessing
+    from collections import deque
+
+    # chunks are kept in main process to get original messages,
+    # results of imap are given in the same order as the chunks
+    q_chunk = deque()
+
+    def _iter_chunk():
+        l_msg = []
+        for msg, pos in _iter_line_from_files(targets, start):
+            l_msg.append((msg, pos))
+            if len(l_msg) >= chunk_size:
+                q_chunk.append(l_msg)
+                yield l_msg
+                l_msg = []
+        if len(l_msg) > 0:
+            q_chunk.append(l_msg)
+            yield l_msg
+
+    with multiprocessing.Pool(pal, initializer = _init_parse_worker,
+                              initargs = (conf, latest, drop_undefhost,
+                                          lid_header)) as pool:
+        for l_parsed in pool.imap(_parse_chunk, _iter_chunk()):
+            l_msg = q_chunk.popleft()
+            for (msg, pos), parsed in zip(l_msg, l_parsed):
+                yield msg, parsed, pos
+
+
+def _init_classify_worker(conf, matcher):
+    global _worker_args
+    _worker_args = (_load_log2seq(conf), host_alias.HostAlias(conf), matcher)
+
+
+def _classify_chunk(l_msg):
+    lp, ha, matcher = _worker_args
+    ret = []
+    for msg in l_msg:
+        try:
+            parsed = _parse_line(msg, lp, ha)
+        except log2seq.LogParseFailure:
+            parsed = None
+        if parsed is None:
+            ret.append(None)
+        else:
+            ret.append(matcher.match(parsed[3]))
+    return ret
+
+
+def classify_files(conf, targets, output = None, pal = 1,
+                   chunk_size = 1000):
+    """Classify log messages in files with existing templates in DB.
+    Nothing is written in DB.
+
+    Args:
+        conf (config.ExtendedConfigParser): A common configuration object.
+        targets (List[str]): A sequence of filepaths to process.
+        output (Optional[str]): Filepath to output ltid of each message
+            in a line ("-" if no template matches).
+            If None, output to stdout.
+        pal (Optional[int]): Number of processes to classify messages.
+
+    Returns:
+        Tuple[int, int]: Numbers of messages and unmatched messages.
+    """
+    from . import lt_misc
+
+    ld = LogData(conf)
+    sym = conf.get("log_template", "variable_symbol")
+    matcher = lt_misc.LTMatcher.from_templates(ld.iter_lt(), sym)
+    del ld
+
+    def _iter_chunk():
+        l_msg = []
+        for msg, _ in _iter_line_from_files(targets):
+            l_msg.append(msg)
+            if len(l_msg) >= chunk_size:
+                yield l_msg
+                l_msg = []
+        if len(l_msg) > 0:
+            yield l_msg
+
+    cnt = 0
+    miss = 0
+    f = sys.stdout if output is None else open(output, 'w')
+    try:
+        if pal <= 1:
+            _init_classify_worker(conf, matcher)
+            iterable = (_classify_chunk(l_msg) for l_msg in _iter_chunk())
+            pool = None
+        else:
+            import multiprocessing
+            pool = multiprocessing.Pool(pal,
+                                        initializer = _init_classify_worker,
+                                        initargs = (conf, matcher))
+            iterable = pool.imap(_classify_chunk, _iter_chunk())
+        for l_ltid in iterable:
+            for ltid in l_ltid:
+                if ltid is None:
+                    miss += 1
+                    f.write("-\n")
+                else:
+                    f.write("{0}\n".format(ltid))
+            cnt += len(l_ltid)
+        if pool is not None:
+            pool.close()
+            pool.join()
+    finally:
+        if output is not None:
+            f.close()
+    _logger.info("lt-classify: {0} messages, {1} not matched".format(
+        cnt, miss))
+    return cnt, miss
+
+
+def _use_bulk_load(conf, bulk, reset_db):
+    if bulk is None:
+        bulk = conf.getboolean("database", "bulk_load")
+    if bulk and not reset_db:
+        _logger.warning("bulk load mode is only for new DB, ignored")
+        return False
+    return bulk
 
 
 def process_files(conf, targets, reset_db, isnew_check = False,
-                  lid_header = False):
+                  lid_header = False, bulk = None, pal = 1):
     """Add log messages to DB from files.
 
     Args:
@@ -1082,86 +2510,524 @@ def process_files(conf, targets, reset_db, isnew_check = False,
             False otherwise. 
         isnew_check (Optional[bool]): If True, add message to DB
             only if its timestamp is newest of existing messages in DB.
+        bulk (Optional[bool]): If True, use bulk load mode
+            (only for new DB). Defaults to database.bulk_load.
+        pal (Optional[int]): Number of processes to parse messages.
+            Template generation and DB writing are in the main process,
+            so the results are the same as pal = 1.
+
+    Note:
+        If database.commit_interval_lines or commit_interval_sec
+        is given, the DB is committed periodically with a checkpoint.
+        Use resume_files to continue the processing after a failure.
+        Otherwise in bulk load mode, messages added before a failure
+        are committed without templates, so remake the DB.
 
     Raises:
         IOError: If a file in targets not found.
     """
     ld = LogData(conf, edit = True, reset_db = reset_db)
     ld.init_ltmanager()
-    lp = _load_log2seq(conf)
     #lp = logsplit.LogSplit(conf)
     #lp = logparser.LogParser(conf)
-    ha = host_alias.HostAlias(conf)
     latest = ld.dt_term()[1] if isnew_check else None
-    drop_undefhost = conf.getboolean("database", "undefined_host")
+    bulk = _use_bulk_load(conf, bulk, reset_db)
+    _add_files(conf, ld, targets, latest, lid_header, bulk, pal)
+
 
-    for line in _iter_line_from_files(targets):
-        process_line(line, ld, lp, ha, isnew_check, latest, drop_undefhost,
-                     lid_header)
+def resume_files(conf, pal = 1):
+    """Continue process_files stopped after a periodic commit,
+    from the checkpoint recorded in DB.
 
+    Args:
+        conf (config.ExtendedConfigParser): A common configuration object.
+        pal (Optional[int]): Number of processes to parse messages.
+    """
+    ld = LogData(conf, edit = True, reset_db = False)
+    cp = ld.db.get_checkpoint()
+    if cp is None:
+        _logger.warning("no checkpoint found, nothing to resume")
+        return
+    ld.init_ltmanager()
+    ld.ltm.loads(cp["ltm"])
+    options = cp["options"]
+    if options["latest"] is None:
+        latest = None
+    else:
+        latest = datetime.datetime.strptime(options["latest"],
+                                            "%Y-%m-%d %H:%M:%S.%f")
+    _logger.info("resume from {0} (offset {1}) after lid {2}".format(
+        cp["targets"][cp["fid"]], cp["offset"], cp["lid"]))
+    _add_files(conf, ld, cp["targets"], latest, options["lid_header"],
+               options["bulk"], pal, start = (cp["fid"], cp["offset"]),
+               last_lid = cp["lid"])
+
+
+def _add_files(conf, ld, targets, latest, lid_header, bulk, pal,
+               start = None, last_lid = None):
+    drop_undefhost = conf.getboolean("database", "undefined_host")
+    cp_lines = conf.getint("database", "commit_interval_lines")
+    cp_sec = conf.getfloat("database", "commit_interval_sec")
+    checkpoint = cp_lines > 0 or cp_sec > 0
+    if latest is None:
+        str_latest = None
+    else:
+        str_latest = latest.strftime("%Y-%m-%d %H:%M:%S.%f")
+    options = {"latest" : str_latest,
+               "lid_header" : lid_header,
+               "bulk" : bulk}
+    stats = _init_ingest_stats(conf)
+    if stats is not None:
+        stats.attach(ld)
+
+    cnt = 0
+    last_commit = time.time()
+    if bulk:
+        ld.db.start_bulk_load()
+    try:
+        for msg, parsed, pos in _iter_parsed_lines(conf, targets, latest,
+                                                   drop_undefhost, lid_header,
+                                                   pal = pal, stats = stats,
+                                                   start = start):
+            ret = _add_parsed_line(msg, parsed, ld)
+            if stats is not None:
+                stats.count(ret is not None)
+            if checkpoint:
+                if ret is not None:
+                    last_lid = ret.lid
+                cnt += 1
+                if (cp_lines > 0 and cnt >= cp_lines) or \
+                        (cp_sec > 0 and time.time() - last_commit >= cp_sec):
+                    fid, offset = pos
+                    ld.ltm.flush_count()
+                    ld.db.set_checkpoint(targets, fid, offset, last_lid,
+                                         options, ld.ltm.dumps())
+                    ld.commit_db()
+                    cnt = 0
+                    last_commit = time.time()
+    except BaseException:
+        if checkpoint:
+            # keep DB at the last checkpoint, finished in resume_files
+            ld.db.rollback()
+            bulk = False
+        elif bulk:
+            _logger.warning("interrupted in bulk load mode, messages added "
+                            "so far are committed with rebuilt index "
+                            "(templates and their counts are not saved)")
+        raise
+    finally:
+        if bulk:
+            ld.db.end_bulk_load()
+
+    if checkpoint:
+        ld.db.clear_checkpoint()
     ld.commit_db()
+    if stats is not None:
+        stats.close()
+    _log_cache_stats(ld)
+
+
+def _log_cache_stats(ld):
+    if ld.ltm is not None and ld.ltm.cache_hit + ld.ltm.cache_miss > 0:
+        _logger.info("template cache: {hit} hit, {miss} miss "
+                     "(hit rate {hit_rate:.1%}), {size} cached".format(
+                         **ld.ltm.cache_stats()))
+
+
+class FileFollower(object):
+    """Read lines appended to growing files, like tail -F.
+
+    A file renamed (e.g., by logrotate) is read to the end,
+    and then the new file in the same path is read from the head.
+    A truncated file is read again from the head.
+    A line without line feed is kept until it is completed.
+    """
+
+    def __init__(self, targets, from_start = False, read_size = 65536,
+                 max_read = 1048576, max_line_size = 1048576):
+        """
+        Args:
+            targets (List[str]): Filepaths to follow.
+            from_start (Optional[bool]): If True, read existing lines
+                in the files first. Otherwise, only read appended lines.
+            read_size (Optional[int]): Bytes to read at once.
+            max_read (Optional[int]): Max bytes read from a file in a poll.
+            max_line_size (Optional[int]): Longer line is split
+                to bound memory usage.
+        """
+        self._read_size = read_size
+        self._max_read = max_read
+        self._max_line_size = max_line_size
+        self._d_state = {}
+        for fp in targets:
+            self._d_state[fp] = {"file" : None, "id" : None, "buf" : b""}
+            self._open(fp, from_start)
+
+    def _open(self, fp, from_start):
+        state = self._d_state[fp]
+        try:
+            f = open(fp, 'rb')
+        except FileNotFoundError:
+            _logger.warning("{0} not found, wait for creation".format(fp))
+            return False
+        st = os.fstat(f.fileno())
+        if not from_start:
+            f.seek(0, os.SEEK_END)
+        state["file"] = f
+        state["id"] = (st.st_dev, st.st_ino)
+        state["buf"] = b""
+        _logger.info("follow file {0}".format(fp))
+        return True
+
+    def _close(self, fp):
+        state = self._d_state[fp]
+        l_line = []
+        if len(state["buf"]) > 0:
+            # the last line of the old file
+            l_line.append(state["buf"])
+        state["file"].close()
+        state["file"] = None
+        state["id"] = None
+        state["buf"] = b""
+        return l_line
+
+    def _read(self, fp):
+        """Returns lines in bytes and if reached the end of file."""
+        state = self._d_state[fp]
+        f = state["file"]
+        l_line = []
+        size = 0
+        while size < self._max_read:
+            data = f.read(self._read_size)
+            if not data:
+                return l_line, True
+            size += len(data)
+            l_data = (state["buf"] + data).split(b"\n")
+            state["buf"] = l_data.pop()
+            l_line += l_data
+            if len(state["buf"]) > self._max_line_size:
+                _logger.warning("too long line in {0}, split".format(fp))
+                l_line.append(state["buf"])
+                state["buf"] = b""
+        return l_line, False
+
+    def _poll_file(self, fp):
+        state = self._d_state[fp]
+        l_line = []
+        if state["file"] is not None:
+            l_line, eof = self._read(fp)
+            if not eof:
+                return l_line
+        try:
+            st = os.stat(fp)
+        except FileNotFoundError:
+            # renamed and not created yet, or removed
+            return l_line
+        if state["file"] is None:
+            if self._open(fp, True):
+                l_line += self._read(fp)[0]
+        elif (st.st_dev, st.st_ino) != state["id"]:
+            _logger.info("{0} rotated, follow new file".format(fp))
+            l_line += self._close(fp)
+            if self._open(fp, True):
+                l_line += self._read(fp)[0]
+        elif st.st_size < state["file"].tell():
+            _logger.info("{0} truncated, read from head".format(fp))
+            state["file"].seek(0)
+            state["buf"] = b""
+            l_line += self._read(fp)[0]
+        return l_line
+
+    def poll(self):
+        """Read appended lines in the files.
+
+        Returns:
+            List[str]: Lines (without line feed) appended after
+                the last poll, at most max_read bytes from each file.
+        """
+        ret = []
+        for fp in self._d_state:
+            for line in self._poll_file(fp):
+                try:
+                    line = line.decode("utf-8")
+                except UnicodeDecodeError:
+                    _logger.warning("pass undecodable line in {0}".format(fp))
+                    continue
+                ret.append(line.rstrip("\r"))
+        return ret
+
+    def pending(self):
+        """int: Bytes in the files not read yet."""
+        ret = 0
+        for state in self._d_state.values():
+            if state["file"] is not None:
+                f = state["file"]
+                ret += max(os.fstat(f.fileno()).st_size - f.tell(), 0)
+        return ret
+
+    def close(self):
+        for state in self._d_state.values():
+            if state["file"] is not None:
+                state["file"].close()
+                state["file"] = None
+
+
+def follow_files(conf, targets, from_start = False):
+    """Add log messages appended to files to DB continuously,
+    until interrupted (SIGINT or SIGTERM).
+    New messages are committed after every poll of the files,
+    and the ingest lag and throughput are reported periodically.
+
+    Args:
+        conf (config.ExtendedConfigParser): A common configuration object.
+        targets (List[str]): A sequence of filepaths to follow.
+        from_start (Optional[bool]): If True, existing messages in the
+            files are added first. Otherwise, only appended messages.
+    """
+    import signal
+
+    poll_sec = conf.getfloat("database", "follow_poll_sec")
+    report_sec = conf.getfloat("database", "follow_report_sec")
+    drop_undefhost = conf.getboolean("database", "undefined_host")
+    ld = LogData(conf, edit = True, reset_db = False)
+    ld.init_ltmanager()
+    lp = _load_log2seq(conf)
+    ha = host_alias.HostAlias(conf)
+    stats = _init_ingest_stats(conf)
+    if stats is not None:
+        stats.attach(ld)
+        stats.wrap(lp, "process_line", "parse")
+        stats.wrap(ha, "resolve_host", "host")
+    follower = FileFollower(targets, from_start)
+
+    stop = []
+    def _stop(signum, frame):
+        stop.append(signum)
+    prev_handler = signal.signal(signal.SIGTERM, _stop)
+
+    cnt = 0
+    last_dt = None
+    last_report = time.time()
+    try:
+        while not stop:
+            l_line = follower.poll()
+            for line in l_line:
+                try:
+                    lm = process_line(line, ld, lp, ha,
+                                      drop_undefhost = drop_undefhost)
+                except log2seq.LogParseFailure:
+                    # including partial lines of rotated or too long lines
+                    _logger.debug("follow: parse failure [{0}]".format(line))
+                    ld.ltm.failure_output(line)
+                    lm = None
+                if lm is not None:
+                    last_dt = lm.dt
+                if stats is not None:
+                    stats.count(lm is not None)
+            if len(l_line) > 0:
+                ld.commit_db()
+                cnt += len(l_line)
+
+            now = time.time()
+            if now - last_report >= report_sec:
+                # lag: delay of the last added message from now
+                if last_dt is None:
+                    lag = "unknown"
+                else:
+                    # timestamps can be aware with timezone of the parser
+                    lag = "{0:.1f}".format((datetime.datetime.now(
+                        last_dt.tzinfo) - last_dt).total_seconds())
+                _logger.info("follow: {0} lines ({1:.1f} lines/sec), "
+                             "lag {2} sec, {3} bytes pending".format(
+                                 cnt, cnt / (now - last_report),
+                                 lag, follower.pending()))
+                cnt = 0
+                last_report = now
+
+            if len(l_line) == 0:
+                time.sleep(poll_sec)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        signal.signal(signal.SIGTERM, prev_handler)
+        _logger.info("follow: stopped")
+        follower.close()
+        ld.commit_db()
+        if stats is not None:
+            stats.close()
+        _log_cache_stats(ld)
+
+
+class ParsedLineSpool(object):
+    """Sequence of parsed log messages for process_init_data.
+
+    Messages are kept on memory up to given size, and spilled to
+    a temporary file in pickled chunks over the size.
+    The sequence can be iterated multiple times (and concurrently).
+
+    Args:
+        buffer_size (int): Estimated bytes of messages kept on memory.
+        dirname (Optional[str]): Directory of the temporary file.
+            If None, use the default of tempfile.
+        chunk_lines (Optional[int]): Number of messages in a chunk
+            of the temporary file, loaded on memory at once in iteration.
+    """
+
+    def __init__(self, buffer_size, dirname = None, chunk_lines = 10000):
+        self._buffer_size = buffer_size
+        self._dirname = dirname
+        self._chunk_lines = chunk_lines
+        self._buf = []
+        self._buf_size = 0
+        self._path = None
+        self._f = None
+        self._len = 0
+        self.spilled = 0 # number of messages in the temporary file
+
+    def __len__(self):
+        return self._len
+
+    @staticmethod
+    def _estimate_size(record):
+        # rough size of python objects (str and list overhead)
+        lid, dt, host, l_w, l_s = record
+        size = 200 + len(host)
+        size += sum(len(w) + 64 for w in l_w)
+        if l_s is not None:
+            size += sum(len(w) + 64 for w in l_s)
+        return size
+
+    def append(self, record):
+        """Add a message.
+
+        Args:
+            record (tuple): lid, dt, host, l_w and l_s of a message.
+        """
+        self._buf.append(record)
+        self._buf_size += self._estimate_size(record)
+        self._len += 1
+        if self._buf_size > self._buffer_size:
+            self._spill()
+
+    def _spill(self):
+        if self._f is None:
+            fd, self._path = tempfile.mkstemp(prefix = "amulog_init_",
+                                              dir = self._dirname)
+            self._f = os.fdopen(fd, "wb")
+            _logger.info("spill parsed messages to {0}".format(self._path))
+        for i in range(0, len(self._buf), self._chunk_lines):
+            pickle.dump(self._buf[i:i+self._chunk_lines], self._f,
+                        protocol = pickle.HIGHEST_PROTOCOL)
+        self.spilled += len(self._buf)
+        self._buf = []
+        self._buf_size = 0
+
+    def __iter__(self):
+        if self._f is not None:
+            self._f.flush()
+            with open(self._path, "rb") as f:
+                while True:
+                    try:
+                        chunk = pickle.load(f)
+                    except EOFError:
+                        break
+                    for record in chunk:
+                        yield record
+        for record in self._buf:
+            yield record
+
+    def lines(self):
+        """Returns an iterable of (l_w, l_s) of the messages,
+        that can be iterated multiple times."""
+        return _SpoolLines(self)
+
+    def close(self):
+        """Remove the temporary file."""
+        self._buf = []
+        if self._f is not None:
+            self._f.close()
+            os.remove(self._path)
+            self._f = None
+            self._path = None
+
+
+class _SpoolLines(object):
+
+    def __init__(self, spool):
+        self._spool = spool
+
+    def __len__(self):
+        return len(self._spool)
+
+    def __iter__(self):
+        for record in self._spool:
+            yield record[3], record[4]
 
 
 def process_init_data(conf, targets, isnew_check = False,
-                      lid_header = False):
+                      lid_header = False, bulk = None, pal = 1):
     """Add log messages to DB from files. This function do NOT process
     messages incrementally. Use this to avoid bad-start problem of
     log template generation with clustering or training methods.
 
     Note:
-        This function needs large memory space.
+        Parsed messages are kept on memory up to
+        database.init_buffer_size, and others are spilled to
+        a temporary file (see ParsedLineSpool).
 
     Args:
         conf (config.ExtendedConfigParser): A common configuration object.
         targets (List[str]): A sequence of filepaths to process.
         isnew_check (Optional[bool]): If True, add message to DB
             only if its timestamp is newest of existing messages in DB.
+        bulk (Optional[bool]): If True, use bulk load mode.
+            Defaults to database.bulk_load.
+        pal (Optional[int]): Number of processes to parse messages.
 
     Raises:
         IOError: If a file in targets not found.
     """
     ld = LogData(conf, edit = True, reset_db = True)
     ld.init_ltmanager()
-    lp = _load_log2seq(conf)
     #lp = logsplit.LogSplit(conf)
     #lp = logparser.LogParser(conf)
-    ha = host_alias.HostAlias(conf)
     latest = ld.dt_term()[1] if isnew_check else None
     drop_undefhost = conf.getboolean("database", "undefined_host")
+    buffer_size = conf.getint("database", "init_buffer_size") * 1024 * 1024
+    spool_dir = conf.get("database", "init_spool_dir")
+    if spool_dir == "":
+        spool_dir = None
 
-    l_line = []
-    l_data = []
-    for msg in _iter_line_from_files(targets):
-        if lid_header:
-            lidstr, _, msg = msg.partition(" ")
-            lid = int(lidstr)
-        else:
-            lid = None
-        dt, org_host, l_w, l_s = lp.process_line(msg)
-        if latest is not None and dt < latest:
-            _logger.debug(
-                "pass message with excluded timestamp {0}".format(dt))
-            continue
-        if l_w is None or len(l_w) == 0:
-            _logger.debug("pass empty message {0}".format(str(l_w)))
-            continue
-        l_w = [strutil.add_esc(w) for w in l_w]
-        host = ha.resolve_host(org_host)
-        if host is None:
-            if drop_undefhost:
-                ld.ltm.failure_output(line)
+    spool = ParsedLineSpool(buffer_size, spool_dir)
+    try:
+        for msg, parsed, _ in _iter_parsed_lines(conf, targets, latest,
+                                                 drop_undefhost, lid_header,
+                                                 pal = pal):
+            if parsed is None:
                 continue
-            else:
-                host = org_host
-
-        l_line.append((l_w, l_s))
-        l_data.append((lid, dt, host))
-
-    for ltline, line, data in zip(ld.ltm.process_init_data(l_line),
-                                  l_line, l_data):
-        l_w, l_s = line
-        lid, dt, host = data
-        ld.add_line(ltline.ltid, dt, host, l_w, lid = lid)
+            lid, dt, host, l_w, l_s = parsed
+            if host is None:
+                ld.ltm.failure_output(msg)
+                continue
+            spool.append(parsed)
+        if spool.spilled > 0:
+            _logger.info("{0} of {1} messages spilled to file".format(
+                spool.spilled, len(spool)))
+
+        bulk = _use_bulk_load(conf, bulk, True)
+        if bulk:
+            ld.db.start_bulk_load()
+        try:
+            # messages are inserted in batches of database.insert_batch_size
+            for ltline, record in zip(
+                    ld.ltm.process_init_data(spool.lines()), spool):
+                lid, dt, host, l_w, l_s = record
+                ld.add_line(ltline.ltid, dt, host, l_w, lid = lid)
+        finally:
+            if bulk:
+                ld.db.end_bulk_load()
+    finally:
+        spool.close()
 
     ld.commit_db()
 
@@ -1190,11 +3056,12 @@ def info_term(conf, top_dt, end_dt):
     s_host = set()
 
     ld = LogData(conf)
-    for line in ld.iter_lines(top_dt = top_dt, end_dt = end_dt):
-        cnt_line += 1
-        s_ltid.add(line.lt.ltid)
-        s_gid.add(line.lt.ltgid)
-        s_host.add(line.host)
+    for (host, ltid), cnt in ld.count_host_lt(top_dt = top_dt,
+                                              end_dt = end_dt).items():
+        cnt_line += cnt
+        s_ltid.add(ltid)
+        s_gid.add(ld.lt(ltid).ltgid)
+        s_host.add(host)
 
     print("[DB status] in {0} - {1}".format(top_dt, end_dt))
     print("Registered log lines : {0}".format(cnt_line))
@@ -1291,6 +3158,58 @@ def migrate(conf):
     ld.commit_db()
     
 
+def convert_db(conf, words_format = None, words_compress = None,
+               dt_format = None, host_format = None, words_store = None):
+    """Convert storage format of log messages in existing DB.
+    Arguments given None are kept as current format.
+
+    Args:
+        conf (config.ExtendedConfigParser): A common configuration object.
+        words_format (Optional[str]): text or binary.
+        words_compress (Optional[bool]): Use zlib in binary format.
+        dt_format (Optional[str]): text, epoch or epoch_us.
+        host_format (Optional[str]): text or id.
+        words_store (Optional[str]): full or variable.
+    """
+    ld = LogData(conf, edit = True)
+    ld.db.convert_format(words_format, words_compress, dt_format,
+                         host_format, words_store)
+
+
+def remake_count(conf, count_bucket = None):
+    """Rebuild the count table of messages in existing DB.
+
+    Args:
+        conf (config.ExtendedConfigParser): A common configuration object.
+        count_bucket (Optional[str]): minute, hour, day, or none to
+            remove the table. If None, use the current setting of DB.
+    """
+    ld = LogData(conf, edit = True)
+    if count_bucket == "none":
+        count_bucket = ""
+    ld.db.remake_count(count_bucket)
+
+
+def verify_stats(conf, rebuild = False):
+    """Check cached statistics of DB (number of messages, term,
+    and number of templates) in metadata table.
+
+    Args:
+        conf (config.ExtendedConfigParser): A common configuration object.
+        rebuild (bool): If True, overwrite the cache with correct values.
+    """
+    ld = LogData(conf, edit = rebuild)
+    for key, cached, calc in ld.db.verify_stats(rebuild = rebuild):
+        if cached == calc:
+            status = "ok"
+        elif rebuild:
+            status = "rebuilt"
+        else:
+            status = "mismatch"
+        print("{0} : cached {1}, actual {2} ({3})".format(
+            key, cached, calc, status))
+
+
 def remake_ltgroup(conf):
     ld = LogData(conf, edit = True)
     ld.init_ltmanager()
@@ -1308,7 +3227,7 @@ def reload_area(conf):
 def anonymize(conf):
     ld = LogData(conf, edit = True)
     d_cond = {}
-    d_update = {"words" : ""}
+    d_update = {"words" : []}
     ld.db.update_log(d_cond, d_update)
     ld.commit_db()
 
@@ -2,13 +2,20 @@
 # coding: utf-8
 
 import os
+import re
+import time
+import array
 import pickle
+import logging
 from collections import defaultdict
+from collections import OrderedDict
 
 from . import common
 from . import config
 from . import strutil
 
+_logger = logging.getLogger(__package__)
+
 
 class LTManager(object):
     """
@@ -34,6 +41,21 @@ class LTManager(object):
         self.filename = conf.get("log_template", "indata_filename")
         self._fail_fn = conf.get("log_template", "fail_output")
         self.pickle_comp = conf.get("general", "pickle_compatible")
+        self._cnt_interval = conf.getint("log_template", "count_flush_lines")
+        self._s_cnt_pending = set() # ltids with counts not written in DB
+        self._cnt_lines = 0
+        self._init_dedup = conf.getboolean("log_template", "init_dedup")
+        mask = conf.get("log_template", "init_dedup_mask")
+        if mask == "":
+            self._dedup_mask = None
+        else:
+            self._dedup_mask = re.compile(mask)
+        # LRU cache of classified word sequences in process_line
+        self._cache_size = conf.getint("log_template", "cache_size")
+        self._cache = OrderedDict() # key = tuple(l_w), val = (tid, ltid)
+        self._d_cache_keys = defaultdict(set) # key = tid, val = cache keys
+        self.cache_hit = 0
+        self.cache_miss = 0
 
         self._db = db
         self._lttable = lttable
@@ -56,13 +78,35 @@ class LTManager(object):
     def process_init_data(self, l_line):
         """
         Args:
-            lines [List[Tuple[str]]]: A sequence of lines which is
+            lines [Iterable[Tuple[str]]]: A sequence of lines which is
                     presented in a tuple of l_w and l_s.
+                    It is iterated multiple times, so it can be
+                    an iterable object but not an iterator.
         """
-        d = self.ltgen.process_init_data(l_line)
-        for mid, line in enumerate(l_line):
+        start = time.time()
+        if self._init_dedup:
+            # generate templates once for each distinct message,
+            # and give the results to all duplicated lines
+            l_distinct, weights, index = dedup_lines(l_line,
+                                                     self._dedup_mask,
+                                                     self.sym)
+            _logger.info("dedup: {0} lines into {1} distinct messages "
+                         "in {2:.2f} sec (duplicate ratio {3:.1%}, "
+                         "{4:.1f}x fewer messages to process)".format(
+                             len(index), len(l_distinct),
+                             time.time() - start,
+                             1.0 - len(l_distinct) / max(len(index), 1),
+                             len(index) / max(len(l_distinct), 1)))
+            tids = self.ltgen.process_init_data(l_distinct, weights)
+            # index is given lazily not to keep a sequence of all lines
+            iter_tid = (tids[i] for i in index)
+        else:
+            iter_tid = iter(self.ltgen.process_init_data(l_line))
+        _logger.info("template generation for init data: {0:.2f} sec".format(
+            time.time() - start))
+
+        for line, tid in zip(l_line, iter_tid):
             l_w, l_s = line
-            tid = d[mid]
             tpl = self._table[tid]
             ltw = self.ltspl.replace_variable(l_w, tpl, self.sym)
             ltid = self.ltspl.search(tid, ltw)
@@ -95,9 +139,23 @@ class LTManager(object):
                     ret.append(w)
             return ret
 
+        if self._cache_size > 0:
+            key = tuple(l_w)
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.cache_hit += 1
+                tid, ltid = self._cache[key]
+                self.ltgen.process_cached(l_w, l_s, tid)
+                self.count_lt(ltid)
+                return self._lttable[ltid]
+            self.cache_miss += 1
+
         tid, state = self.ltgen.process_line(l_w, l_s)
         if tid is None:
             return None
+        if state == LTGen.state_changed:
+            # cached lines of the edited tpl can match other lt
+            self._invalidate_cache(tid)
 
         tpl = self._table[tid]
         ltw = self.ltspl.replace_variable(l_w, tpl, self.sym)
@@ -126,9 +184,36 @@ class LTManager(object):
                 else:
                     raise AssertionError
                 ltline = self._lttable[ltid]
-    
+
+        if self._cache_size > 0:
+            self._add_cache(key, tid, ltline.ltid)
         return ltline
 
+    def _add_cache(self, key, tid, ltid):
+        self._cache[key] = (tid, ltid)
+        self._d_cache_keys[tid].add(key)
+        if len(self._cache) > self._cache_size:
+            old_key, (old_tid, _) = self._cache.popitem(last = False)
+            self._d_cache_keys[old_tid].discard(old_key)
+
+    def _invalidate_cache(self, tid = None):
+        """Remove cached lines classified into given tid.
+        If tid is None, remove all."""
+        if tid is None:
+            self._cache = OrderedDict()
+            self._d_cache_keys = defaultdict(set)
+        else:
+            for key in self._d_cache_keys.pop(tid, ()):
+                self._cache.pop(key, None)
+
+    def cache_stats(self):
+        """dict: Statistics of the cache in process_line."""
+        total = self.cache_hit + self.cache_miss
+        return {"size" : len(self._cache),
+                "hit" : self.cache_hit,
+                "miss" : self.cache_miss,
+                "hit_rate" : self.cache_hit / total if total > 0 else 0.0}
+
     def add_lt(self, l_w, l_s, cnt = 1):
         # add new lt to db and table
         ltid = self._lttable.next_ltid()
@@ -149,10 +234,25 @@ class LTManager(object):
         self._db.update_lt(ltid, l_w, l_s, cnt)
 
     def count_lt(self, ltid):
-        cnt = self._lttable[ltid].count()
-        self._db.update_lt(ltid, None, None, cnt)
+        # counts are kept in LTTable, and written in DB with flush_count
+        self._lttable[ltid].count()
+        self._s_cnt_pending.add(ltid)
+        self._cnt_lines += 1
+        if self._cnt_interval > 0 and self._cnt_lines >= self._cnt_interval:
+            self.flush_count()
+
+    def flush_count(self):
+        """Write template counts updated with count_lt into DB."""
+        if len(self._s_cnt_pending) > 0:
+            l_cnt = [(ltid, self._lttable[ltid].cnt)
+                     for ltid in self._s_cnt_pending]
+            self._db.update_lt_count(l_cnt)
+            self._s_cnt_pending = set()
+        self._cnt_lines = 0
 
     def remove_lt(self, ltid):
+        self._invalidate_cache()
+        self._s_cnt_pending.discard(ltid)
         self._lttable.remove_lt(ltid)
         self._db.remove_lt(ltid)
 
@@ -175,23 +275,31 @@ class LTManager(object):
             f.write(line + "\n")
 
     def load(self):
-        kwargs = common.pickle_comp_args(self.pickle_comp)
         with open(self.filename, 'rb') as f:
-            obj = pickle.load(f, **kwargs)
+            self.loads(f.read())
+
+    def loads(self, data):
+        """Load internal data from bytes given with dumps."""
+        kwargs = common.pickle_comp_args(self.pickle_comp)
+        obj = pickle.loads(data, **kwargs)
         table_data, ltgen_data, ltgroup_data = obj
         self._table.load(table_data)
         self.ltgen.load(ltgen_data)
         self.ltgroup.load(ltgroup_data)
 
     def dump(self):
+        with open(self.filename, 'wb') as f:
+            f.write(self.dumps())
+
+    def dumps(self):
+        """bytes: Internal data of template generation in pickle."""
         #kwargs = common.pickle_comp_args(self.pickle_comp)
         table_data = self._table.dumpobj()
         ltgen_data = self.ltgen.dumpobj()
         ltgroup_data = self.ltgroup.dumpobj()
         obj = (table_data, ltgen_data, ltgroup_data)
-        with open(self.filename, 'wb') as f:
-            pickle.dump(obj, f)
-            #pickle.dump(obj, f, **kwargs)
+        return pickle.dumps(obj)
+        #return pickle.dumps(obj, **kwargs)
 
 
 class LTTable():
@@ -199,6 +307,7 @@ class LTTable():
     def __init__(self, sym):
         self.ltdict = {}
         self.sym = sym
+        self._ids = common.IDAllocator()
 
     def __iter__(self):
         return self._generator()
@@ -217,22 +326,21 @@ class LTTable():
         return self.ltdict[key]
     
     def next_ltid(self):
-        cnt = 0
-        while cnt in self.ltdict:
-            cnt += 1 
-        else:
-            return cnt
+        return self._ids.next()
     
     def restore_lt(self, ltid, ltgid, ltw, lts, count):
         assert not ltid in self.ltdict
         self.ltdict[ltid] = LogTemplate(ltid, ltgid, ltw, lts, count, self.sym)
+        self._ids.add(ltid)
 
     def add_lt(self, ltline):
         assert not ltline.ltid in self.ltdict
         self.ltdict[ltline.ltid] = ltline
+        self._ids.add(ltline.ltid)
 
     def remove_lt(self, ltid):
         self.ltdict.pop(ltid)
+        self._ids.remove(ltid)
 
 
 class LogTemplate():
@@ -299,6 +407,7 @@ class TemplateTable():
         self._d_tpl = {} # key = tid, val = template
         self._d_rtpl = {} # key = key_template, val = tid
         self._d_cand = defaultdict(list) # key = tid, val = List[ltid]
+        self._ids = common.IDAllocator()
 
     def __str__(self):
         ret = []
@@ -320,11 +429,7 @@ class TemplateTable():
         return self._d_tpl[key]
 
     def next_tid(self):
-        cnt = 0
-        while cnt in self._d_tpl:
-            cnt += 1 
-        else:
-            return cnt
+        return self._ids.next()
 
     def tids(self):
         return self._d_tpl.keys()
@@ -348,6 +453,7 @@ class TemplateTable():
         tid = self.next_tid()
         self._d_tpl[tid] = template
         self._d_rtpl[self._key_template(template)] = tid
+        self._ids.add(tid)
         return tid
 
     def replace(self, tid, template):
@@ -361,12 +467,20 @@ class TemplateTable():
         self._d_cand[tid].append(ltid)
 
     def load(self, obj):
-        self._d_tpl, self._d_cand = obj
+        if len(obj) == 2:
+            # dumped before id allocator
+            self._d_tpl, self._d_cand = obj
+            self._ids = common.IDAllocator()
+            for tid in self._d_tpl:
+                self._ids.add(tid)
+        else:
+            self._d_tpl, self._d_cand, ids_data = obj
+            self._ids.load(ids_data)
         for tid, tpl in self._d_tpl.items():
             self._d_rtpl[self._key_template(tpl)] = tid
 
     def dumpobj(self):
-        return (self._d_tpl, self._d_cand)
+        return (self._d_tpl, self._d_cand, self._ids.dumpobj())
 
 
 class LTGen(object):
@@ -393,16 +507,25 @@ class LTGen(object):
                 self._table.replace(tid, new_tpl)
                 return self.state_changed
 
-    def process_init_data(self, lines):
+    def process_init_data(self, lines, weights = None):
         """If there is no need of special process for init phase,
         this function simply call process_line multiple times.
+
+        Args:
+            lines (Iterable[Tuple[List[str], List[str]]]): l_w and l_s
+                of the lines.
+            weights (Optional[Sequence[int]]): Multiplicity of each line
+                (see dedup_lines). Ignored in this function.
+
+        Returns:
+            Sequence[int]: tids of the lines, in the same order.
         """
-        d = {}
-        for mid, line in enumerate(lines):
+        ret = array.array("l")
+        for line in lines:
             l_w, l_s = line
             tid, state = self.process_line(l_w, l_s)
-            d[mid] = tid
-        return d
+            ret.append(tid)
+        return ret
 
     def process_line(self, l_w, l_s):
         """Estimate log template for given message.
@@ -418,6 +541,12 @@ class LTGen(object):
         """
         raise NotImplementedError
 
+    def process_cached(self, l_w, l_s, tid):
+        """Called instead of process_line for a message found in
+        the cache of LTManager (classified into tid before).
+        Override this to update internal data with the message."""
+        pass
+
     def load(self, loadobj):
         pass
 
@@ -437,13 +566,10 @@ class LTGroup(object):
     def init_dict(self):
         self.d_group = {} # key : groupid, val : [ltline, ...]
         self.d_rgroup = {} # key : ltid, val : groupid
+        self._ids = common.IDAllocator()
 
     def _next_groupid(self):
-        cnt = 0
-        while cnt in self.d_group:
-            cnt += 1
-        else:
-            return cnt
+        return self._ids.next()
 
     def add(self, ltline):
         gid = ltline.ltid
@@ -453,17 +579,24 @@ class LTGroup(object):
     def add_ltid(self, gid, ltline):
         self.d_group.setdefault(gid, []).append(ltline)
         self.d_rgroup[ltline.ltid] = gid
+        self._ids.add(gid)
 
     def restore_ltg(self, db, table):
         for ltid, ltgid in db.iter_ltg_def():
             self.d_group.setdefault(ltgid, []).append(table[ltid])
             self.d_rgroup[ltid] = ltgid
+            self._ids.add(ltgid)
 
     def load(self, loadobj):
-        pass
+        # loadobj is None in former dump without allocator
+        if loadobj is not None:
+            self._ids.load(loadobj)
+            # groups restored from DB are always in use
+            for gid in self.d_group:
+                self._ids.add(gid)
 
     def dumpobj(self):
-        return None
+        return self._ids.dumpobj()
 
 
 class LTPostProcess(object):
@@ -539,6 +672,68 @@ class VariableLabelHost(VariableLabelRule):
         return self.ha.get_group(w)
 
 
+def _dedup_key(l_w, mask, sym):
+    if mask is None:
+        return tuple(l_w)
+    else:
+        return tuple(sym if mask.fullmatch(w) else w for w in l_w)
+
+
+def dedup_lines(lines, mask = None, sym = None):
+    """Collapse lines with the same word sequence.
+
+    Only distinct messages are kept on memory, and the index of
+    every line is calculated again in iterating the lines,
+    so lines can be a sequence not on memory (e.g., ParsedLineSpool).
+
+    Args:
+        lines (Iterable[Tuple[List[str], List[str]]]): l_w and l_s
+            of the lines. It is iterated again in iterating index.
+        mask (Optional[re.Pattern]): Words fully matching this pattern are
+            replaced with sym in comparing lines, i.e., lines that differ
+            only in such words are considered duplicated.
+        sym (Optional[str]): Variable symbol to replace masked words.
+
+    Returns:
+        l_distinct (List[Tuple[List[str], List[str]]]): The first line
+            of each distinct message.
+        weights (Sequence[int]): Number of lines of each distinct message.
+        index (Iterable[int]): Index in l_distinct of every given line.
+    """
+    d_key = {}
+    l_distinct = []
+    weights = array.array("l")
+    num = 0
+    for line in lines:
+        key = _dedup_key(line[0], mask, sym)
+        idx = d_key.get(key)
+        if idx is None:
+            d_key[key] = len(l_distinct)
+            l_distinct.append(line)
+            weights.append(1)
+        else:
+            weights[idx] += 1
+        num += 1
+    return l_distinct, weights, _DedupIndex(lines, d_key, mask, sym, num)
+
+
+class _DedupIndex(object):
+
+    def __init__(self, lines, d_key, mask, sym, num):
+        self._lines = lines
+        self._d_key = d_key
+        self._mask = mask
+        self._sym = sym
+        self._num = num
+
+    def __len__(self):
+        return self._num
+
+    def __iter__(self):
+        for line in self._lines:
+            yield self._d_key[_dedup_key(line[0], self._mask, self._sym)]
+
+
 def init_ltgen(conf, table, method = None):
     if method is None:
         lt_alg = conf.get("log_template", "lt_alg")
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Daemon to classify log messages with log templates in DB,
+answering requests over a Unix domain socket.
+
+Protocol:
+    Requests and responses are JSON objects, each framed with
+    4 bytes of length (big endian, unsigned) followed by UTF-8 data.
+    A connection can send any number of requests in sequence.
+
+    {"op": "classify", "lines": [str, ...]}
+        -> {"results": [{"ltid": int, "ltgid": int, "template": str}
+                        or null, ...]}
+    {"op": "lookup", "ltids": [int, ...]}
+        -> {"results": [{"ltid": int, "ltgid": int, "template": str,
+                         "count": int} or null, ...]}
+    {"op": "stats"}
+        -> {"requests": int, "lines": int, "miss": int, "learn": bool,
+            "cache": {"size": int, "hit": int, "miss": int,
+                      "hit_rate": float} (only in learning mode)}
+    Errors are returned as {"error": str}.
+"""
+
+import os
+import json
+import socket
+import struct
+import signal
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import log2seq
+
+from . import log_db
+from . import lt_misc
+from . import host_alias
+
+_logger = logging.getLogger(__package__)
+
+HEADER = struct.Struct(">I")
+
+
+def _encode_frame(obj):
+    data = json.dumps(obj).encode("utf-8")
+    return HEADER.pack(len(data)) + data
+
+
+class LTDaemon(object):
+    """Classify log messages with resident LogData and parser.
+
+    In read-only mode (default), messages are matched to existing
+    templates (lt_misc.LTMatcher) and nothing is written in DB.
+    In learning mode, messages are processed with LTManager, so that
+    new templates are generated and committed into DB.
+    The processing runs in a worker thread not to block other clients,
+    and DB connection is available only in the thread.
+    """
+
+    def __init__(self, conf, learn = None, socket_path = None):
+        self.conf = conf
+        if learn is None:
+            learn = conf.getboolean("lt_daemon", "learn")
+        if socket_path is None:
+            socket_path = conf.get("lt_daemon", "socket_path")
+        self.learn = learn
+        self.socket_path = socket_path
+        self._max_size = conf.getint("lt_daemon", "max_request_size")
+
+        if learn:
+            self._executor = ThreadPoolExecutor(max_workers = 1)
+            self._ld = None
+            self._executor.submit(self._open_db).result()
+            self._matcher = None
+        else:
+            self._executor = None
+            self._ld = log_db.LogData(conf)
+            sym = conf.get("log_template", "variable_symbol")
+            self._matcher = lt_misc.LTMatcher.from_templates(
+                self._ld.iter_lt(), sym)
+        self._lp = log_db._load_log2seq(conf)
+        self._ha = host_alias.HostAlias(conf)
+        self._stop = None
+
+        self.requests = 0
+        self.lines = 0
+        self.miss = 0
+
+    def _open_db(self):
+        self._ld = log_db.LogData(self.conf, edit = True)
+        self._ld.init_ltmanager()
+
+    def _close_db(self):
+        self._ld.commit_db()
+        self._ld = None
+
+    @staticmethod
+    def _lt_info(lt):
+        return {"ltid" : lt.ltid, "ltgid" : lt.ltgid, "template" : str(lt)}
+
+    def _classify_line(self, line):
+        try:
+            parsed = log_db._parse_line(line, self._lp, self._ha)
+        except log2seq.LogParseFailure:
+            return None
+        if parsed is None:
+            return None
+        _, _, _, l_w, l_s = parsed
+        if self.learn:
+            return self._ld.ltm.process_line(l_w, l_s)
+        else:
+            ltid = self._matcher.match(l_w)
+            if ltid is None:
+                return None
+            return self._ld.lttable[ltid]
+
+    def classify(self, lines):
+        ret = []
+        for line in lines:
+            lt = self._classify_line(line)
+            if lt is None:
+                self.miss += 1
+                ret.append(None)
+            else:
+                ret.append(self._lt_info(lt))
+        self.lines += len(lines)
+        if self.learn:
+            self._ld.commit_db()
+        return ret
+
+    def lookup(self, ltids):
+        ret = []
+        for ltid in ltids:
+            if ltid in self._ld.lttable.ltdict:
+                lt = self._ld.lttable[ltid]
+                d = self._lt_info(lt)
+                d["count"] = lt.cnt
+                ret.append(d)
+            else:
+                ret.append(None)
+        return ret
+
+    def handle(self, request):
+        """Process a request object, and returns the response object."""
+        self.requests += 1
+        if not isinstance(request, dict):
+            return {"error" : "invalid request (not an object)"}
+        op = request.get("op")
+        if op == "classify":
+            return {"results" : self.classify(request["lines"])}
+        elif op == "lookup":
+            return {"results" : self.lookup(request["ltids"])}
+        elif op == "stats":
+            ret = {"requests" : self.requests, "lines" : self.lines,
+                   "miss" : self.miss, "learn" : self.learn}
+            if self.learn:
+                ret["cache"] = self._ld.ltm.cache_stats()
+            return ret
+        else:
+            return {"error" : "invalid op {0}".format(op)}
+
+    async def _handle_conn(self, reader, writer):
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(HEADER.size)
+                except asyncio.IncompleteReadError:
+                    break
+                length = HEADER.unpack(header)[0]
+                if length > self._max_size:
+                    writer.write(_encode_frame(
+                        {"error" : "too large request"}))
+                    break
+                data = await reader.readexactly(length)
+                try:
+                    request = json.loads(data.decode("utf-8"))
+                    if self._executor is None:
+                        response = self.handle(request)
+                    else:
+                        response = await asyncio.get_running_loop(
+                            ).run_in_executor(self._executor, self.handle,
+                                              request)
+                except (ValueError, KeyError, TypeError) as e:
+                    response = {"error" : "invalid request ({0})".format(e)}
+                writer.write(_encode_frame(response))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            _logger.warning("lt-daemon: connection error ({0})".format(e))
+        finally:
+            writer.close()
+
+    async def serve(self):
+        """Answer requests until stop is called."""
+        self._stop = asyncio.Event()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        server = await asyncio.start_unix_server(self._handle_conn,
+                                                 path = self.socket_path)
+        _logger.info("lt-daemon: listen {0} ({1} mode)".format(
+            self.socket_path, "learning" if self.learn else "read-only"))
+        try:
+            await self._stop.wait()
+        finally:
+            server.close()
+            await server.wait_closed()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            if self._executor is not None:
+                await asyncio.get_running_loop().run_in_executor(
+                    self._executor, self._close_db)
+                self._executor.shutdown()
+            _logger.info("lt-daemon: stopped ({0} requests, {1} lines, "
+                         "{2} miss)".format(self.requests, self.lines,
+                                            self.miss))
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+
+    def run(self):
+        """Run serve until SIGINT or SIGTERM."""
+        async def _main():
+            loop = asyncio.get_running_loop()
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(signum, self.stop)
+            await self.serve()
+
+        asyncio.run(_main())
+
+
+class Client(object):
+    """Client of LTDaemon.
+
+    Example:
+        with Client("lt_daemon.sock") as client:
+            for result in client.classify(lines):
+                ...
+    """
+
+    def __init__(self, socket_path):
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.connect(socket_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._sock.close()
+
+    def _recv(self, size):
+        buf = bytearray()
+        while len(buf) < size:
+            data = self._sock.recv(size - len(buf))
+            if not data:
+                raise ConnectionError("connection closed by lt-daemon")
+            buf += data
+        return bytes(buf)
+
+    def request(self, obj):
+        """Send a request object and returns the response object."""
+        self._sock.sendall(_encode_frame(obj))
+        length = HEADER.unpack(self._recv(HEADER.size))[0]
+        response = json.loads(self._recv(length).decode("utf-8"))
+        if "error" in response:
+            raise ValueError(response["error"])
+        return response
+
+    def classify(self, lines):
+        """List[Optional[dict]]: Templates of given log message lines,
+        None for messages without available templates."""
+        return self.request({"op" : "classify", "lines" : lines})["results"]
+
+    def lookup(self, ltids):
+        """List[Optional[dict]]: Templates of given ltids."""
+        return self.request({"op" : "lookup", "ltids" : ltids})["results"]
+
+    def stats(self):
+        return self.request({"op" : "stats"})
@@ -152,6 +152,72 @@ class LTSearchTree():
             return node.get_ltid()
 
 
+class LTMatcher():
+
+    """Read-only matcher of log messages to existing log templates.
+    Templates are compiled into tries of words for each number of words,
+    and a message is matched with the same rule as LTSearchTree
+    (description words are preferred to variables with backtracking).
+    Nodes are plain lists, so that the matcher is fast and picklable
+    (e.g., to be sent to worker processes).
+    """
+
+    def __init__(self, sym):
+        self.sym = sym
+        self._d_root = {} # number of words -> trie root
+
+    @staticmethod
+    def _new_node():
+        # [words -> child node, variable child node, ltid]
+        return [{}, None, None]
+
+    @classmethod
+    def from_templates(cls, iterable, sym):
+        """Make a matcher from LogTemplate objects
+        (e.g., LogData.iter_lt())."""
+        matcher = cls(sym)
+        for lt in iterable:
+            matcher.add(lt.ltid, lt.ltw)
+        return matcher
+
+    def add(self, ltid, ltw):
+        if not len(ltw) in self._d_root:
+            self._d_root[len(ltw)] = self._new_node()
+        node = self._d_root[len(ltw)]
+        for w in ltw:
+            if w == self.sym:
+                if node[1] is None:
+                    node[1] = self._new_node()
+                node = node[1]
+            else:
+                if not w in node[0]:
+                    node[0][w] = self._new_node()
+                node = node[0][w]
+        node[2] = ltid
+
+    def match(self, l_w):
+        """Optional[int]: ltid of the template of given message words,
+        or None if no template matches."""
+        length = len(l_w)
+        root = self._d_root.get(length)
+        if root is None:
+            return None
+        stack = [(root, 0)]
+        while stack:
+            node, i = stack.pop()
+            if i == length:
+                if node[2] is not None:
+                    return node[2]
+                continue
+            # variable is tried after description word (stack)
+            if node[1] is not None:
+                stack.append((node[1], i + 1))
+            child = node[0].get(l_w[i])
+            if child is not None:
+                stack.append((child, i + 1))
+        return None
+
+
 class LTSearchTreeNode():
 
     def __init__(self, parent, word):
@@ -13,12 +13,35 @@ Do NOT edit log templates manually if you still have unprocessed log data.
 
 import sys
 import logging
+import functools
 import numpy
 
 from . import config
 from . import lt_common
 
 _logger = logging.getLogger(__package__)
+VECTOR_SIZE = 26 + 26 + 2 # A-Z, a-z, digit, symbol
+
+
+def word_vector(w):
+    """numpy.ndarray: Normalized vector of character counts of a word
+    (used in LTGenSHISO.seq_ratio). Non-ascii letters are symbols."""
+    l_cnt = [0.0] * VECTOR_SIZE
+    for c in w:
+        if "A" <= c <= "Z":
+            l_cnt[ord(c) - 65] += 1.0
+        elif "a" <= c <= "z":
+            l_cnt[ord(c) - 97 + 26] += 1.0
+        elif c.isdigit():
+            l_cnt[-2] += 1.0
+        else:
+            l_cnt[-1] += 1.0
+    vec = numpy.array(l_cnt)
+    deno = numpy.linalg.norm(vec)
+    if deno > 0:
+        vec /= deno
+    vec.setflags(write = False)
+    return vec
 
 
 class LTGenNode():
@@ -39,11 +62,15 @@ class LTGenNode():
 
 class LTGenSHISO(lt_common.LTGen):
 
-    def __init__(self, table, sym, threshold, max_child):
+    def __init__(self, table, sym, threshold, max_child,
+                 cache_size = 100000):
         super(LTGenSHISO, self).__init__(table, sym)
         self._n_root = LTGenNode()
         self.threshold = threshold
         self.max_child = max_child
+        self._word_vector = functools.lru_cache(maxsize = cache_size)(
+            word_vector)
+        self._d_tpl_matrix = {} # key = tid, val = (tpl, matrix, mask)
 
     def load(self, loadobj):
         self._n_root = loadobj
@@ -53,12 +80,17 @@ class LTGenSHISO(lt_common.LTGen):
 
     def process_line(self, l_w, l_s):
         n_parent = self._n_root
+        mat, mask = self._word_matrix(l_w)
         while True:
             for n_child in n_parent:
                 _logger.debug(
                         "comparing with tid {0}".format(n_child.tid))
                 nc_tpl = self._table[n_child.tid]
-                sr = self.seq_ratio(nc_tpl, l_w)
+                if len(nc_tpl) == len(l_w):
+                    sr = self._seq_ratio_matrix(
+                        *(self._tpl_matrix(n_child.tid) + (mat, mask)))
+                else:
+                    sr = 0.0
                 _logger.debug("seq_ratio : {0}".format(sr))
                 if sr >= self.threshold:
                     _logger.debug(
@@ -85,58 +117,41 @@ class LTGenSHISO(lt_common.LTGen):
                     _logger.debug("go down to node(tid {0})".format(
                             n_parent.tid))
 
-    def seq_ratio(self, m1, m2):
-
-        #def c_coordinate(w):
-        #    # retrun vector of characters of word
-        #    # 4 demension : upper-case, lower-case, digit, symbol(others)
-        #    l_cnt = [0.0 for i in range(4)]
-        #    for c in w:
-        #        if c.islower():
-        #            l_cnt[0] += 1.0
-        #        elif c.isupper():
-        #            l_cnt[1] += 1.0
-        #        elif c.isdigit():
-        #            l_cnt[2] += 1.0
-        #        else:
-        #            l_cnt[3] += 1.0
-        #    deno = numpy.linalg.norm(l_cnt)
-        #    return [1.0 * e / deno for e in l_cnt]
-
-        def c_coordinate(w):
-            l_cnt = [0.0 for i in range(26 + 26 + 2)] # A-Z, a-z, digit, symbol
-            for c in w:
-                if c.isupper():
-                    ind = ord(c) - 65
-                    l_cnt[ind] += 1.0
-                elif c.islower():
-                    ind = ord(c) - 97
-                    l_cnt[ind + 26] += 1.0
-                elif c.isdigit():
-                    l_cnt[-2] += 1.0
-                else:
-                    l_cnt[-1] += 1.0
-            deno = numpy.linalg.norm(l_cnt)
-            return [1.0 * e / deno for e in l_cnt]
-
-        if len(m1) == len(m2):
-            length = len(m1)
-            if length == 0:
-                return 1.0
-
-            sum_dist = 0.0
-            for w1, w2 in zip(m1, m2):
-                if w1 == self._sym or w2 == self._sym:
-                    pass
-                else:
-                    c_w1 = c_coordinate(w1)
-                    c_w2 = c_coordinate(w2)
-                    dist = sum([numpy.power(e1 - e2, 2)
-                            for e1, e2 in zip(c_w1, c_w2)])
-                    sum_dist += dist
-            return 1.0 - (sum_dist / (2.0 * length))
+    def _word_matrix(self, l_w):
+        # character vectors of words (len x VECTOR_SIZE),
+        # and mask of variable words
+        if len(l_w) == 0:
+            mat = numpy.zeros((0, VECTOR_SIZE))
         else:
+            mat = numpy.array([self._word_vector(w) for w in l_w])
+        mask = numpy.array([w == self._sym for w in l_w], dtype = bool)
+        return mat, mask
+
+    def _tpl_matrix(self, tid):
+        # word matrix of a template, remade when the template is replaced
+        tpl = self._table[tid]
+        cache = self._d_tpl_matrix.get(tid)
+        if cache is None or cache[0] is not tpl:
+            cache = (tpl,) + self._word_matrix(tpl)
+            self._d_tpl_matrix[tid] = cache
+        return cache[1], cache[2]
+
+    @staticmethod
+    def _seq_ratio_matrix(mat1, mask1, mat2, mask2):
+        length = len(mask1)
+        if length != len(mask2):
+            return 0.0
+        if length == 0:
+            return 1.0
+        valid = ~(mask1 | mask2)
+        sum_dist = ((mat1[valid] - mat2[valid]) ** 2).sum()
+        return 1.0 - (sum_dist / (2.0 * length))
+
+    def seq_ratio(self, m1, m2):
+        if len(m1) != len(m2):
             return 0.0
+        return self._seq_ratio_matrix(*(self._word_matrix(m1) +
+                                        self._word_matrix(m2)))
 
     def equal(self, m1, m2):
         if len(m1) == len(m2):
@@ -187,8 +202,11 @@ class LTGroupSHISO(lt_common.LTGroup):
             assert lt_max is not None, "bad threshold for lt group lookup"
             _logger.debug("lt_max ltid : {0}".format(lt_max.ltid))
             ltw2 = lt_max.ltw
-            d = 2.0 * edit_distance(lt_new.ltw, lt_max.ltw, self._sym) / \
-                    (len(lt_new.ltw) + len(lt_max.ltw))
+            length = len(lt_new.ltw) + len(lt_max.ltw)
+            # distances over the threshold are not needed exactly
+            max_dist = int(self.th_distance * length / 2.0)
+            d = 2.0 * edit_distance(lt_new.ltw, lt_max.ltw, self._sym,
+                                    max_dist = max_dist) / length
             _logger.debug("edit distance ratio : {0}".format(d))
             if d < self.th_distance:
                 gid = self._mk_group(lt_new, lt_max)
@@ -241,40 +259,76 @@ class LTGroupSHISO(lt_common.LTGroup):
                 ret.append((ltline, ng))
         return ret
 
-    def load(self, obj):
-        pass
-
-    def dumpobj(self):
-        return None
-
 
 def init_ltgen_shiso(conf, table, sym):
     threshold = conf.getfloat("log_template_shiso", "ltgen_threshold")
     max_child = conf.getint("log_template_shiso", "ltgen_max_child")
-    return LTGenSHISO(table, sym, threshold, max_child)
-
-
-def edit_distance(m1, m2, sym):
-    # return levenshtein distance that allows wildcard
-
-    table = [ [0] * (len(m2) + 1) for i in range(len(m1) + 1) ]
-
-    for i in range(len(m1) + 1):
-        table[i][0] = i
-
-    for j in range(len(m2) + 1):
-        table[0][j] = j
-
-    for i in range(1, len(m1) + 1):
-        for j in range(1, len(m2) + 1):
-            if (m1[i - 1] == m2[j - 1]) or \
-                    m1[i - 1] == sym or m2[j - 1] == sym:
-                cost = 0
-            else:
-                cost = 1
-            table[i][j] = min(table[i - 1][j] + 1, table[i][ j - 1] + 1, \
-                    table[i - 1][j - 1] + cost)
-    return table[-1][-1]
+    cache_size = conf.getint("log_template_shiso", "ltgen_word_cache_size")
+    return LTGenSHISO(table, sym, threshold, max_child, cache_size)
+
+
+def edit_distance(m1, m2, sym, max_dist = None):
+    """Levenshtein distance of word sequences,
+    where sym matches any word.
+
+    Computed with the bit-parallel algorithm of Myers (in Hyyrö's
+    formulation), using python integers as bit vectors over m1.
+
+    Args:
+        m1 (List[str]): A word sequence.
+        m2 (List[str]): Another word sequence.
+        sym (Optional[str]): Variable symbol (wildcard).
+        max_dist (Optional[int]): If given, the computation stops
+            when the distance is found to be larger than max_dist,
+            and max_dist + 1 is returned.
+
+    Returns:
+        int: The edit distance.
+    """
+    len1 = len(m1)
+    len2 = len(m2)
+    if max_dist is not None and abs(len1 - len2) > max_dist:
+        return max_dist + 1
+    if len1 == 0:
+        return len2
+    if len2 == 0:
+        return len1
+
+    # bit i of d_peq[w] : m1[i] matches word w
+    mask = (1 << len1) - 1
+    wild = 0
+    d_peq = {}
+    for i, w in enumerate(m1):
+        if w == sym:
+            wild |= 1 << i
+        else:
+            d_peq[w] = d_peq.get(w, 0) | (1 << i)
+    high = 1 << (len1 - 1)
+
+    pv = mask
+    mv = 0
+    score = len1
+    for j, w in enumerate(m2):
+        if w == sym:
+            eq = mask
+        else:
+            eq = d_peq.get(w, 0) | wild
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+        # score decreases at most 1 for each remaining word
+        if max_dist is not None and score - (len2 - j - 1) > max_dist:
+            return max_dist + 1
+    return score
 
 
 #def test_ltgen(conf):
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 # coding: utf-8
 
+import array
 from collections import defaultdict
 
 from . import lt_common
@@ -30,10 +31,10 @@ class LTGenVA(lt_common.LTGen):
     def dumpobj(self):
         return self._d_wordcnt
 
-    def _add_dict(self, l_w):
-        self._d_wordcnt[None] += 1 # line count
+    def _add_dict(self, l_w, weight = 1):
+        self._d_wordcnt[None] += weight # line count
         for w in l_w:
-            self._d_wordcnt[w] += 1
+            self._d_wordcnt[w] += weight
 
     def _label(self, l_w):
         if self.method == "static":
@@ -80,13 +81,19 @@ class LTGenVA(lt_common.LTGen):
                 raise ValueError
         return ret
 
-    def process_init_data(self, lines):
-        d = {}
-        for line in lines:
-            l_w, l_s = line
-            self._add_dict(l_w)
+    def process_init_data(self, lines, weights = None):
+        ret = array.array("l")
+        if weights is None:
+            for line in lines:
+                l_w, l_s = line
+                self._add_dict(l_w)
+        else:
+            # word counts of duplicated lines
+            for line, weight in zip(lines, weights):
+                l_w, l_s = line
+                self._add_dict(l_w, weight)
 
-        for mid, line in enumerate(lines):
+        for line in lines:
             l_w, l_s = line
             l_label = self._label(l_w)
             tpl = self._label2tpl(l_w, l_label)
@@ -95,8 +102,8 @@ class LTGenVA(lt_common.LTGen):
                 tid = self._table.get_tid(tpl)
             else:
                 tid = self._table.add(tpl)
-            d[mid] = tid
-        return d
+            ret.append(tid)
+        return ret
 
     def process_line(self, l_w, l_s):
         self._add_dict(l_w)
@@ -110,6 +117,9 @@ class LTGenVA(lt_common.LTGen):
             tid = self._table.add(tpl)
             return tid, self.state_added
 
+    def process_cached(self, l_w, l_s, tid):
+        self._add_dict(l_w)
+
 
 def init_ltgen_va(conf, table, sym):
     method = conf.get("log_template_va", "method")
@@ -1,29 +1,46 @@
 #!/usr/bin/env python
 # coding: utf-8
 
+import re
+import zlib
 
 ESC_LETTER = "*@" # including back slash
 
+_d_split_re = {}
+
+
+def _split_re(spl):
+    # a word is a sequence of plain runs, escapes, or characters
+    # that do not start the splitter string
+    if spl not in _d_split_re:
+        esc_spl = re.escape(spl)
+        pattern = (r"((?:[^\\{0}]+|\\[\\{1}]|(?!{2})[\s\S])*)({2})?".format(
+            re.escape(spl[0]), re.escape(ESC_LETTER), esc_spl))
+        _d_split_re[spl] = re.compile(pattern)
+    return _d_split_re[spl]
+
+
 def split_igesc(string, spl):
-    l_esc = ["\\" + w for w in "\\" + ESC_LETTER]
-    temp_str = string
-    spl_len = len(spl)
-    temp_ww = []
+    """Split string with spl, ignoring escaped letters (see add_esc).
+
+    Args:
+        string (str): A string to split.
+        spl (str): A splitter string.
+
+    Returns:
+        List[str]: Splitted strings, escapes are kept as they are.
+    """
+    if "\\" not in string:
+        return string.split(spl)
+    match = _split_re(spl).match
     ret = []
-    while len(temp_str) >= spl_len:
-        if temp_str[0:2] in l_esc:
-            temp_ww.append(temp_str[:2])
-            temp_str = temp_str[2:]
-        elif fmatch(temp_str, spl):
-            ret.append("".join(temp_ww))
-            temp_ww = []
-            temp_str = temp_str[len(spl):]
-        else:
-            temp_ww.append(temp_str[0])
-            temp_str = temp_str[1:]
-    else:
-        ret.append("".join(temp_ww) + temp_str)
-    return ret
+    pos = 0
+    while True:
+        mo = match(string, pos)
+        ret.append(mo.group(1))
+        if mo.group(2) is None:
+            return ret
+        pos = mo.end()
 
 
 def add_esc(buf):
@@ -45,3 +62,99 @@ def fmatch(string, match):
     return string[:len(match)] == match
 
 
+
+
+# binary format of a sequence of words (used in log_db)
+# flag byte, and body (optionally zlib-compressed):
+# utf-8 string of words joined with NUL letter, or if not available
+# (empty sequence, or words including NUL), varint number of words,
+# varint lengths of words, and utf-8 string of all words concatenated
+PACK_ZLIB = 0x01
+PACK_LENGTH = 0x02
+
+
+def _pack_varint(buf, num):
+    while num >= 0x80:
+        buf.append((num & 0x7f) | 0x80)
+        num >>= 7
+    buf.append(num)
+
+
+def _unpack_varint(data, pos):
+    num = 0
+    shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        num |= (b & 0x7f) << shift
+        if b < 0x80:
+            return num, pos
+        shift += 7
+
+
+def pack_words(l_w, compress = False):
+    """Encode a sequence of words into bytes.
+
+    Args:
+        l_w (List[str]): A sequence of words.
+        compress (Optional[bool]): If True, the body is zlib-compressed
+            (only if the result is smaller).
+
+    Returns:
+        bytes
+    """
+    string = "\0".join(l_w)
+    if len(l_w) > 0 and string.count("\0") == len(l_w) - 1:
+        if not compress:
+            # flag 0 is given as a leading NUL letter
+            return ("\0" + string).encode("utf-8")
+        flag = 0
+        body = string.encode("utf-8")
+    else:
+        flag = PACK_LENGTH
+        buf = bytearray()
+        _pack_varint(buf, len(l_w))
+        for w in l_w:
+            _pack_varint(buf, len(w))
+        buf += "".join(l_w).encode("utf-8")
+        body = bytes(buf)
+    if compress:
+        zbody = zlib.compress(body)
+        if len(zbody) < len(body):
+            return bytes((flag | PACK_ZLIB,)) + zbody
+    return bytes((flag,)) + body
+
+
+def unpack_words(data):
+    """Decode bytes given by pack_words.
+
+    Args:
+        data (bytes)
+
+    Returns:
+        List[str]
+    """
+    flag = data[0]
+    if flag == 0:
+        l_w = data.decode("utf-8").split("\0")
+        del l_w[0] # leading flag
+        return l_w
+    if flag & PACK_ZLIB:
+        body = zlib.decompress(data[1:])
+    else:
+        body = data[1:]
+    if not flag & PACK_LENGTH:
+        return body.decode("utf-8").split("\0")
+
+    num, pos = _unpack_varint(body, 0)
+    l_len = []
+    for _ in range(num):
+        length, pos = _unpack_varint(body, pos)
+        l_len.append(length)
+    string = body[pos:].decode("utf-8")
+    ret = []
+    pos = 0
+    for length in l_len:
+        ret.append(string[pos:pos+length])
+        pos += length
+    return ret
@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""
+Receive syslog messages over network (UDP and TCP),
+and add them to DB with the resident log template classifier.
+
+Received messages are passed to the classifier through a bounded queue.
+If the queue is full, UDP messages are dropped, and TCP connections
+wait for the queue (backpressure).
+"""
+
+import re
+import time
+import signal
+import asyncio
+import datetime
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import log2seq
+
+from . import log_db
+from . import host_alias
+
+_logger = logging.getLogger(__package__)
+
+RE_PRI = re.compile(r"^<(\d{1,3})>")
+RE_5424 = re.compile(r"^1 (\S+) (\S+) (\S+) (\S+) (\S+) ?")
+
+
+def _skip_sd(msg):
+    # skip STRUCTURED-DATA of RFC5424 (NILVALUE or SD-ELEMENTs)
+    if msg.startswith("-"):
+        return msg[1:].lstrip(" ")
+    i = 0
+    while i < len(msg) and msg[i] == "[":
+        i += 1
+        while i < len(msg) and msg[i] != "]":
+            if msg[i] == "\\":
+                i += 1
+            i += 1
+        i += 1
+    return msg[i:].lstrip(" ")
+
+
+def syslog_to_line(msg):
+    """Convert a syslog message into a line for log2seq parser.
+
+    The PRI part is removed. RFC3164 messages are given as they are.
+    RFC5424 messages are converted into the same style as RFC3164
+    ("%Y-%m-%d %H:%M:%S HOST APP[PROCID]: MSG"), ignoring timezone
+    and STRUCTURED-DATA.
+
+    Args:
+        msg (str): A received syslog message.
+
+    Returns:
+        str: A log message line.
+    """
+    msg = msg.rstrip("\r\n\x00")
+    mo = RE_PRI.match(msg)
+    if mo is None:
+        return msg
+    msg = msg[mo.end():]
+    mo = RE_5424.match(msg)
+    if mo is None:
+        return msg
+
+    timestamp, host, app, procid, _ = mo.groups()
+    if timestamp == "-":
+        dt = datetime.datetime.now()
+    else:
+        try:
+            dt = datetime.datetime.fromisoformat(timestamp)
+        except ValueError:
+            return msg
+    body = _skip_sd(msg[mo.end():])
+    if body.startswith("\ufeff"):
+        body = body[1:]
+    if app == "-":
+        tag = ""
+    elif procid == "-":
+        tag = app + ": "
+    else:
+        tag = "{0}[{1}]: ".format(app, procid)
+    return "{0} {1} {2}{3}".format(dt.strftime("%Y-%m-%d %H:%M:%S"),
+                                  host, tag, body)
+
+
+class _UDPProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, receiver):
+        self._receiver = receiver
+
+    def datagram_received(self, data, addr):
+        self._receiver.put_nowait(data)
+
+
+class SyslogReceiver(object):
+    """Syslog server adding received messages to DB.
+    Options are given in section syslog_recv of the configuration."""
+
+    def __init__(self, conf):
+        self.conf = conf
+        self._address = conf.get("syslog_recv", "bind_address")
+        self._udp_port = self._get_port("udp_port")
+        self._tcp_port = self._get_port("tcp_port")
+        self._queue_size = conf.getint("syslog_recv", "queue_size")
+        self._batch_size = conf.getint("syslog_recv", "batch_size")
+        self._batch_wait = conf.getfloat("syslog_recv", "batch_wait_sec")
+        self._report_sec = conf.getfloat("syslog_recv", "report_sec")
+        self._drop_undefhost = conf.getboolean("database", "undefined_host")
+
+        # classification runs in 1 thread not to block receiving,
+        # and DB connection is available only in the thread
+        self._executor = ThreadPoolExecutor(max_workers = 1)
+        self._ld = None
+        self._executor.submit(self._open_db).result()
+        self._lp = log_db._load_log2seq(conf)
+        self._ha = host_alias.HostAlias(conf)
+        self._queue = None
+        self._stop = None
+        self._batch = [] # messages taken from the queue, not processed
+
+        self.received = 0
+        self.dropped = 0
+        self.failed = 0
+        self.added = 0
+
+    def _get_port(self, name):
+        val = self.conf.get("syslog_recv", name)
+        if val.strip() == "":
+            return None
+        else:
+            return int(val)
+
+    def put_nowait(self, data):
+        self.received += 1
+        try:
+            self._queue.put_nowait(data)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def _handle_tcp(self, reader, writer):
+        # newline delimited, or octet counting (RFC6587)
+        try:
+            while True:
+                head = await reader.read(1)
+                if not head:
+                    break
+                if head.isdigit():
+                    length = head + await reader.readuntil(b" ")
+                    data = await reader.readexactly(int(length[:-1]))
+                else:
+                    data = head + await reader.readline()
+                self.received += 1
+                await self._queue.put(data)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                ValueError, ConnectionError) as e:
+            _logger.warning("syslog-recv: tcp connection error ({0})".format(
+                e))
+        finally:
+            writer.close()
+
+    def _open_db(self):
+        self._ld = log_db.LogData(self.conf, edit = True, reset_db = False)
+        self._ld.init_ltmanager()
+
+    def _close_db(self):
+        self._ld.commit_db()
+        log_db._log_cache_stats(self._ld)
+        self._ld = None
+
+    def _process_batch(self, l_data):
+        added = 0
+        for data in l_data:
+            line = syslog_to_line(data.decode("utf-8", errors = "replace"))
+            try:
+                lm = log_db.process_line(line, self._ld, self._lp, self._ha,
+                                         drop_undefhost = self._drop_undefhost)
+            except log2seq.LogParseFailure:
+                _logger.debug("syslog-recv: parse failure [{0}]".format(line))
+                lm = None
+            except Exception as e:
+                _logger.error("syslog-recv: failed to add [{0}] ({1})".format(
+                    line, e))
+                lm = None
+            if lm is None:
+                self.failed += 1
+            else:
+                added += 1
+        try:
+            self._ld.commit_db()
+        except Exception as e:
+            # discard the batch, and reload templates consistent with DB
+            _logger.error("syslog-recv: failed to commit ({0}), "
+                          "{1} messages discarded".format(e, added))
+            self._ld.db.rollback()
+            self._ld = None
+            self._open_db()
+            self.failed += added
+        else:
+            self.added += added
+
+    def _consumer_done(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            _logger.error("syslog-recv: consumer stopped ({0})".format(
+                task.exception()))
+            self.stop()
+
+    async def _consume(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._batch.append(await self._queue.get())
+            deadline = loop.time() + self._batch_wait
+            while len(self._batch) < self._batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    self._batch.append(await asyncio.wait_for(
+                        self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            l_data = self._batch
+            self._batch = []
+            await loop.run_in_executor(self._executor, self._process_batch,
+                                       l_data)
+
+    async def _report(self):
+        prev = (0, 0, 0, 0)
+        prev_time = time.time()
+        while True:
+            await asyncio.sleep(self._report_sec)
+            now = time.time()
+            cur = (self.received, self.dropped, self.failed, self.added)
+            rates = [(c - p) / (now - prev_time) for c, p in zip(cur, prev)]
+            _logger.info("syslog-recv: receive {0:.1f}/sec, "
+                         "drop {1:.1f}/sec, fail {2:.1f}/sec, "
+                         "ingest {3:.1f}/sec, {4} in queue".format(
+                             *rates, self._queue.qsize()))
+            prev = cur
+            prev_time = now
+
+    async def serve(self):
+        """Receive and add messages until stop is called."""
+        loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize = self._queue_size)
+        self._stop = asyncio.Event()
+        transport = None
+        server = None
+        if self._udp_port is not None:
+            transport, _ = await loop.create_datagram_endpoint(
+                lambda: _UDPProtocol(self),
+                local_addr = (self._address, self._udp_port))
+            _logger.info("syslog-recv: listen udp {0}:{1}".format(
+                self._address, self._udp_port))
+        if self._tcp_port is not None:
+            server = await asyncio.start_server(
+                self._handle_tcp, self._address, self._tcp_port)
+            _logger.info("syslog-recv: listen tcp {0}:{1}".format(
+                self._address, self._tcp_port))
+        if transport is None and server is None:
+            raise ValueError("no port given to syslog-recv")
+
+        consumer = asyncio.ensure_future(self._consume())
+        consumer.add_done_callback(self._consumer_done)
+        reporter = asyncio.ensure_future(self._report())
+        try:
+            await self._stop.wait()
+        finally:
+            if transport is not None:
+                transport.close()
+            if server is not None:
+                server.close()
+                await server.wait_closed()
+            reporter.cancel()
+            consumer.cancel()
+            try:
+                await consumer
+            except asyncio.CancelledError:
+                pass
+            except Exception:
+                # already reported in _consumer_done
+                pass
+            # add messages in the unfinished batch and left in the queue
+            l_data = self._batch
+            self._batch = []
+            while not self._queue.empty():
+                l_data.append(self._queue.get_nowait())
+            await loop.run_in_executor(self._executor, self._process_batch,
+                                       l_data)
+            await loop.run_in_executor(self._executor, self._close_db)
+            self._executor.shutdown()
+            _logger.info("syslog-recv: stopped ({0} received, "
+                         "{1} dropped, {2} failed, {3} added)".format(
+                             self.received, self.dropped,
+                             self.failed, self.added))
+
+    def stop(self):
+        if self._stop is not None:
+            self._stop.set()
+
+    def run(self):
+        """Run serve until SIGINT or SIGTERM."""
+        async def _main():
+            loop = asyncio.get_running_loop()
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(signum, self.stop)
+            await self.serve()
+
+        asyncio.run(_main())
+
+
+def receive_syslog(conf):
+    SyslogReceiver(conf).run()
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Measure throughput of db-make (lines/sec) with testlog dataset,
+comparing sizes of batched insertion (database.insert_batch_size).
+Batch size 1 means the former per-line insertion.
+"""
+
+import sys
+import time
+
+from amulog import common
+from amulog import config
+from amulog import testlog
+from amulog import log_db
+
+if len(sys.argv) < 2:
+    sys.exit("usage: {0} CONFIG [BATCH_SIZE ...]".format(sys.argv[0]))
+
+conf = config.open_config(sys.argv[1])
+l_size = [int(v) for v in sys.argv[2:]]
+if len(l_size) == 0:
+    l_size = [1, 1000]
+
+path_testlog = conf.get("general", "src_path")
+tlg = testlog.TestLogGenerator(testlog.DEFAULT_CONFIG, seed = 3)
+tlg.dump_log(path_testlog)
+targets = common.rep_dir(path_testlog)
+
+for size in l_size:
+    conf.set("database", "insert_batch_size", str(size))
+    start = time.time()
+    log_db.process_files(conf, targets, True)
+    elapsed = time.time() - start
+    num = log_db.LogData(conf).count_lines()
+    print("batch size {0} : {1} lines, {2:.2f} sec, {3:.1f} lines/sec".format(
+        size, num, elapsed, num / elapsed))
+
+common.rm(path_testlog)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Measure time to create log templates and groups with new ids
+(LTTable.next_ltid, TemplateTable.next_tid, LTGroup._next_groupid),
+comparing with the former implementation that counts up from 0
+to find an unused id. Some templates are removed and re-added
+to use the free list of ids.
+The former implementation is quadratic, so it is measured
+with a smaller number of templates.
+"""
+
+import sys
+import time
+
+from amulog import lt_common
+
+
+def next_id_former(d):
+    cnt = 0
+    while cnt in d:
+        cnt += 1
+    return cnt
+
+
+class LTTableFormer(lt_common.LTTable):
+
+    def next_ltid(self):
+        return next_id_former(self.ltdict)
+
+
+class TemplateTableFormer(lt_common.TemplateTable):
+
+    def next_tid(self):
+        return next_id_former(self._d_tpl)
+
+
+class LTGroupFormer(lt_common.LTGroup):
+
+    def _next_groupid(self):
+        return next_id_former(self.d_group)
+
+
+def create(num, lttable, table, ltgroup):
+    sym = "**"
+    l_ltid = []
+    for i in range(num):
+        ltw = ["template", str(i), sym]
+        tid = table.add(ltw)
+        ltid = lttable.next_ltid()
+        ltline = lt_common.LogTemplate(ltid, None, ltw, None, 1, sym)
+        ltline.ltgid = ltgroup._next_groupid()
+        ltgroup.add_ltid(ltline.ltgid, ltline)
+        lttable.add_lt(ltline)
+        table.addcand(tid, ltid)
+        l_ltid.append(ltid)
+    # reuse ids of removed templates
+    for ltid in l_ltid[::10]:
+        lttable.remove_lt(ltid)
+    for ltid in l_ltid[::10]:
+        new_ltid = lttable.next_ltid()
+        assert new_ltid == ltid
+        ltline = lt_common.LogTemplate(new_ltid, 0, ["re", sym], None, 1, sym)
+        lttable.add_lt(ltline)
+    return lttable
+
+
+if len(sys.argv) > 3:
+    sys.exit("usage: {0} [NUM] [FORMER_NUM]".format(sys.argv[0]))
+num = int(sys.argv[1]) if len(sys.argv) >= 2 else 100000
+former_num = int(sys.argv[2]) if len(sys.argv) >= 3 else 5000
+
+for name, n, classes in (
+        ("former", former_num,
+         (LTTableFormer, TemplateTableFormer, LTGroupFormer)),
+        ("allocator", former_num,
+         (lt_common.LTTable, lt_common.TemplateTable, lt_common.LTGroup)),
+        ("allocator", num,
+         (lt_common.LTTable, lt_common.TemplateTable, lt_common.LTGroup))):
+    c_lttable, c_table, c_ltgroup = classes
+    start = time.time()
+    lttable = create(n, c_lttable("**"), c_table(), c_ltgroup())
+    sec = time.time() - start
+    assert sorted(lttable.ltdict) == list(range(n))
+    print("{0} : {1} templates, {2:.3f} sec, {3:.1f} templates/sec".format(
+        name, n, sec, n / sec))
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Measure log template generation for init data (process_init_data)
+with and without collapsing duplicated messages (lt_common.dedup_lines),
+for several duplicate ratios.
+Messages are generated with testlog, and the duplicate ratio is raised
+by repeating a part of them.
+"""
+
+import sys
+import time
+import random
+
+from amulog import config
+from amulog import testlog
+from amulog import lt_common
+
+
+def run(conf, method, lines, dedup):
+    table = lt_common.TemplateTable()
+    ltgen = lt_common.init_ltgen(conf, table, method = method)
+    start = time.time()
+    if dedup:
+        l_distinct, weights, index = lt_common.dedup_lines(lines)
+        tids = ltgen.process_init_data(l_distinct, weights)
+        ret = [table[tids[i]] for i in index]
+    else:
+        tids = ltgen.process_init_data(lines)
+        ret = [table[tid] for tid in tids]
+    return time.time() - start, ret
+
+
+if len(sys.argv) > 2:
+    sys.exit("usage: {0} [METHOD]".format(sys.argv[0]))
+method = sys.argv[1] if len(sys.argv) == 2 else "va"
+
+conf = config.open_config()
+tlg = testlog.TestLogGenerator(testlog.DEFAULT_CONFIG, seed = 3)
+l_base = [(mes.split(), None) for dt, host, mes in tlg.l_log]
+rand = random.Random(0)
+
+for repeat in (0, 1, 4, 16):
+    lines = l_base[:]
+    l_sample = l_base[:len(l_base) // 4]
+    for i in range(repeat):
+        lines += l_sample
+    rand.shuffle(lines)
+    l_distinct, _, _ = lt_common.dedup_lines(lines)
+    ratio = 1.0 - len(l_distinct) / len(lines)
+
+    sec_org, ret_org = run(conf, method, lines, False)
+    sec_dedup, ret_dedup = run(conf, method, lines, True)
+    same = sum(1 for t1, t2 in zip(ret_org, ret_dedup) if t1 == t2)
+    print("{0} lines, duplicate ratio {1:.1%} : {2:.3f} sec -> {3:.3f} sec "
+          "(x{4:.2f}), same templates {5:.1%}".format(
+              len(lines), ratio, sec_org, sec_dedup, sec_org / sec_dedup,
+              same / len(lines)))
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Measure request latency of a running lt-daemon
+(amulog lt-daemon -s SOCKET) with lines in a log file,
+for several numbers of lines in a request.
+"""
+
+import sys
+import time
+
+from amulog import lt_daemon
+
+if len(sys.argv) < 3:
+    sys.exit("usage: {0} SOCKET FILE [REQUESTS]".format(sys.argv[0]))
+
+socket_path = sys.argv[1]
+with open(sys.argv[2], 'r', encoding='utf-8') as f:
+    lines = [line.rstrip("\n") for line in f]
+n_req = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+
+with lt_daemon.Client(socket_path) as client:
+    for batch in (1, 10, 100, 1000):
+        l_time = []
+        miss = 0
+        pos = 0
+        for _ in range(max(n_req // batch, 10)):
+            l_line = lines[pos:pos + batch]
+            if len(l_line) < batch:
+                pos = 0
+                l_line = lines[:batch]
+            pos += batch
+            start = time.perf_counter()
+            results = client.classify(l_line)
+            l_time.append(time.perf_counter() - start)
+            miss += results.count(None)
+        l_time.sort()
+        print("batch {0}: {1} requests, median {2:.3f} ms, "
+              "p99 {3:.3f} ms, {4:.0f} lines/sec, {5} miss".format(
+                  batch, len(l_time), l_time[len(l_time) // 2] * 1000,
+                  l_time[int(len(l_time) * 0.99)] * 1000,
+                  batch * len(l_time) / sum(l_time), miss))
+    print(client.stats())
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Measure strutil.split_igesc with words strings stored in DB,
+comparing with the former (quadratic) implementation.
+Words are generated with testlog, and some of them are given
+escaped letters (as messages including * or @).
+"""
+
+import sys
+import timeit
+import random
+
+from amulog import strutil
+from amulog import testlog
+
+
+def split_igesc_former(string, spl):
+    l_esc = ["\\" + w for w in "\\" + strutil.ESC_LETTER]
+    temp_str = string
+    spl_len = len(spl)
+    temp_ww = []
+    ret = []
+    while len(temp_str) >= spl_len:
+        if temp_str[0:2] in l_esc:
+            temp_ww.append(temp_str[:2])
+            temp_str = temp_str[2:]
+        elif strutil.fmatch(temp_str, spl):
+            ret.append("".join(temp_ww))
+            temp_ww = []
+            temp_str = temp_str[len(spl):]
+        else:
+            temp_ww.append(temp_str[0])
+            temp_str = temp_str[1:]
+    else:
+        ret.append("".join(temp_ww) + temp_str)
+    return ret
+
+
+if len(sys.argv) > 2:
+    sys.exit("usage: {0} [REPEAT]".format(sys.argv[0]))
+repeat = int(sys.argv[1]) if len(sys.argv) == 2 else 3
+
+spl = "@@"
+rand = random.Random(0)
+tlg = testlog.TestLogGenerator(testlog.DEFAULT_CONFIG, seed = 3)
+l_words = []
+for dt, host, mes in tlg.l_log:
+    l_w = mes.split()
+    if rand.random() < 0.3:
+        l_w.append(rand.choice(["user@host", "*", "a\\b"]))
+    l_words.append(spl.join([strutil.add_esc(w) for w in l_w]))
+# long messages
+for num in (50, 200, 1000):
+    l_words.append(spl.join(["w{0}\\*".format(i) for i in range(num)]))
+
+for func in (split_igesc_former, strutil.split_igesc):
+    assert [func(s, spl) for s in l_words] == \
+           [split_igesc_former(s, spl) for s in l_words]
+    sec = min(timeit.repeat(lambda: [func(s, spl) for s in l_words],
+                            number = 1, repeat = repeat))
+    print("{0} : {1} strings, {2:.4f} sec, {3:.1f} strings/sec".format(
+        func.__name__, len(l_words), sec, len(l_words) / sec))
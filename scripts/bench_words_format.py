@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Compare storage formats of log.words (database.words_format,
+words_compress and words_store) in write / read (iter_lines) throughput
+and DB size (sqlite3).
+Messages are generated with testlog and classified once,
+and then written into DBs of each format.
+"""
+
+import os
+import sys
+import time
+import datetime
+
+from amulog import common
+from amulog import config
+from amulog import testlog
+from amulog import log_db
+
+if len(sys.argv) < 2:
+    sys.exit("usage: {0} CONFIG".format(sys.argv[0]))
+
+conf = config.open_config(sys.argv[1])
+conf.set("database", "database", "sqlite3")
+conf.set("database", "words_format", "text")
+conf.set("database", "words_compress", "false")
+conf.set("database", "words_store", "full")
+path_testlog = conf.get("general", "src_path")
+path_db = conf.get("database", "sqlite3_filename")
+tlg = testlog.TestLogGenerator(testlog.DEFAULT_CONFIG, seed = 3)
+tlg.dump_log(path_testlog)
+log_db.process_files(conf, common.rep_dir(path_testlog), True)
+
+top_dt = datetime.datetime(1, 1, 1)
+ld = log_db.LogData(conf)
+l_line = [(lm.lt.ltid, lm.dt, lm.host, lm.l_w, lm.lid)
+          for lm in ld.iter_lines(top_dt = top_dt)]
+
+for words_store, words_format, compress in (("full", "text", "false"),
+                                            ("full", "binary", "false"),
+                                            ("full", "binary", "true"),
+                                            ("variable", "text", "false"),
+                                            ("variable", "binary", "false")):
+    conf.set("database", "words_store", words_store)
+    conf.set("database", "words_format", words_format)
+    conf.set("database", "words_compress", compress)
+    conf.set("database", "sqlite3_filename", path_db + ".bench")
+    common.rm(path_db + ".bench")
+    ld_bench = log_db.LogData(conf, edit = True)
+    db = ld_bench.db
+    for lt in ld.lttable:
+        ld_bench.lttable.add_lt(lt)
+        db.add_lt(lt)
+
+    start = time.time()
+    for ltid, dt, host, l_w, lid in l_line:
+        db.add_line(ltid, dt, host, l_w, lid = lid)
+    db.commit()
+    write_sec = time.time() - start
+
+    start = time.time()
+    num = sum(1 for lm in db.iter_lines(top_dt = top_dt))
+    read_sec = time.time() - start
+    size = os.path.getsize(path_db + ".bench")
+    del db, ld_bench
+
+    print("{0} {1}{2} : write {3:.1f} lines/sec, read {4:.1f} lines/sec, "
+          "{5} bytes".format(words_store, words_format,
+                             " (zlib)" if compress == "true" else "",
+                             len(l_line) / write_sec, num / read_sec, size))
+    common.rm(path_db + ".bench")
+
+common.rm(path_testlog)
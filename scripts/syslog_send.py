@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+"""Send lines in a log file to a syslog server (e.g., amulog syslog-recv)
+as RFC3164 messages, to test receiving.
+Lines are sent over UDP, or TCP (newline delimited) if PROTOCOL is tcp.
+If RATE is given, send at most RATE messages per second.
+"""
+
+import sys
+import time
+import socket
+
+if len(sys.argv) < 4:
+    sys.exit("usage: {0} FILE HOST PORT [PROTOCOL [RATE]]".format(
+        sys.argv[0]))
+
+fp = sys.argv[1]
+addr = (sys.argv[2], int(sys.argv[3]))
+proto = sys.argv[4] if len(sys.argv) > 4 else "udp"
+rate = float(sys.argv[5]) if len(sys.argv) > 5 else None
+pri = "<13>" # user.notice
+
+if proto == "tcp":
+    sock = socket.create_connection(addr)
+else:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+cnt = 0
+start = time.time()
+with open(fp, 'r', encoding='utf-8') as f:
+    for line in f:
+        data = (pri + line.rstrip("\n") + "\n").encode("utf-8")
+        if proto == "tcp":
+            sock.sendall(data)
+        else:
+            sock.sendto(data, addr)
+        cnt += 1
+        if rate is not None:
+            wait = start + cnt / rate - time.time()
+            if wait > 0:
+                time.sleep(wait)
+sock.close()
+
+elapsed = time.time() - start
+print("sent {0} messages in {1:.2f} sec ({2:.1f} messages/sec)".format(
+    cnt, elapsed, cnt / elapsed))
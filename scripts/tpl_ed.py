@@ -58,7 +58,16 @@ for ltid1 in s_ltid1:
     for ltid2 in s_ltid2:
         lt1 = ld.lt(ltid1)
         lt2 = ld.lt(ltid2)
-        ed = edit_distance(lt1.ltw, lt2.ltw, sym)
+        # distances larger than current minimums are not needed
+        cur = max(d_ed1.get(ltid1, sys.maxsize),
+                  d_ed2.get(ltid2, sys.maxsize))
+        if cur == sys.maxsize:
+            max_dist = None
+        elif RELATIVE:
+            max_dist = int(cur * max(len(lt1.ltw), len(lt2.ltw)))
+        else:
+            max_dist = cur
+        ed = edit_distance(lt1.ltw, lt2.ltw, sym, max_dist = max_dist)
         if RELATIVE:
             ed = 1.0 * ed / max(len(lt1.ltw), len(lt2.ltw))
 
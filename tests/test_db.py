@@ -1,12 +1,68 @@
 #!/usr/bin/env python
 # coding: utf-8
 
+import io
+import os
+import json
 import unittest
+import tempfile
+import datetime
+import contextlib
+from collections import defaultdict
+from unittest import mock
 
 from amulog import common
 from amulog import config
 from amulog import testlog
 from amulog import log_db
+from amulog import lt_common
+from amulog import lt_tool
+from amulog import strutil
+
+
+def _set_db(conf, path_db):
+    conf.set("database", "sqlite3_filename", path_db)
+    conf.set("log_template", "indata_filename", path_db + ".lt")
+
+
+def _dump_lines(conf):
+    ld = log_db.LogData(conf)
+    ret = [(lm.lid, lm.dt, lm.host, lm.l_w, lm.lt.ltid) for lm
+           in ld.iter_lines(top_dt = datetime.datetime(1900, 1, 1))]
+    del ld
+    return ret
+
+
+def _init_line_db(conf):
+    # empty DB with 1 template, recording sizes of executemany
+    ld = log_db.LogData(conf, edit = True, reset_db = True)
+    sym = conf.get("log_template", "variable_symbol")
+    ltline = lt_common.LogTemplate(0, 0, ["a", sym], None, 8, sym)
+    ld.db.add_lt(ltline)
+    ld.lttable.add_lt(ltline)
+    executemany = ld.db.db.executemany
+    l_size = []
+
+    def _executemany(sql, l_args):
+        l_size.append(len(l_args))
+        return executemany(sql, l_args)
+
+    ld.db.db.executemany = _executemany
+    return ld, l_size
+
+
+def _stored_lids(ld):
+    # lids in log table, without flushing buffered lines
+    sql = "select lid from log"
+    return sorted(row[0] for row in ld.db.db.execute(sql))
+
+
+def _count_rows(ld):
+    # rows in log_count table, after flushing buffered counts
+    ld.db._flush_lines()
+    sql = "select ltid, {0}, bucket, count from log_count".format(
+        ld.db._host_key())
+    return sorted(ld.db.db.execute(sql))
 
 
 class TestDB(unittest.TestCase):
@@ -42,6 +98,740 @@ class TestDB(unittest.TestCase):
         common.rm(path_testlog)
         common.rm(path_db)
 
+    def test_count_table(self):
+        conf = config.open_config()
+        conf.set("database", "count_bucket", "hour")
+        path_testlog = conf['general']['src_path']
+        path_db = conf['database']['sqlite3_filename']
+
+        tlg = testlog.TestLogGenerator(testlog.DEFAULT_CONFIG, seed = 3)
+        tlg.dump_log(path_testlog)
+        log_db.process_files(conf, common.rep_dir(path_testlog), True)
+
+        ld = log_db.LogData(conf)
+        top_dt, end_dt = ld.whole_term()
+        d_cnt = ld.count_host_lt(top_dt = top_dt, end_dt = end_dt)
+        self.assertEqual(sum(d_cnt.values()), ld.count_lines())
+        # compare with counting on log table
+        ld.db._count_bucket = None
+        self.assertEqual(d_cnt, ld.count_host_lt(top_dt = top_dt,
+                                                 end_dt = end_dt))
+        del ld
+
+        # merge templates of same length, moving messages with update_log
+        ld = log_db.LogData(conf, edit = True)
+        d_len = {}
+        for lt in ld.iter_lt():
+            d_len.setdefault(len(lt.ltw), []).append(lt.ltid)
+        ltid1, ltid2 = [l_ltid for l_ltid in d_len.values()
+                        if len(l_ltid) >= 2][0][:2]
+        with contextlib.redirect_stdout(io.StringIO()):
+            lt_tool.merge_ltid(ld, ltid1, ltid2)
+        l_host_lt = ld.whole_host_lt(top_dt = top_dt, end_dt = end_dt)
+        self.assertFalse(ltid2 in [ltid for _, ltid in l_host_lt])
+        ld.whole_host_ltg(top_dt = top_dt, end_dt = end_dt)
+        d_cnt = ld.count_host_lt(top_dt = top_dt, end_dt = end_dt)
+        ld.db._count_bucket = None
+        self.assertEqual(sorted(l_host_lt),
+                         sorted(ld.whole_host_lt(top_dt = top_dt,
+                                                 end_dt = end_dt)))
+        self.assertEqual(d_cnt, ld.count_host_lt(top_dt = top_dt,
+                                                 end_dt = end_dt))
+
+        del ld
+        common.rm(path_testlog)
+        common.rm(path_db)
+
+    def test_add_line_buffer(self):
+        conf = config.open_config()
+        conf.set("database", "insert_batch_size", "10")
+        path_db = conf['database']['sqlite3_filename'] + ".buffer"
+        _set_db(conf, path_db)
+        dt = datetime.datetime(2112, 9, 1)
+
+        ld, l_size = _init_line_db(conf)
+        for lid in range(11, 16):
+            ld.add_line(0, dt, "host1", ["a", "b"], lid = lid)
+        self.assertEqual(_stored_lids(ld), [])
+        # a lid going backward flushes the lines before it
+        ld.add_line(0, dt, "host1", ["a", "b"], lid = 1)
+        self.assertEqual(_stored_lids(ld), list(range(11, 16)))
+        ld.add_line(0, dt, "host1", ["a", "c"], lid = 2)
+        self.assertEqual(l_size, [5])
+        # commit flushes the rest
+        ld.commit_db()
+        self.assertEqual(l_size, [5, 2])
+        self.assertEqual(_stored_lids(ld), [1, 2] + list(range(11, 16)))
+        self.assertEqual(ld.count_lines(), 15)
+        self.assertEqual([lm.l_w for lm in ld.iter_lines(lid = 2)],
+                         [["a", "c"]])
+        del ld
+
+        # buffered lines are reflected to queries without commit
+        ld = log_db.LogData(conf, edit = True)
+        ld.add_line(0, dt + datetime.timedelta(days = 1), "host2",
+                    ["a", "d"], lid = 16)
+        self.assertEqual(ld.count_lines(), 16)
+        self.assertEqual(len(list(ld.iter_lines(host = "host2"))), 1)
+        ld.commit_db()
+        del ld
+
+        common.rm(path_db)
+        common.rm(path_db + ".lt")
+
+    def test_add_line_batch_size(self):
+        conf = config.open_config()
+        path_db = conf['database']['sqlite3_filename'] + ".batch"
+        _set_db(conf, path_db)
+        dt = datetime.datetime(2112, 9, 1)
+
+        for batch_size, l_lid, l_flushed, l_committed in [
+                # flushed every 3 lines
+                (3, list(range(1, 9)), [3, 3], [3, 3, 2]),
+                # lids going backward start a new batch
+                (3, [5, 6, 7, 8, 1, 2, 9, 3], [3, 1, 3], [3, 1, 3, 1]),
+                # inserted one by one without buffering
+                (1, [5, 6, 7, 8, 1, 2, 9, 3], [], [])]:
+            conf.set("database", "insert_batch_size", str(batch_size))
+            ld, l_size = _init_line_db(conf)
+            l_stored = []
+            for lid in l_lid:
+                ld.add_line(0, dt, "host1", ["a", str(lid)], lid = lid)
+                if batch_size == 1:
+                    l_stored.append(lid)
+                    self.assertEqual(_stored_lids(ld), sorted(l_stored))
+            self.assertEqual(l_size, l_flushed)
+            self.assertEqual(len(_stored_lids(ld)), sum(l_flushed) or
+                             len(l_lid))
+            ld.commit_db()
+            self.assertEqual(l_size, l_committed)
+            self.assertEqual(_stored_lids(ld), sorted(l_lid))
+            self.assertEqual([(lm.lid, lm.l_w) for lm in ld.iter_lines(
+                top_dt = datetime.datetime(1900, 1, 1))],
+                             [(lid, ["a", str(lid)]) for lid in sorted(l_lid)])
+            del ld
+
+        common.rm(path_db)
+        common.rm(path_db + ".lt")
+
+    def test_count_matrix(self):
+        conf = config.open_config()
+        path_testlog = conf['general']['src_path']
+        path_db = conf['database']['sqlite3_filename'] + ".matrix"
+        _set_db(conf, path_db)
+
+        tlg = testlog.TestLogGenerator(testlog.DEFAULT_CONFIG, seed = 3)
+        tlg.dump_log(path_testlog)
+        log_db.process_files(conf, common.rep_dir(path_testlog), True)
+        ld = log_db.LogData(conf, edit = True)
+        l_lm = list(ld.iter_lines(top_dt = datetime.datetime(1900, 1, 1)))
+        whole_top_dt, whole_end_dt = ld.whole_term()
+        host = l_lm[0].host
+        hour = datetime.timedelta(hours = 1)
+
+        def _count(top_dt, end_dt, bin_sec, area, gid_name):
+            # reference counts with iter_lines
+            n_bin = -(-int((end_dt - top_dt).total_seconds()) // bin_sec)
+            d_cnt = defaultdict(lambda: [0] * n_bin)
+            for lm in l_lm:
+                if not top_dt <= lm.dt < end_dt:
+                    continue
+                if area is not None and lm.host != area[5:]:
+                    continue
+                key = (lm.host, lm.lt.get(gid_name))
+                sec = int((lm.dt - top_dt).total_seconds())
+                d_cnt[key][sec // bin_sec] += 1
+            return dict(d_cnt)
+
+        l_query = [
+            (whole_top_dt, whole_end_dt, 60, None, "ltid"),
+            (whole_top_dt, whole_end_dt, 600, None, "ltid"),
+            (whole_top_dt, whole_end_dt, 3600, None, "ltgid"),
+            (whole_top_dt, whole_end_dt, 5400, None, "ltid"),
+            (whole_top_dt, whole_end_dt, 86400, "host_" + host, "ltid"),
+            # terms on hour boundaries but not on days
+            (whole_top_dt + 2 * hour, whole_end_dt - 3 * hour, 3600,
+             None, "ltid"),
+            # terms not on boundaries of any count bucket
+            (whole_top_dt + hour / 4, whole_end_dt, 60, None, "ltid"),
+        ]
+        dt_array = log_db.LogDB._dt_array
+        l_from_log = []
+
+        def _dt_array(db, l_dt):
+            l_from_log.append(True)
+            return dt_array(db, l_dt)
+
+        for count_bucket in ("", "minute", "hour", "day"):
+            ld.db.remake_count(count_bucket)
+            for top_dt, end_dt, bin_sec, area, gid_name in l_query:
+                with mock.patch.object(log_db.LogDB, "_dt_array",
+                                       _dt_array):
+                    mat, l_key = ld.event_matrix(
+                        top_dt, end_dt, datetime.timedelta(seconds = bin_sec),
+                        area = area, gid_name = gid_name)
+                self.assertEqual(dict(zip(l_key, mat.tolist())),
+                                 _count(top_dt, end_dt, bin_sec,
+                                        area, gid_name),
+                                 (count_bucket, top_dt, end_dt, bin_sec))
+        # queries not available with count table fall back to log table
+        # (all 7 without table, none with minute, 4 with hour, 6 with day)
+        self.assertEqual(len(l_from_log), 7 + 0 + 4 + 6)
+        del ld
+
+        common.rm(path_testlog)
+        common.rm(path_db)
+        common.rm(path_db + ".lt")
+
+    def test_count_update(self):
+        conf = config.open_config()
+        conf.set("database", "count_bucket", "hour")
+        path_testlog = conf['general']['src_path']
+        path_db = conf['database']['sqlite3_filename'] + ".count"
+        _set_db(conf, path_db)
+
+        tlg = testlog.TestLogGenerator(testlog.DEFAULT_CONFIG, seed = 3)
+        tlg.dump_log(path_testlog)
+        log_db.process_files(conf, common.rep_dir(path_testlog), True)
+        ld = log_db.LogData(conf, edit = True)
+        top_dt, end_dt = ld.whole_term()
+        d_cnt = ld.count_host_lt(top_dt = top_dt, end_dt = end_dt)
+        host = sorted(d_cnt)[0][0]
+        ltid1, ltid2 = [ltid for h, ltid in sorted(d_cnt) if h == host][:2]
+
+        def _rows_of(ltid, host):
+            return [row for row in _count_rows(ld)
+                    if row[0] == ltid and row[1] == host]
+
+        # all messages of ltid1 in the host moved to ltid2
+        ld.db.update_log({"ltid" : ltid1, "host" : host}, {"ltid" : ltid2})
+        self.assertEqual(_rows_of(ltid1, host), [])
+        num = d_cnt[(host, ltid1)] + d_cnt[(host, ltid2)]
+        self.assertEqual(sum(row[3] for row in _rows_of(ltid2, host)), num)
+        # a message moved to another bucket
+        lm = next(ld.iter_lines(ltid = ltid2, host = host))
+        new_dt = top_dt - datetime.timedelta(days = 1)
+        ld.db.update_log({"lid" : lm.lid}, {"dt" : new_dt})
+        l_rows = _rows_of(ltid2, host)
+        self.assertEqual(sum(row[3] for row in l_rows), num)
+        self.assertTrue((ltid2, host, ld.db._bucket(new_dt), 1) in l_rows)
+        self.assertTrue(all(row[3] > 0 for row in _count_rows(ld)))
+        ld.commit_db()
+
+        # same as the table made from log table
+        l_rows = _count_rows(ld)
+        ld.db.remake_count()
+        self.assertEqual(l_rows, _count_rows(ld))
+        del ld
+
+        common.rm(path_testlog)
+        common.rm(path_db)
+        common.rm(path_db + ".lt")
+
+    def test_stats(self):
+        conf = config.open_config()
+        path_testlog = conf['general']['src_path']
+        path_db = conf['database']['sqlite3_filename']
+
+        tlg = testlog.TestLogGenerator(testlog.DEFAULT_CONFIG, seed = 3)
+        tlg.dump_log(path_testlog)
+        num = len(tlg.l_log)
+        log_db.process_files(conf, common.rep_dir(path_testlog), True)
+
+        # cached statistics are same as aggregated values
+        ld = log_db.LogData(conf)
+        for key, cached, calc in ld.db.verify_stats():
+            self.assertEqual(cached, calc, key)
+        del ld
+
+        # interrupted adding: flushed lines are committed
+        # on deletion of DB connection, without the statistics
+        ld = log_db.LogData(conf, edit = True)
+        ld.init_ltmanager()
+        lp = log_db._load_log2seq(conf)
+        ha = log_db.host_alias.HostAlias(conf)
+        with open(path_testlog) as f:
+            for line in list(f)[:100]:
+                log_db.process_line(line.rstrip("\n"), ld, lp, ha)
+        ld.db._flush_lines()
+        ld.db.db.commit()
+        del ld
+
+        ld = log_db.LogData(conf, edit = True)
+        self.assertEqual(ld.count_lines(), num + 100)
+        d_calc = {key : calc for key, _, calc in ld.db.verify_stats()}
+        self.assertEqual(ld.dt_term(), (d_calc["top_dt"], d_calc["end_dt"]))
+        self.assertEqual(ld.count_lt(), d_calc["count_lt"])
+        # new lids continue from the existing lines
+        ld.init_ltmanager()
+        with open(path_testlog) as f:
+            line = f.readline().rstrip("\n")
+        lm = log_db.process_line(line, ld, lp, ha)
+        self.assertEqual(lm.lid, num + 101)
+        ld.commit_db()
+        del ld
+
+        ld = log_db.LogData(conf)
+        for key, cached, calc in ld.db.verify_stats():
+            self.assertEqual(cached, calc, key)
+
+        del ld
+        common.rm(path_testlog)
+        common.rm(path_db)
+
+    def test_ingest_stats(self):
+        conf = config.open_config()
+        path_testlog = conf['general']['src_path']
+        path_db = conf['database']['sqlite3_filename'] + ".ingest"
+        _set_db(conf, path_db)
+        path_stats = path_db + ".json"
+
+        tlg = testlog.TestLogGenerator(testlog.DEFAULT_CONFIG, seed = 3)
+        tlg.dump_log(path_testlog)
+        num = len(tlg.l_log)
+
+        # disabled by default: nothing is measured
+        with mock.patch.object(log_db, "IngestStats") as m:
+            log_db.process_files(conf, common.rep_dir(path_testlog), True)
+        m.assert_not_called()
+
+        conf.set("database", "stats_output", path_stats)
+        log_db.process_files(conf, common.rep_dir(path_testlog), True)
+        with open(path_stats) as f:
+            d = json.load(f)
+        self.assertEqual((d["lines"], d["added"]), (num, num))
+        d_stage = d["stages"]
+        for stage in ("read", "parse", "host", "ltgen", "insert"):
+            self.assertTrue(d_stage[stage]["time"] > 0, stage)
+        for stage in ("read", "parse", "ltgen", "insert"):
+            self.assertEqual(d_stage[stage]["calls"], num, stage)
+        self.assertTrue(0 < d_stage["host"]["calls"] <= num)
+        self.assertTrue(d_stage["commit"]["calls"] >= 1)
+        self.assertTrue(sum(val["share"] for val in d_stage.values())
+                        > 0.99)
+        ld = log_db.LogData(conf)
+        self.assertEqual(d["new_templates"], ld.count_lt())
+        self.assertEqual(d["new_groups"], len(list(ld.iter_ltgid())))
+        del ld
+
+        common.rm(path_testlog)
+        common.rm(path_db)
+        common.rm(path_db + ".lt")
+        common.rm(path_stats)
+
+    def test_rollback(self):
+        conf = config.open_config()
+        conf.set("database", "host_format", "id")
+        conf.set("database", "words_store", "variable")
+        path_db = conf['database']['sqlite3_filename'] + ".rb"
+        _set_db(conf, path_db)
+        line = "2112-09-01 00:04:25 {0} CRON[13208]: (root) CMD (run)"
+
+        ld = log_db.LogData(conf, edit = True, reset_db = True)
+        ld.init_ltmanager()
+        lp = log_db._load_log2seq(conf)
+        ha = log_db.host_alias.HostAlias(conf)
+        log_db.process_line(line.format("sw1"), ld, lp, ha)
+        ld.commit_db()
+        # host added in discarded changes is added again
+        log_db.process_line(line.format("sw2"), ld, lp, ha)
+        ld.db._flush_lines()
+        ld.db.rollback()
+        log_db.process_line(line.format("sw2"), ld, lp, ha)
+        ld.commit_db()
+        # template revision added in discarded changes
+        log_db.process_line(line.format("sw1").replace("run", "stop"),
+                            ld, lp, ha)
+        ld.db._flush_lines()
+        self.assertEqual(len(ld.db._d_rev), 2)
+        ld.db.rollback()
+        self.assertEqual(len(ld.db._d_rev), 1)
+        self.assertEqual(set(ld.db._d_ltrid.values()), set())
+        del ld
+
+        ld = log_db.LogData(conf)
+        self.assertEqual([lm.host for lm in ld.iter_lines(
+            top_dt = datetime.datetime(1900, 1, 1))], ["sw1", "sw2"])
+        del ld
+        common.rm(path_db)
+        common.rm(path_db + ".lt")
+
+    def test_parallel_parse(self):
+        conf = config.open_config()
+        path_testlog = conf['general']['src_path']
+        path_db = conf['database']['sqlite3_filename']
+
+        tlg = testlog.TestLogGenerator(testlog.DEFAULT_CONFIG, seed = 3)
+        tlg.dump_log(path_testlog)
+        log_db.process_files(conf, common.rep_dir(path_testlog), True)
+        l_serial = _dump_lines(conf)
+
+        _set_db(conf, path_db + ".pal")
+        log_db.process_files(conf, common.rep_dir(path_testlog), True,
+                             pal = 2)
+        self.assertEqual(len(l_serial), 6539)
+        self.assertEqual(_dump_lines(conf), l_serial)
+
+        common.rm(path_testlog)
+        common.rm(path_db)
+        common.rm(path_db + ".pal")
+        common.rm(path_db + ".pal.lt")
+
+    def _check_resume(self, **kwargs):
+        conf = config.open_config()
+        for key, val in kwargs.items():
+            conf.set("database", key, val)
+        path_testlog = conf['general']['src_path']
+        path_db = conf['database']['sqlite3_filename']
+
+        tlg = testlog.TestLogGenerator(testlog.DEFAULT_CONFIG, seed = 3)
+        tlg.dump_log(path_testlog)
+        log_db.process_files(conf, common.rep_dir(path_testlog), True)
+        l_serial = _dump_lines(conf)
+
+        # interrupted after 3500 lines, committed every 1000 lines
+        _set_db(conf, path_db + ".cp")
+        conf.set("database", "commit_interval_lines", "1000")
+        add_parsed_line = log_db._add_parsed_line
+        cnt = [0]
+
+        def _interrupted(*args):
+            cnt[0] += 1
+            if cnt[0] > 3500:
+                raise KeyboardInterrupt
+            return add_parsed_line(*args)
+
+        with mock.patch.object(log_db, "_add_parsed_line", _interrupted):
+            with self.assertRaises(KeyboardInterrupt):
+                log_db.process_files(conf, common.rep_dir(path_testlog),
+                                     True)
+        ld = log_db.LogData(conf)
+        self.assertEqual(ld.count_lines(), 3000)
+        self.assertTrue(ld.db.get_checkpoint() is not None)
+        del ld
+
+        log_db.resume_files(conf)
+        ld = log_db.LogData(conf)
+        self.assertTrue(ld.db.get_checkpoint() is None)
+        del ld
+        self.assertEqual(_dump_lines(conf), l_serial)
+
+        common.rm(path_testlog)
+        common.rm(path_db)
+        common.rm(path_db + ".cp")
+        common.rm(path_db + ".cp.lt")
+
+    def test_resume(self):
+        self._check_resume()
+        self._check_resume(words_store = "variable", host_format = "id")
+        self._check_resume(words_format = "binary", dt_format = "epoch")
+        self._check_resume(bulk_load = "true")
+
+    def test_bulk_interrupted(self):
+        conf = config.open_config()
+        conf.set("database", "bulk_load", "true")
+        path_testlog = conf['general']['src_path']
+        path_db = conf['database']['sqlite3_filename'] + ".bulk"
+        _set_db(conf, path_db)
+
+        tlg = testlog.TestLogGenerator(testlog.DEFAULT_CONFIG, seed = 3)
+        tlg.dump_log(path_testlog)
+        with mock.patch.object(log_db, "_add_parsed_line",
+                               side_effect = KeyboardInterrupt):
+            with self.assertLogs("amulog", "WARNING") as cm:
+                with self.assertRaises(KeyboardInterrupt):
+                    log_db.process_files(conf, common.rep_dir(path_testlog),
+                                         True)
+        self.assertTrue("interrupted in bulk load mode" in cm.output[-1])
+
+        common.rm(path_testlog)
+        common.rm(path_db)
+        common.rm(path_db + ".lt")
+
+    def test_bulk_load(self):
+        conf = config.open_config()
+        conf.set("database", "count_bucket", "hour")
+        path_testlog = conf['general']['src_path']
+        path_db = conf['database']['sqlite3_filename']
+
+        tlg = testlog.TestLogGenerator(testlog.DEFAULT_CONFIG, seed = 3)
+        tlg.dump_log(path_testlog)
+        flush_count = log_db.LogDB._flush_count
+        l_flushed = []
+
+        def _flush_count(db):
+            if len(db._buf_count) > 0:
+                l_flushed.append(len(db._buf_count))
+            return flush_count(db)
+
+        d_result = {}
+        for bulk in (False, True):
+            _set_db(conf, "{0}.bulk_{1}".format(path_db, bulk))
+            conf.set("database", "bulk_load", str(bulk).lower())
+            l_flushed.clear()
+            with mock.patch.object(log_db.LogDB, "_flush_count",
+                                   _flush_count):
+                log_db.process_files(conf, common.rep_dir(path_testlog),
+                                     True)
+            if bulk:
+                # counts are flushed at the end, not in every batch
+                self.assertEqual(len(l_flushed), 1)
+            else:
+                self.assertTrue(len(l_flushed) > 1)
+
+            ld = log_db.LogData(conf)
+            l_table = ld.db.db.get_table_names()
+            for name in ("log_index", "log_count_index",
+                         "log_count_host_index"):
+                self.assertTrue(name in l_table, name)
+            top_dt, end_dt = ld.whole_term()
+            matrix, l_event = ld.event_matrix(top_dt, end_dt,
+                                              datetime.timedelta(hours = 1))
+            d_result[bulk] = (
+                ld.count_host_lt(top_dt = top_dt, end_dt = end_dt),
+                sorted(ld.whole_host_lt(top_dt = top_dt, end_dt = end_dt)),
+                matrix.tolist(), l_event)
+            del ld
+            d_result[bulk] += (_dump_lines(conf),)
+            common.rm(conf['database']['sqlite3_filename'])
+            common.rm(conf['log_template']['indata_filename'])
+
+        self.assertEqual(sum(d_result[True][0].values()), len(tlg.l_log))
+        for normal, bulk in zip(d_result[False], d_result[True]):
+            self.assertEqual(normal, bulk)
+
+        common.rm(path_testlog)
+
+    def test_file_follower(self):
+        with tempfile.TemporaryDirectory() as dirname:
+            fp = os.path.join(dirname, "syslog")
+            with open(fp, "w") as f:
+                f.write("a\nb\n")
+            follower = log_db.FileFollower([fp])
+            self.assertEqual(follower.poll(), [])
+            with open(fp, "a") as f:
+                f.write("c\nd")
+            self.assertEqual(follower.poll(), ["c"])
+            with open(fp, "a") as f:
+                f.write("\n")
+            self.assertEqual(follower.poll(), ["d"])
+
+            # rotated: the rest of old file, and then the new file
+            os.rename(fp, fp + ".1")
+            with open(fp + ".1", "a") as f:
+                f.write("e\n")
+            self.assertEqual(follower.poll(), ["e"])
+            with open(fp, "w") as f:
+                f.write("ffff\n")
+            self.assertEqual(follower.poll(), ["ffff"])
+
+            # truncated: read from head
+            with open(fp, "w") as f:
+                f.write("g\n")
+            self.assertEqual(follower.poll(), ["g"])
+            self.assertEqual(follower.pending(), 0)
+            follower.close()
+
+    def test_follow(self):
+        conf = config.open_config()
+        path_testlog = conf['general']['src_path']
+        path_db = conf['database']['sqlite3_filename'] + ".follow"
+        _set_db(conf, path_db)
+        conf.set("database", "follow_report_sec", "0")
+
+        tlg = testlog.TestLogGenerator(testlog.DEFAULT_CONFIG, seed = 3)
+        tlg.dump_log(path_testlog)
+        with tempfile.TemporaryDirectory() as dirname:
+            fp = os.path.join(dirname, "syslog")
+            path_fail = os.path.join(dirname, "fail")
+            conf.set("log_template", "fail_output", path_fail)
+            with open(fp, "w") as f:
+                f.write("malformed line\n")
+                with open(path_testlog) as f_src:
+                    f.write(f_src.read())
+
+            # stop when all lines are read
+            with mock.patch.object(log_db.time, "sleep",
+                                   side_effect = KeyboardInterrupt):
+                log_db.follow_files(conf, [fp], from_start = True)
+            with open(path_fail) as f:
+                self.assertEqual(f.read(), "malformed line\n")
+
+        ld = log_db.LogData(conf)
+        self.assertEqual(ld.count_lines(), 6539)
+        del ld
+        common.rm(path_testlog)
+        common.rm(path_db)
+        common.rm(path_db + ".lt")
+
+    def test_init_spool(self):
+        conf = config.open_config()
+        path_testlog = conf['general']['src_path']
+        path_db = conf['database']['sqlite3_filename']
+
+        tlg = testlog.TestLogGenerator(testlog.DEFAULT_CONFIG, seed = 3)
+        tlg.dump_log(path_testlog)
+        log_db.process_init_data(conf, common.rep_dir(path_testlog))
+        l_memory = _dump_lines(conf)
+
+        with tempfile.TemporaryDirectory() as dirname:
+            # all messages spilled with no memory budget
+            _set_db(conf, path_db + ".spool")
+            conf.set("database", "init_buffer_size", "0")
+            conf.set("database", "init_spool_dir", dirname)
+            log_db.process_init_data(conf, common.rep_dir(path_testlog))
+            self.assertEqual(os.listdir(dirname), [])
+            self.assertEqual(_dump_lines(conf), l_memory)
+
+            spool = log_db.ParsedLineSpool(10000, dirname, chunk_lines = 7)
+            l_record = [(lid, None, "host", ["w", str(lid)], None)
+                        for lid in range(100)]
+            for record in l_record:
+                spool.append(record)
+            self.assertTrue(0 < spool.spilled < len(l_record))
+            self.assertEqual(len(os.listdir(dirname)), 1)
+            self.assertEqual(list(spool), l_record)
+            # iterated concurrently
+            self.assertEqual([(l_w, record) for (l_w, l_s), record
+                              in zip(spool.lines(), spool)],
+                             [(record[3], record) for record in l_record])
+            spool.close()
+            self.assertEqual(os.listdir(dirname), [])
+
+        common.rm(path_testlog)
+        common.rm(path_db)
+        common.rm(path_db + ".spool")
+        common.rm(path_db + ".spool.lt")
+
+    def test_init_dedup(self):
+        conf = config.open_config()
+        conf.set("log_template", "lt_alg", "va")
+        path_testlog = conf['general']['src_path']
+        path_db = conf['database']['sqlite3_filename']
+
+        tlg = testlog.TestLogGenerator(testlog.DEFAULT_CONFIG, seed = 3)
+        tlg.dump_log(path_testlog)
+        log_db.process_init_data(conf, common.rep_dir(path_testlog))
+        l_lines = _dump_lines(conf)
+
+        # deduplicated on spilled messages: same templates in va
+        _set_db(conf, path_db + ".dedup")
+        conf.set("log_template", "init_dedup", "true")
+        conf.set("database", "init_buffer_size", "0")
+        log_db.process_init_data(conf, common.rep_dir(path_testlog))
+        self.assertEqual(_dump_lines(conf), l_lines)
+
+        common.rm(path_testlog)
+        common.rm(path_db)
+        common.rm(path_db + ".dedup")
+        common.rm(path_db + ".dedup.lt")
+
+    def test_template_cache(self):
+        conf = config.open_config()
+        conf.set("log_template", "cache_size", "10")
+        path_db = conf['database']['sqlite3_filename']
+
+        ld = log_db.LogData(conf, edit = True, reset_db = True)
+        ld.init_ltmanager()
+        ltm = ld.ltm
+        l_w1 = "sshd accepted port 22".split()
+        l_w2 = "sshd accepted port 23".split()
+        lt1 = ltm.process_line(l_w1, None)
+        self.assertEqual(ltm.process_line(l_w1, None).ltid, lt1.ltid)
+        self.assertEqual((ltm.cache_hit, ltm.cache_miss), (1, 1))
+        self.assertTrue(tuple(l_w1) in ltm._cache)
+
+        # template of lt1 changed: cached messages of it are invalidated
+        lt2 = ltm.process_line(l_w2, None)
+        self.assertEqual(lt2.ltw, "sshd accepted port **".split())
+        self.assertFalse(tuple(l_w1) in ltm._cache)
+        self.assertEqual(ltm.process_line(l_w1, None).ltid, lt2.ltid)
+        self.assertEqual((ltm.cache_hit, ltm.cache_miss), (1, 3))
+
+        # all cache invalidated with removed templates
+        ltm.remove_lt(lt1.ltid)
+        self.assertEqual(ltm.cache_stats()["size"], 0)
+
+        del ld
+        common.rm(path_db)
+
+    def _check_format(self, **kwargs):
+        # messages read back from DB in given format (recorded in DB)
+        # are same as those in default format
+        conf = config.open_config()
+        path_testlog = conf['general']['src_path']
+        path_db = conf['database']['sqlite3_filename']
+
+        tlg = testlog.TestLogGenerator(testlog.DEFAULT_CONFIG, seed = 3)
+        tlg.dump_log(path_testlog)
+        log_db.process_files(conf, common.rep_dir(path_testlog), True)
+        l_default = _dump_lines(conf)
+        ld = log_db.LogData(conf)
+        top_dt, end_dt = ld.whole_term()
+        mid_dt = top_dt + (end_dt - top_dt) / 2
+        host = l_default[0][2]
+        num = len(list(ld.iter_lines(top_dt = mid_dt, host = host)))
+        self.assertTrue(num > 0)
+        del ld
+
+        conf2 = config.open_config()
+        _set_db(conf2, path_db + ".fmt")
+        for key, val in kwargs.items():
+            conf2.set("database", key, val)
+        log_db.process_files(conf2, common.rep_dir(path_testlog), True)
+        _set_db(conf, path_db + ".fmt")
+        ld = log_db.LogData(conf)
+        for key, val in kwargs.items():
+            self.assertEqual(ld.db.get_metadata(key), val)
+        self.assertEqual(ld.whole_term(), (top_dt, end_dt))
+        self.assertEqual(len(list(ld.iter_lines(top_dt = mid_dt,
+                                                host = host))), num)
+        del ld
+        self.assertEqual(_dump_lines(conf), l_default)
+
+        common.rm(path_testlog)
+        common.rm(path_db)
+        common.rm(path_db + ".fmt")
+        common.rm(path_db + ".fmt.lt")
+
+    def test_dt_epoch(self):
+        self._check_format(dt_format = "epoch")
+
+    def test_host_id(self):
+        self._check_format(host_format = "id")
+
+    def test_words_variable(self):
+        self._check_format(words_store = "variable")
+        self._check_format(words_store = "variable", words_format = "binary")
+
+    def test_words_binary(self):
+        self._check_format(words_format = "binary")
+        self._check_format(words_format = "binary", words_compress = "true")
+
+        # long message compressed with zlib
+        conf = config.open_config()
+        path_db = conf['database']['sqlite3_filename'] + ".zlib"
+        _set_db(conf, path_db)
+        conf.set("database", "words_format", "binary")
+        conf.set("database", "words_compress", "true")
+        ld = log_db.LogData(conf, edit = True, reset_db = True)
+        ld.init_ltmanager()
+        lp = log_db._load_log2seq(conf)
+        ha = log_db.host_alias.HostAlias(conf)
+        line = "2112 Sep 1 00:00:00 host1 app: " + " ".join(["long"] * 100)
+        lm = log_db.process_line(line, ld, lp, ha)
+        ld.commit_db()
+        del ld
+        ld = log_db.LogData(conf)
+        data = [row[0] for row in ld.db.db.execute(
+            "select words from log where lid = {0}".format(lm.lid))][0]
+        self.assertTrue(data[0] & strutil.PACK_ZLIB)
+        self.assertTrue(len(data) < len(" ".join(lm.l_w)))
+        self.assertEqual(next(ld.iter_lines(lid = lm.lid)).l_w, lm.l_w)
+        del ld
+        common.rm(path_db)
+        common.rm(path_db + ".lt")
+
 
 if __name__ == "__main__":
     unittest.main()
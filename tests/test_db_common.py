@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import sqlite3
+import tempfile
+import itertools
+import unittest
+from unittest import mock
+
+from amulog import db_common
+
+
+class TestDBCommon(unittest.TestCase):
+
+    def test_sql_cache(self):
+        db = db_common.sqlite3(":memory:")
+        # conditions differing only in one field
+        l_cond = [db_common.cond("lid", "=", "lid"),
+                  db_common.cond("lid", "=", "lid", False),
+                  db_common.cond("lid", "<", "lid"),
+                  db_common.cond("lid", "=", "lid2"),
+                  db_common.cond("ltid", "=", "lid"),
+                  db_common.cond("lid", "in", "select lid from log", False)]
+        l_query = []
+        for conds in itertools.chain(itertools.combinations(l_cond, 1),
+                                     itertools.permutations(l_cond, 2)):
+            l_query.append(("select_sql", ("log", ["lid"], list(conds))))
+            l_query.append(("select_sql", ("log", ["lid", "ltid"],
+                                           list(conds))))
+            l_query.append(("select_sql", ("log", ["lid"], list(conds),
+                                           ["distinct"])))
+            l_query.append(("select_sql", ("lt", ["lid"], list(conds))))
+            l_query.append(("update_sql", ("log", [db_common.setstate(
+                "ltid", "ltid")], list(conds))))
+            l_query.append(("increment_sql", ("log", "ltid", "ltid",
+                                              list(conds))))
+            l_query.append(("delete_sql", ("log", list(conds))))
+        l_query.append(("insert_sql", ("log", [db_common.setstate(
+            "lid", "lid")])))
+        l_query.append(("insert_sql", ("log", [db_common.setstate(
+            "lid", "ltid")])))
+
+        # cached sql is same as the one generated without cache
+        l_sql = []
+        for _ in range(2):
+            for method, args in l_query:
+                sql = getattr(db, method)(*args)
+                fresh_db = db_common.sqlite3(":memory:")
+                self.assertEqual(sql, getattr(fresh_db, method)(*args))
+                l_sql.append(sql)
+        self.assertEqual(len(set(l_sql)), len(l_query))
+
+        # cache is cleared if exceeding the size
+        db = db_common.sqlite3(":memory:")
+        db.SQL_CACHE_SIZE = 10
+        for method, args in l_query:
+            getattr(db, method)(*args)
+            self.assertTrue(len(db._sql_cache) <= 10)
+
+    def test_sqlite3_bulk_mode(self):
+        # values of PRAGMA_NORMAL and PRAGMA_BULK as returned by sqlite
+        d_normal = {"journal_mode": "delete", "synchronous": 2,
+                    "cache_size": -2000, "mmap_size": 0, "temp_store": 0}
+        d_bulk = {"journal_mode": "memory", "synchronous": 0,
+                  "cache_size": -262144, "mmap_size": 268435456,
+                  "temp_store": 2}
+
+        def _pragma(db):
+            return {key: db.execute("pragma {0}".format(key)).fetchone()[0]
+                    for key in d_normal}
+
+        with tempfile.TemporaryDirectory() as dirname:
+            path_db = os.path.join(dirname, "test.db")
+            db = db_common.sqlite3(path_db)
+            with mock.patch.object(sqlite3, "connect",
+                                   wraps = sqlite3.connect) as m:
+                db.execute("create table log (lid integer)")
+            self.assertEqual(m.call_args[1]["cached_statements"],
+                             db.CACHED_STATEMENTS)
+            self.assertEqual(_pragma(db), d_normal)
+            db.set_bulk_mode(True)
+            self.assertEqual(_pragma(db), d_bulk)
+            db.executemany("insert into log (lid) values (:lid)",
+                           [{"lid": i} for i in range(10)])
+            db.set_bulk_mode(False)
+            self.assertEqual(_pragma(db), d_normal)
+            # data added in bulk mode is committed on switching back
+            db.rollback()
+            self.assertEqual(db.execute("select count(*) from log"
+                                        ).fetchone()[0], 10)
+            del db
+
+            # bulk mode requested before connection
+            db = db_common.sqlite3(path_db)
+            db.set_bulk_mode(True)
+            self.assertEqual(_pragma(db), d_bulk)
+            db.set_bulk_mode(False)
+            self.assertEqual(_pragma(db), d_normal)
+            del db
+
+
+if __name__ == "__main__":
+    unittest.main()
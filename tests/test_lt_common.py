@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import re
+import unittest
+
+from amulog import common
+from amulog import config
+from amulog import lt_common
+
+
+class TestIDAllocator(unittest.TestCase):
+
+    def test_reuse(self):
+        ids = common.IDAllocator()
+        for i in range(10):
+            self.assertEqual(ids.next(), i)
+            ids.add(i)
+        ids.remove(7)
+        ids.remove(3)
+        self.assertEqual(ids.next(), 3)
+        ids.add(3)
+        self.assertEqual(ids.next(), 7)
+        ids.add(7)
+        self.assertEqual(ids.next(), 10)
+
+        # restore with given ids
+        ids = common.IDAllocator()
+        for i in (5, 2, 0):
+            ids.add(i)
+        self.assertEqual([i for i in range(6) if not i in ids], [1, 3, 4])
+        self.assertEqual(ids.next(), 1)
+
+    def test_sparse(self):
+        ids = common.IDAllocator()
+        ids.add(10 ** 12)
+        ids.add(0)
+        self.assertEqual(ids.next(), 1)
+        self.assertFalse(10 ** 9 in ids)
+        ids.add(10 ** 9)
+        self.assertTrue(10 ** 9 in ids)
+        ids.remove(0)
+        ids2 = common.IDAllocator()
+        ids2.load(ids.dumpobj())
+        self.assertEqual(ids2.dumpobj(), ((10 ** 12) + 1,
+                                          [(0, 10 ** 9),
+                                           (10 ** 9 + 1, 10 ** 12)]))
+        # former dump with a list of free ids
+        ids3 = common.IDAllocator()
+        ids3.load((5, [1, 2, 4]))
+        self.assertEqual([i for i in range(6) if i in ids3], [0, 3])
+
+    def test_table_dump(self):
+        table = lt_common.TemplateTable()
+        for i in range(5):
+            self.assertEqual(table.add(["w", str(i)]), i)
+        obj = table.dumpobj()
+
+        table2 = lt_common.TemplateTable()
+        table2.load(obj)
+        self.assertEqual(table2.next_tid(), 5)
+        # former dump without allocator
+        table3 = lt_common.TemplateTable()
+        table3.load(obj[:2])
+        self.assertEqual(table3.next_tid(), 5)
+
+    def test_ltgroup_dump(self):
+        ltgroup = lt_common.LTGroup()
+        for gid in (0, 1, 3):
+            ltgroup.add_ltid(gid, lt_common.LogTemplate(
+                gid, None, ["w"], [""], 1, "**"))
+        obj = ltgroup.dumpobj()
+
+        ltgroup2 = lt_common.LTGroup()
+        ltgroup2.load(obj)
+        self.assertEqual(ltgroup2._next_groupid(), 2)
+        # former dump without allocator
+        ltgroup2.load(None)
+        self.assertEqual(ltgroup2._next_groupid(), 2)
+
+
+class TestDedup(unittest.TestCase):
+
+    def test_va_weights(self):
+        conf = config.open_config()
+        lines = [("a b {0}".format(i % 3).split(), None) for i in range(20)]
+        lines += [("a c {0}".format(i).split(), None) for i in range(5)]
+
+        l_distinct, weights, index = lt_common.dedup_lines(lines)
+        self.assertEqual(len(l_distinct), 8)
+        self.assertEqual(sum(weights), len(lines))
+
+        table1 = lt_common.TemplateTable()
+        ltgen = lt_common.init_ltgen(conf, table1, method = "va")
+        tids = ltgen.process_init_data(lines)
+        table2 = lt_common.TemplateTable()
+        ltgen = lt_common.init_ltgen(conf, table2, method = "va")
+        tids_dedup = ltgen.process_init_data(l_distinct, weights)
+        self.assertEqual([table1[tid] for tid in tids],
+                         [table2[tids_dedup[i]] for i in index])
+
+    def test_mask(self):
+        mask = re.compile(r"\d+")
+        lines = [(l_w.split(), None) for l_w in
+                 ("a 1", "a 22", "a b1", "a b2", "a 3x")]
+        l_distinct, weights, index = lt_common.dedup_lines(lines, mask, "**")
+        # only the words fully matching the mask are ignored
+        self.assertEqual(list(weights), [2, 1, 1, 1])
+        self.assertEqual(list(index), [0, 0, 1, 2, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
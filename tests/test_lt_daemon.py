@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import os
+import json
+import time
+import socket
+import asyncio
+import datetime
+import tempfile
+import threading
+import contextlib
+import unittest
+
+from amulog import common
+from amulog import config
+from amulog import testlog
+from amulog import log_db
+from amulog import lt_daemon
+
+
+@contextlib.contextmanager
+def _serve(daemon):
+    # run daemon in another thread with its own event loop
+    l_loop = []
+
+    async def _main():
+        l_loop.append(asyncio.get_running_loop())
+        await daemon.serve()
+
+    thread = threading.Thread(target = asyncio.run, args = (_main(),))
+    thread.start()
+    try:
+        for _ in range(100):
+            if os.path.exists(daemon.socket_path):
+                break
+            time.sleep(0.1)
+        yield
+    finally:
+        l_loop[0].call_soon_threadsafe(daemon.stop)
+        thread.join(10)
+        assert not thread.is_alive()
+
+
+class TestLTDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        dirname = self._tmpdir.name
+        self.conf = config.open_config()
+        self.path_testlog = self.conf['general']['src_path']
+        path_db = os.path.join(dirname, "log.db")
+        self.conf.set("database", "sqlite3_filename", path_db)
+        self.conf.set("log_template", "indata_filename", path_db + ".lt")
+        self.conf.set("lt_daemon", "socket_path",
+                      os.path.join(dirname, "lt_daemon.sock"))
+
+        tlg = testlog.TestLogGenerator(testlog.DEFAULT_CONFIG, seed = 3)
+        tlg.dump_log(self.path_testlog)
+        with open(self.path_testlog) as f:
+            self.l_line = [line.rstrip("\n") for line in f][:200]
+        log_db.process_files(self.conf, common.rep_dir(self.path_testlog),
+                             True)
+        self.new_line = ("2112-09-01 00:00:00 sw1 lt-daemon-test: "
+                         "unseen message for test")
+
+    def tearDown(self):
+        common.rm(self.path_testlog)
+        self._tmpdir.cleanup()
+
+    def test_framing(self):
+        daemon = lt_daemon.LTDaemon(self.conf, learn = False)
+        with _serve(daemon):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(daemon.socket_path)
+            with sock:
+                f = sock.makefile("rb")
+                # 4 bytes of length in big endian and JSON
+                data = json.dumps({"op" : "stats"}).encode("utf-8")
+                sock.sendall(len(data).to_bytes(4, "big") + data)
+                length = int.from_bytes(f.read(4), "big")
+                response = json.loads(f.read(length).decode("utf-8"))
+                self.assertEqual(response["requests"], 1)
+                self.assertFalse(response["learn"])
+                # invalid requests are answered with errors
+                for data in (b"{", b"[1, 2]", b'{"op": "classify"}'):
+                    sock.sendall(len(data).to_bytes(4, "big") + data)
+                    length = int.from_bytes(f.read(4), "big")
+                    response = json.loads(f.read(length).decode("utf-8"))
+                    self.assertTrue("error" in response, data)
+                # too large request closes the connection
+                sock.sendall((2 ** 32 - 1).to_bytes(4, "big"))
+                length = int.from_bytes(f.read(4), "big")
+                response = json.loads(f.read(length).decode("utf-8"))
+                self.assertEqual(response, {"error" : "too large request"})
+                self.assertEqual(f.read(), b"")
+
+            # client helper on the same protocol
+            with lt_daemon.Client(daemon.socket_path) as client:
+                with self.assertRaises(ValueError):
+                    client.request({"op" : "unknown"})
+                # requests not decoded from JSON are not counted
+                self.assertEqual(client.stats()["requests"], 5)
+
+    def test_readonly(self):
+        ld = log_db.LogData(self.conf)
+        sym = self.conf.get("log_template", "variable_symbol")
+        l_lw = [lm.l_w for lm
+                in ld.iter_lines(top_dt = datetime.datetime(1900, 1, 1))]
+        d_ltw = {lt.ltid : lt.ltw for lt in ld.iter_lt()}
+        num_lt = ld.count_lt()
+        del ld
+
+        daemon = lt_daemon.LTDaemon(self.conf, learn = False)
+        with _serve(daemon):
+            with lt_daemon.Client(daemon.socket_path) as client:
+                results = client.classify(self.l_line + [self.new_line])
+                # matched templates (not always the ones in DB
+                # because templates can overlap)
+                for d, l_w in zip(results[:-1], l_lw):
+                    ltw = d_ltw[d["ltid"]]
+                    self.assertEqual(len(ltw), len(l_w))
+                    self.assertTrue(all(w1 in (w2, sym)
+                                        for w1, w2 in zip(ltw, l_w)), l_w)
+                self.assertIsNone(results[-1])
+                ltid = results[0]["ltid"]
+                d = client.lookup([ltid, num_lt + 1])
+                self.assertEqual(d[0]["template"], results[0]["template"])
+                self.assertTrue(d[0]["count"] > 0)
+                self.assertIsNone(d[1])
+                self.assertEqual(client.stats()["miss"], 1)
+
+        # DB is not changed
+        ld = log_db.LogData(self.conf)
+        self.assertEqual(ld.count_lt(), num_lt)
+        del ld
+
+    def test_learn(self):
+        ld = log_db.LogData(self.conf)
+        num_lt = ld.count_lt()
+        del ld
+
+        daemon = lt_daemon.LTDaemon(self.conf, learn = True)
+        with _serve(daemon):
+            with lt_daemon.Client(daemon.socket_path) as client:
+                results = client.classify(self.l_line[:10] +
+                                          [self.new_line])
+                self.assertTrue(all(d is not None for d in results))
+                new_ltid = results[-1]["ltid"]
+                self.assertFalse(new_ltid in
+                                 [d["ltid"] for d in results[:-1]])
+                # committed in the request
+                ld = log_db.LogData(self.conf)
+                self.assertEqual(ld.count_lt(), num_lt + 1)
+                self.assertEqual(str(ld.lttable[new_ltid]),
+                                 results[-1]["template"])
+                del ld
+                # new template is reused in later requests
+                results = client.classify([self.new_line])
+                self.assertEqual(results[0]["ltid"], new_ltid)
+                self.assertEqual(client.lookup([new_ltid])[0]["count"], 2)
+                self.assertEqual(client.stats()["miss"], 0)
+
+        ld = log_db.LogData(self.conf)
+        self.assertEqual(ld.count_lt(), num_lt + 1)
+        self.assertEqual(ld.lttable[new_ltid].cnt, 2)
+        del ld
+
+
+if __name__ == "__main__":
+    unittest.main()
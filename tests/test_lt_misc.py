@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import random
+import pickle
+import unittest
+
+from amulog import lt_misc
+from amulog import testlog
+
+
+class TestLTMatcher(unittest.TestCase):
+
+    def test_match(self):
+        sym = "**"
+        rand = random.Random(0)
+        tlg = testlog.TestLogGenerator(testlog.DEFAULT_CONFIG, seed = 3)
+        l_mes = [mes.split() for dt, host, mes in tlg.l_log]
+
+        # overlapping templates masked from messages
+        tree = lt_misc.LTSearchTree(sym)
+        matcher = lt_misc.LTMatcher(sym)
+        for ltid, l_w in enumerate(rand.sample(l_mes, 200)):
+            ltw = [sym if rand.random() < 0.3 else w for w in l_w]
+            tree.add(ltid, ltw)
+            matcher.add(ltid, ltw)
+        matcher = pickle.loads(pickle.dumps(matcher))
+
+        cnt = 0
+        for l_w in rand.sample(l_mes, 1000):
+            if rand.random() < 0.5:
+                l_w = [w + "x" if rand.random() < 0.2 else w for w in l_w]
+            ltid = tree.search(l_w)
+            self.assertEqual(matcher.match(l_w), ltid, l_w)
+            if ltid is not None:
+                cnt += 1
+        self.assertTrue(0 < cnt < 1000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import random
+import unittest
+import numpy
+
+from amulog import lt_common
+from amulog import lt_shiso
+from amulog import testlog
+
+
+def _seq_ratio_naive(m1, m2, sym):
+    # former implementation of LTGenSHISO.seq_ratio
+
+    def c_coordinate(w):
+        l_cnt = [0.0 for i in range(26 + 26 + 2)] # A-Z, a-z, digit, symbol
+        for c in w:
+            if c.isupper():
+                ind = ord(c) - 65
+                l_cnt[ind] += 1.0
+            elif c.islower():
+                ind = ord(c) - 97
+                l_cnt[ind + 26] += 1.0
+            elif c.isdigit():
+                l_cnt[-2] += 1.0
+            else:
+                l_cnt[-1] += 1.0
+        deno = numpy.linalg.norm(l_cnt)
+        return [1.0 * e / deno for e in l_cnt]
+
+    if len(m1) == len(m2):
+        length = len(m1)
+        if length == 0:
+            return 1.0
+
+        sum_dist = 0.0
+        for w1, w2 in zip(m1, m2):
+            if w1 == sym or w2 == sym:
+                pass
+            else:
+                c_w1 = c_coordinate(w1)
+                c_w2 = c_coordinate(w2)
+                dist = sum([numpy.power(e1 - e2, 2)
+                        for e1, e2 in zip(c_w1, c_w2)])
+                sum_dist += dist
+        return 1.0 - (sum_dist / (2.0 * length))
+    else:
+        return 0.0
+
+
+def _edit_distance_naive(m1, m2, sym):
+    # former implementation of lt_shiso.edit_distance
+    table = [[0] * (len(m2) + 1) for i in range(len(m1) + 1)]
+    for i in range(len(m1) + 1):
+        table[i][0] = i
+    for j in range(len(m2) + 1):
+        table[0][j] = j
+    for i in range(1, len(m1) + 1):
+        for j in range(1, len(m2) + 1):
+            if (m1[i - 1] == m2[j - 1]) or \
+                    m1[i - 1] == sym or m2[j - 1] == sym:
+                cost = 0
+            else:
+                cost = 1
+            table[i][j] = min(table[i - 1][j] + 1, table[i][j - 1] + 1,
+                              table[i - 1][j - 1] + cost)
+    return table[-1][-1]
+
+
+class TestSHISO(unittest.TestCase):
+
+    def _messages(self):
+        tlg = testlog.TestLogGenerator(testlog.DEFAULT_CONFIG, seed = 3)
+        return [mes.split() for dt, host, mes in tlg.l_log]
+
+    def test_seq_ratio(self):
+        sym = "**"
+        ltgen = lt_shiso.LTGenSHISO(lt_common.TemplateTable(), sym, 0.9, 4)
+        rand = random.Random(0)
+        l_mes = self._messages()
+        for _ in range(1000):
+            m1, m2 = rand.sample(l_mes, 2)
+            if rand.random() < 0.5:
+                m1 = [sym if rand.random() < 0.3 else w for w in m1]
+            self.assertAlmostEqual(ltgen.seq_ratio(m1, m2),
+                                   _seq_ratio_naive(m1, m2, sym))
+
+    def test_edit_distance(self):
+        sym = "**"
+        rand = random.Random(0)
+        l_mes = self._messages()
+        for _ in range(1000):
+            m1, m2 = rand.sample(l_mes, 2)
+            m1 = [sym if rand.random() < 0.2 else w for w in m1]
+            m2 = m2[:rand.randint(0, len(m2))]
+            dist = _edit_distance_naive(m1, m2, sym)
+            self.assertEqual(lt_shiso.edit_distance(m1, m2, sym), dist)
+            max_dist = rand.randint(0, 5)
+            self.assertEqual(lt_shiso.edit_distance(m1, m2, sym, max_dist),
+                             min(dist, max_dist + 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
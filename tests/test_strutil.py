@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import random
+import unittest
+
+from amulog import strutil
+
+
+def _split_igesc_naive(string, spl):
+    # former implementation of strutil.split_igesc
+    l_esc = ["\\" + w for w in "\\" + strutil.ESC_LETTER]
+    temp_str = string
+    spl_len = len(spl)
+    temp_ww = []
+    ret = []
+    while len(temp_str) >= spl_len:
+        if temp_str[0:2] in l_esc:
+            temp_ww.append(temp_str[:2])
+            temp_str = temp_str[2:]
+        elif strutil.fmatch(temp_str, spl):
+            ret.append("".join(temp_ww))
+            temp_ww = []
+            temp_str = temp_str[len(spl):]
+        else:
+            temp_ww.append(temp_str[0])
+            temp_str = temp_str[1:]
+    else:
+        ret.append("".join(temp_ww) + temp_str)
+    return ret
+
+
+class TestStrutil(unittest.TestCase):
+
+    def test_split_igesc(self):
+        spl = "@@"
+        l_w = ["a", "b*c", "@", "\\", "x@@y", "", "**", "\\@\\"]
+        string = spl.join([strutil.add_esc(w) for w in l_w])
+        ret = [strutil.restore_esc(w)
+               for w in strutil.split_igesc(string, spl)]
+        self.assertEqual(ret, l_w)
+
+    def test_split_igesc_random(self):
+        rand = random.Random(0)
+        letters = "ab \\*@:"
+        for spl in ("@@", "@", "::", "a*"):
+            for _ in range(3000):
+                string = "".join(rand.choice(letters)
+                                 for _ in range(rand.randint(0, 20)))
+                self.assertEqual(strutil.split_igesc(string, spl),
+                                 _split_igesc_naive(string, spl),
+                                 (string, spl))
+
+    def test_pack_words(self):
+        for l_w in ([], [""], ["", ""], ["a", "\\*", "x" * 300, ""],
+                    ["a\0b", "c"], ["abc"] * 100):
+            for compress in (False, True):
+                data = strutil.pack_words(l_w, compress)
+                self.assertEqual(strutil.unpack_words(data), l_w)
+
+
+if __name__ == "__main__":
+    unittest.main()
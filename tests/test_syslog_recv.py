@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+import unittest
+from unittest import mock
+
+from amulog import common
+from amulog import config
+from amulog import testlog
+from amulog import log_db
+from amulog import syslog_recv
+
+
+class TestSyslogRecv(unittest.TestCase):
+
+    def test_syslog_to_line(self):
+        line = syslog_recv.syslog_to_line(
+            "<34>1 2020-01-02T03:04:05Z host1 sshd 123 - - accepted\n")
+        self.assertEqual(line, "2020-01-02 03:04:05 host1 sshd[123]: accepted")
+        line = syslog_recv.syslog_to_line(
+            "<13>Jan  2 03:04:05 host1 su: failed")
+        self.assertEqual(line, "Jan  2 03:04:05 host1 su: failed")
+
+    def test_failed_batch(self):
+        conf = config.open_config()
+        path_testlog = conf['general']['src_path']
+        path_db = conf['database']['sqlite3_filename']
+
+        tlg = testlog.TestLogGenerator(testlog.DEFAULT_CONFIG, seed = 3)
+        tlg.dump_log(path_testlog)
+        with open(path_testlog) as f:
+            l_line = [line.rstrip("\n") for line in f]
+        log_db.process_files(conf, common.rep_dir(path_testlog), True)
+
+        receiver = syslog_recv.SyslogReceiver(conf)
+        process_line = log_db.process_line
+        commit_db = log_db.LogData.commit_db
+
+        def _process_line(line, *args, **kwargs):
+            if line == l_line[1]:
+                raise RuntimeError("test")
+            return process_line(line, *args, **kwargs)
+
+        def _commit_db(ld):
+            raise RuntimeError("test")
+
+        def _run(l_data):
+            receiver._executor.submit(receiver._process_batch,
+                                      [line.encode() for line in l_data]
+                                      ).result()
+
+        # a failed message is skipped
+        with mock.patch.object(log_db, "process_line", _process_line):
+            _run(l_line[:3])
+        self.assertEqual((receiver.added, receiver.failed), (2, 1))
+        # a batch failed to commit is discarded
+        with mock.patch.object(log_db.LogData, "commit_db", _commit_db):
+            _run(l_line[3:6])
+        self.assertEqual((receiver.added, receiver.failed), (2, 4))
+        # later messages are still stored
+        _run(l_line[6:10])
+        self.assertEqual((receiver.added, receiver.failed), (6, 4))
+        receiver._executor.submit(receiver._close_db).result()
+        receiver._executor.shutdown()
+
+        ld = log_db.LogData(conf)
+        self.assertEqual(ld.count_lines(), len(l_line) + 6)
+        for key, cached, calc in ld.db.verify_stats():
+            self.assertEqual(cached, calc, key)
+        del ld
+
+        common.rm(path_testlog)
+        common.rm(path_db)
+
+
+if __name__ == "__main__":
+    unittest.main()